@@ -1,17 +1,155 @@
 import asyncio
 import logging
+import multiprocessing
 import os
+import secrets
+import signal
+import time
+from typing import List
+from typing import Optional
 
 from at_queue.core.session import ConnectionParameters
 
 from at_controller.core.arguments import get_args
 from at_controller.core.controller import ATController
+from at_controller.core.metrics import export_prometheus
+from at_controller.core.metrics import REGISTRY
+from at_controller.core.router import ATControllerRouter
+from at_controller.core.sessions import FileSessionStore
+from at_controller.core.sessions import SessionStore
+from at_controller.core.sessions import SqliteSessionStore
+from at_controller.core.sharding import shard_path
+from at_controller.core.sharding import worker_name
+from at_controller.core.tracing import TRACER
+from at_controller.core.tracing import TraceWriter
 
 logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# seconds the workers get to write their sessions once asked to stop, before they are killed
+WORKER_STOP_TIMEOUT = 30.0
+
+
+def get_session_store(sessions_path: Optional[str], snapshot_path: Optional[str]) -> Optional[SessionStore]:
+    if snapshot_path:
+        # sessions of the previous run are restored lazily, on their next event
+        return SqliteSessionStore(snapshot_path)
+    if sessions_path:
+        return FileSessionStore(sessions_path)
+    return None
+
+
+def stop_on_signals():
+    """Cancels the running task on the first SIGTERM or SIGINT, so its finally blocks run before the exit."""
+    loop = asyncio.get_running_loop()
+    task = asyncio.current_task()
+    stopping = []
+
+    def stop(signum: int):
+        # a terminal's Ctrl+C reaches the workers twice, from the terminal and from the router
+        if not stopping:
+            stopping.append(signum)
+            logger.info("Stopping on %s", signal.Signals(signum).name)
+            task.cancel()
+
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop, signum)
+
+
+async def serve(component, session_store: Optional[SessionStore] = None):
+    stop_on_signals()
+    try:
+        try:
+            await component.initialize()
+            await component.register()
+            await component.start()
+        finally:
+            if isinstance(component, ATController):
+                await component.flush_sessions()
+            if session_store is not None:
+                session_store.close()
+    except asyncio.CancelledError:
+        if not asyncio.current_task().uncancel():
+            # stopped by a signal, the sessions are written
+            return
+        raise
+
+
+def stop_workers(processes: List[multiprocessing.Process], timeout: float = WORKER_STOP_TIMEOUT):
+    """SIGTERMs the workers and waits for them to write their sessions, killing those that take too long."""
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        process.join(max(0.0, deadline - time.monotonic()))
+    for process in processes:
+        if process.is_alive():
+            logger.warning("Worker %s did not stop in %.0f s, killing it", process.pid, timeout)
+            process.kill()
+            process.join()
+
+
+async def run_controller(args: dict, index: int = 0, workers: int = 1):
+    session_store = get_session_store(
+        shard_path(args["sessions_path"], index, workers), shard_path(args["snapshot_path"], index, workers)
+    )
+    kwargs = {"name": worker_name(index)} if workers > 1 else {}
+    controller = ATController(
+        connection_parameters=ConnectionParameters(**args["connection"]),
+        render_window=args["render_window"],
+        max_sessions=args["max_sessions"],
+        session_store=session_store,
+        snapshot_interval=args["snapshot_interval"] if args["snapshot_path"] else None,
+        profile_expressions=args["profile_expressions"],
+        operator_tokens=args["operator_tokens"],
+        router_token=args["router_token"],
+        **kwargs,
+    )
+    trace_path = shard_path(args["trace_path"], index, workers)
+    if trace_path:
+        TRACER.configure(
+            TraceWriter(trace_path, args["trace_max_bytes"], args["trace_backups"]), args["trace_sample_rate"]
+        )
+    metrics_path = shard_path(args["metrics_path"], index, workers)
+    exporter = (
+        asyncio.create_task(export_prometheus(REGISTRY, metrics_path, args["metrics_interval"]))
+        if metrics_path
+        else None
+    )
+    try:
+        await serve(controller, session_store)
+    finally:
+        if exporter is not None:
+            exporter.cancel()
+            await asyncio.gather(exporter, return_exceptions=True)
+        TRACER.configure(None)
+
+
+def run_worker(args: dict, index: int, workers: int):
+    asyncio.run(run_controller(args, index, workers))
 
 
 async def main():
-    connection_parameters = ConnectionParameters(**get_args())
+    args = get_args()
+    options = {
+        "render_window": args.pop("render_window"),
+        "max_sessions": args.pop("max_sessions"),
+        "sessions_path": args.pop("sessions_path"),
+        "snapshot_path": args.pop("snapshot_path"),
+        "snapshot_interval": args.pop("snapshot_interval"),
+        "metrics_path": args.pop("metrics_path"),
+        "metrics_interval": args.pop("metrics_interval"),
+        "trace_path": args.pop("trace_path"),
+        "trace_sample_rate": args.pop("trace_sample_rate"),
+        "trace_max_bytes": args.pop("trace_max_bytes"),
+        "trace_backups": args.pop("trace_backups"),
+        "profile_expressions": args.pop("profile_expressions"),
+        "operator_tokens": args.pop("operator_tokens"),
+        "router_token": None,
+    }
+    workers = max(1, args.pop("workers"))
+    options["connection"] = args
 
     try:
         if not os.path.exists("/var/run/at_controller/"):
@@ -22,11 +160,28 @@ async def main():
     except PermissionError:
         pass
 
-    controller = ATController(connection_parameters=connection_parameters)
+    if workers == 1:
+        await run_controller(options)
+        return
 
-    await controller.initialize()
-    await controller.register()
-    await controller.start()
+    # every worker is a controller of its own, owning the sessions of one shard,
+    # configured by the router with a secret only the two of them know
+    options["router_token"] = secrets.token_urlsafe(32)
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=run_worker, args=(options, index, workers)) for index in range(workers)]
+    for process in processes:
+        process.start()
+    try:
+        await serve(
+            ATControllerRouter(
+                connection_parameters=ConnectionParameters(**args),
+                workers=workers,
+                operator_tokens=options["operator_tokens"],
+                router_token=options["router_token"],
+            )
+        )
+    finally:
+        await asyncio.to_thread(stop_workers, processes)
 
 
 if __name__ == "__main__":
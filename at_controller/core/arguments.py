@@ -1,9 +1,10 @@
 import argparse
 
+from at_controller.core.tracing import TRACE_BACKUPS
+from at_controller.core.tracing import TRACE_MAX_BYTES
 
-def get_args() -> dict:
-    # Argument parser setup
-    parser = argparse.ArgumentParser(prog="at-controller", description="AT-TECHNOLOGY state controller")
+
+def add_connection_arguments(parser: argparse.ArgumentParser):
     parser.add_argument("-u", "--url", help="RabbitMQ URL to connect", required=False, default=None)
     parser.add_argument(
         "-H",
@@ -44,6 +45,125 @@ def get_args() -> dict:
         default="/",
     )
 
+
+def get_args() -> dict:
+    # Argument parser setup
+    parser = argparse.ArgumentParser(prog="at-controller", description="AT-TECHNOLOGY state controller")
+    add_connection_arguments(parser)
+
+    parser.add_argument(
+        "--max-sessions",
+        type=int,
+        help="Sessions kept in memory, idle ones over the budget are spilled to the session store",
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--sessions-path",
+        help="Directory of the session store, a private temporary one is created for --max-sessions without it",
+        required=False,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--snapshot-path",
+        help="SQLite file sessions are continuously saved to and restored from after a restart",
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--snapshot-interval",
+        type=float,
+        help="Seconds between writes of changed sessions to the snapshot file",
+        required=False,
+        default=1.0,
+    )
+
+    parser.add_argument(
+        "--render-window",
+        type=float,
+        help=(
+            "Seconds a page render waits for further transitions of the session, rendering a burst once; "
+            "without it every transition renders before its call returns"
+        ),
+        required=False,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--operator-token",
+        action="append",
+        dest="operator_tokens",
+        help=(
+            "Auth token allowed to call the methods acting on the whole controller: metrics, tracing and "
+            "expression profiles; repeat for several, without any these methods are refused"
+        ),
+        required=False,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--metrics-path",
+        help="File the metrics are written to in the Prometheus text format, e.g. for a node exporter",
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--metrics-interval",
+        type=float,
+        help="Seconds between writes of the metrics file",
+        required=False,
+        default=15.0,
+    )
+
+    parser.add_argument(
+        "--trace-path",
+        help="JSON lines file spans of traced calls are written to; tracing is off without it",
+        required=False,
+        default=None,
+    )
+    parser.add_argument(
+        "--trace-sample-rate",
+        type=float,
+        help="Share of calls traced, besides those of users tracing is enabled for with enable_tracing",
+        required=False,
+        default=0.0,
+    )
+    parser.add_argument(
+        "--trace-max-bytes",
+        type=int,
+        help="Size the trace file is rotated at",
+        required=False,
+        default=TRACE_MAX_BYTES,
+    )
+    parser.add_argument(
+        "--trace-backups",
+        type=int,
+        help="Rotated trace files kept",
+        required=False,
+        default=TRACE_BACKUPS,
+    )
+
+    parser.add_argument(
+        "--profile-expressions",
+        action="store_true",
+        help="Count calls and time of every trigger condition node from the start, see enable_expression_profile",
+        required=False,
+        default=False,
+    )
+
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        help=(
+            "Controller processes sessions are sharded over by user id; "
+            "keep the number across restarts for the sessions to be found in their stores"
+        ),
+        required=False,
+        default=1,
+    )
+
     args = parser.parse_args()
     res = vars(args)
     return res
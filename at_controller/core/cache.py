@@ -0,0 +1,94 @@
+import time
+from collections import OrderedDict
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Generic
+from typing import Hashable
+from typing import Optional
+from typing import Tuple
+from typing import TypeVar
+
+V = TypeVar("V")
+
+
+class TTLCache(Generic[V]):
+    """Bounded LRU mapping whose entries expire ``ttl`` seconds after they were set.
+
+    ``set`` accepts a per-entry ttl, e.g. to remember failed lookups for a
+    shorter time. Expired entries are dropped when they are looked up or
+    pushed out by newer ones.
+    """
+
+    entries: "OrderedDict[Hashable, Tuple[float, V]]"
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+        self.invalidated = 0
+
+    def lookup(self, key: Hashable) -> Tuple[bool, Optional[V]]:
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+        expires, value = entry
+        if expires <= self.clock():
+            del self.entries[key]
+            self.expired += 1
+            self.misses += 1
+            return False, None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return True, value
+
+    def get(self, key: Hashable, default: Optional[V] = None) -> Optional[V]:
+        found, value = self.lookup(key)
+        return value if found else default
+
+    def set(self, key: Hashable, value: V, ttl: Optional[float] = None):
+        if self.max_size <= 0:
+            return
+        self.entries[key] = (self.clock() + (self.ttl if ttl is None else ttl), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evicted += 1
+
+    def invalidate(self, key: Hashable) -> bool:
+        if self.entries.pop(key, None) is None:
+            return False
+        self.invalidated += 1
+        return True
+
+    def invalidate_where(self, predicate: Callable[[Hashable, V], bool]) -> int:
+        keys = [key for key, (_, value) in self.entries.items() if predicate(key, value)]
+        for key in keys:
+            del self.entries[key]
+        self.invalidated += len(keys)
+        return len(keys)
+
+    def clear(self):
+        self.invalidated += len(self.entries)
+        self.entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "size": len(self.entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evicted": self.evicted,
+            "invalidated": self.invalidated,
+        }
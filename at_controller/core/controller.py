@@ -1,103 +1,369 @@
 import asyncio
+import hmac
+import time
 from logging import getLogger
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
 from typing import Union
 
 from at_config.core.at_config_handler import ATComponentConfig
 from at_queue.core.at_component import ATComponent
 from at_queue.core.session import ConnectionParameters
 from at_queue.utils.decorators import authorized_method
-from yaml import safe_load
 
+from at_controller.core.fsm import AttributeStore
 from at_controller.core.fsm import StateMachine
-from at_controller.diagram.models.diagram import DiagramModel
-from at_controller.diagram.state.functions import Function
+from at_controller.core.mailbox import Mailboxes
+from at_controller.core.metrics import REGISTRY
+from at_controller.core.registry import RegistrationCache
+from at_controller.core.render import RenderCache
+from at_controller.core.render import RenderScheduler
+from at_controller.core.scenarios import ScenarioCache
+from at_controller.core.sessions import FileSessionStore
+from at_controller.core.sessions import SessionLRU
+from at_controller.core.sessions import SessionSnapshot
+from at_controller.core.sessions import SessionStats
+from at_controller.core.sessions import SessionStore
+from at_controller.core.snapshots import SnapshotWriter
+from at_controller.core.tokens import OperatorTokensMixin
+from at_controller.core.tokens import TOKEN_CACHE_SIZE
+from at_controller.core.tokens import TOKEN_CACHE_TTL
+from at_controller.core.tokens import TokenCacheMixin
+from at_controller.core.tracing import bind
+from at_controller.core.tracing import current_span
+from at_controller.core.tracing import span
+from at_controller.core.tracing import TRACER
+from at_controller.diagram.state.diagram import Diagram
+from at_controller.diagram.state.profiler import check_sort
+from at_controller.diagram.state.profiler import ExpressionProfile
 from at_controller.diagram.state.transitions import EventTransition
+from at_controller.diagram.state.transitions import Transition
 
 logger = getLogger(__name__)
 
-
-class ATController(ATComponent):
+# sessions a bulk operation works on at the same time
+BULK_PARALLELISM = 32
+
+EventItem = Tuple[str, Any, Optional[dict]]
+
+# latencies include the wait in the session's mailbox, as seen by the caller
+CALL_SECONDS = REGISTRY.histogram("at_controller_call_seconds", "Calls of the controller's methods", labels=("method",))
+CALL_ERRORS = REGISTRY.counter("at_controller_call_errors_total", "Calls that raised", labels=("method",))
+RENDER_PAGE_SECONDS = REGISTRY.histogram("at_controller_render_page_seconds", "render_page calls to ATRenderer")
+RENDERS = REGISTRY.counter("at_controller_renders_total", "Pages sent or skipped as unchanged", labels=("result",))
+TRANSITIONS = REGISTRY.counter("at_controller_transitions_total", "Transitions applied")
+EVENTS = REGISTRY.counter(
+    "at_controller_events_total",
+    "Handled events by outcome: triggered a transition, matched none, ignored by the scenario",
+    labels=("outcome",),
+)
+# series of the hot paths, looked up once instead of on every call
+CALL_SERIES = {
+    method: (CALL_SECONDS.labels(method), CALL_ERRORS.labels(method))
+    for method in ("start_process", "trigger_transition", "handle_event", "handle_events")
+}
+RENDERS_SENT = RENDERS.labels("sent")
+RENDERS_SKIPPED = RENDERS.labels("skipped")
+EVENTS_IGNORED = EVENTS.labels("ignored")
+EVENTS_TRIGGERED = EVENTS.labels("triggered")
+EVENTS_UNMATCHED = EVENTS.labels("unmatched")
+
+
+def event_batch_item(item: Union[list, tuple, dict]) -> EventItem:
+    if isinstance(item, dict):
+        return item["event"], item.get("data"), item.get("frames")
+    event, data, *frames = item
+    return event, data, frames[0] if frames else None
+
+
+class ATController(TokenCacheMixin, OperatorTokensMixin, ATComponent):
     state_machines = None
     scenarios = None
-
-    def __init__(self, connection_parameters: ConnectionParameters, *args, **kwargs):
+    scenario_keys = None
+    routed_scenarios = None
+    scenario_cache: ScenarioCache = None
+    render_cache: RenderCache = None
+    render_scheduler: Optional[RenderScheduler] = None
+    mailboxes: Mailboxes = None
+    registrations: RegistrationCache = None
+    session_store: Optional[SessionStore] = None
+    max_sessions: Optional[int] = None
+    snapshot_writer: Optional[SnapshotWriter] = None
+    # secret shared with the router of a sharded controller, see configure_scenario
+    router_token: Optional[str] = None
+
+    def __init__(
+        self,
+        connection_parameters: ConnectionParameters,
+        *args,
+        token_cache_size: int = TOKEN_CACHE_SIZE,
+        token_cache_ttl: float = TOKEN_CACHE_TTL,
+        render_window: Optional[float] = None,
+        max_sessions: Optional[int] = None,
+        session_store: Optional[SessionStore] = None,
+        snapshot_interval: Optional[float] = None,
+        profile_expressions: bool = False,
+        operator_tokens: Optional[Iterable[str]] = None,
+        router_token: Optional[str] = None,
+        **kwargs,
+    ):
         super().__init__(connection_parameters=connection_parameters, *args, **kwargs)
 
+        self.router_token = router_token
         self.scenarios = {}
+        self.scenario_keys = {}
+        # scenarios of sessions configured through configure_scenario, see ATControllerRouter
+        self.routed_scenarios = {}
+        self.scenario_cache = ScenarioCache()
+        if profile_expressions:
+            self.scenario_cache.set_profile(ExpressionProfile())
+        self.render_cache = RenderCache()
+        # None renders inside the transition, before the call returns and with its errors;
+        # a window coalesces a session's bursts of transitions into one render, see RenderScheduler
+        self.render_scheduler = (
+            RenderScheduler(self._render_latest, render_window) if render_window is not None else None
+        )
+        self.mailboxes = Mailboxes()
+        self.token_cache = self.token_cache_for(token_cache_size, token_cache_ttl)
+        self.set_operator_tokens(operator_tokens)
+        self.registrations = RegistrationCache()
+
+        # idle sessions over max_sessions are spilled to the store, see _enforce_session_budget
+        if max_sessions is not None and session_store is None:
+            session_store = FileSessionStore.private()
+        self.max_sessions = max_sessions
+        self.session_store = session_store
+        self.session_lru = SessionLRU()
+        self.session_stats = SessionStats()
+        self._evicting: Dict[Any, SessionSnapshot] = {}
+        self.eviction: Optional[asyncio.Task] = None
+        # with an interval every changed session is written behind to the store, not only evicted ones
+        self.snapshot_writer = (
+            SnapshotWriter(session_store, self._snapshot, self._is_idle, snapshot_interval)
+            if session_store is not None and snapshot_interval is not None
+            else None
+        )
         self.state_machines = {}
 
+    async def check_external_registered(self, component: str, *args, **kwargs) -> bool:
+        return await self.registrations.check(component, lambda name: self._ask_registered(name, *args, **kwargs))
+
+    async def _ask_registered(self, component: str, *args, **kwargs) -> bool:
+        return await super().check_external_registered(component, *args, **kwargs)
+
+    async def exec_external_method(self, reciever: str, *args, **kwargs):
+        method = args[0] if args else kwargs.get("methode_name")
+        try:
+            with span("exec_external_method", component=reciever, method=method):
+                return await super().exec_external_method(reciever, *args, **kwargs)
+        except Exception as e:
+            if self.registrations.call_failed(reciever, e):
+                logger.info("Component %s is not registered any more", reciever)
+            raise
+
     async def perform_configurate(self, config: ATComponentConfig, auth_token: str = None, *args, **kwargs) -> bool:
-        scenario_item = config.items.get("scenario")
-        if isinstance(scenario_item.data, str):
-            diagram_dict = safe_load(scenario_item.data)
-        else:
-            diagram_dict = scenario_item.data
-        diagram_model = DiagramModel(**diagram_dict)
-        diagram = diagram_model.to_internal()
+        auth_token_or_user_id = await self.get_user_id_or_token(auth_token, raize_on_failed=False)
+        await self._configure(auth_token_or_user_id, config.items.get("scenario").data, auth_token)
+        return True
 
+    @authorized_method
+    async def configure_scenario(
+        self, scenario: Union[str, dict], router_token: str = None, auth_token: str = None
+    ) -> str:
+        """Configures the session with a scenario passed by the router instead of ATConfigurator.
+
+        Only the router calls it, with the learner's auth token and the
+        ``router_token`` the workers were started with. Without one, as
+        in a controller that is not sharded, the method is refused.
+        """
+        if (
+            self.router_token is None
+            or router_token is None
+            or not hmac.compare_digest(router_token, self.router_token)
+        ):
+            raise PermissionError("Scenarios are configured through ATConfigurator")
         auth_token_or_user_id = await self.get_user_id_or_token(auth_token, raize_on_failed=False)
+        self.routed_scenarios[auth_token_or_user_id] = scenario
+        return await self._configure(auth_token_or_user_id, scenario, auth_token)
+
+    def _scenario_of(self, auth_token_or_user_id) -> Optional[Union[str, dict]]:
+        config = self._passed_configs.get(auth_token_or_user_id)
+        if config:
+            return config.items.get("scenario").data
+        return self.routed_scenarios.get(auth_token_or_user_id)
+
+    async def _configured_scenario(self, auth_token_or_user_id) -> Optional[Union[str, dict]]:
+        """The scenario the session was configured with, in this run or, by the session store, in a previous one."""
+        scenario = self._scenario_of(auth_token_or_user_id)
+        if scenario or self.session_store is None:
+            return scenario
+        key = self.scenario_keys.get(auth_token_or_user_id)
+        if key is None:
+            snapshot = self._evicting.get(auth_token_or_user_id)
+            if snapshot is None:
+                snapshot = await asyncio.to_thread(self.session_store.load, auth_token_or_user_id)
+            key = snapshot.scenario_key if snapshot is not None else None
+        if key is None:
+            return None
+        return await asyncio.to_thread(self.session_store.load_scenario, key)
+
+    async def _configure(self, auth_token_or_user_id, scenario: Union[str, dict], auth_token: str) -> str:
+        key, diagram, compiled = self.scenario_cache.acquire(scenario)
+        if compiled:
+            await self._warm_scenario(key, diagram)
+            if self.session_store is not None:
+                await asyncio.to_thread(self._store_scenario, key, scenario)
+        previous_key = self.scenario_keys.get(auth_token_or_user_id)
         self.scenarios[auth_token_or_user_id] = diagram
+        self.scenario_keys[auth_token_or_user_id] = key
+        if previous_key is not None:
+            self.scenario_cache.release(previous_key)
 
-        await self.start_process(auth_token=auth_token)
-        return True
+        auth_token = auth_token or "default"
+        return await self.mailboxes.run(
+            auth_token_or_user_id, lambda: self._start_process(auth_token_or_user_id, auth_token)
+        )
+
+    async def _warm_scenario(self, key: str, diagram: Diagram):
+        # newly compiled scenario: ask for all its components at once instead of on the first actions
+        try:
+            await self.registrations.warm(diagram.referenced_components, self._ask_registered)
+        except Exception as e:
+            logger.warning("Could not check components of scenario %s: %s", key, e)
 
     @authorized_method
     async def reload_process(self, auth_token: str = None):
         auth_token_or_user_id = await self.get_user_id_or_token(auth_token, raize_on_failed=False)
-        config = self._passed_configs.get(auth_token_or_user_id)
-        if not config:
+        scenario = await self._configured_scenario(auth_token_or_user_id)
+        if not scenario:
             raise ValueError("No configuration found for this auth token")
-        await self.perform_configurate(config, auth_token)
-        return self.state_machines[auth_token_or_user_id].state
+        return await self._configure(auth_token_or_user_id, scenario, auth_token)
 
     @authorized_method
     async def start_process(self, auth_token: str = None) -> str:
         auth_token = auth_token or "default"
 
         auth_token_or_user_id = await self.get_user_id_or_token(auth_token, raize_on_failed=False)
+        return await self._call(
+            "start_process", auth_token_or_user_id, lambda: self._start_process(auth_token_or_user_id, auth_token)
+        )
 
-        process = StateMachine(self, auth_token=auth_token, diagram=self.scenarios.get(auth_token_or_user_id, None))
+    async def _call(self, method: str, auth_token_or_user_id, job: Callable[[], Awaitable[Any]], **attributes):
+        """Runs a call's job in the session's mailbox, timed, and traced if the session is."""
+        seconds, errors = CALL_SERIES[method]
+        started = time.perf_counter()
+        try:
+            with TRACER.trace(method, auth_token_or_user_id, **attributes):
+                return await self.mailboxes.run(auth_token_or_user_id, bind(job))
+        except Exception:
+            errors.inc()
+            raise
+        finally:
+            seconds.observe(time.perf_counter() - started)
+
+    async def _start_process(self, auth_token_or_user_id, auth_token: str) -> str:
+        diagram = await self._get_diagram(auth_token_or_user_id)
+        if diagram is None:
+            raise ValueError("No configuration found for this auth token")
+        process = StateMachine(self, auth_token=auth_token, diagram=diagram)
         self.state_machines[auth_token_or_user_id] = process
+        self._touch_session(auth_token_or_user_id)
 
         initial_state = process.diagram.get_state(process.state)
 
-        await self.exec_external_method(
-            "ATRenderer",
-            "render_page",
-            {"page": initial_state.get_page(process)},
-            auth_token=auth_token,
-        )
+        # the client may have lost its page, a new process is always rendered
+        if self.render_scheduler is not None:
+            self.render_scheduler.cancel(auth_token_or_user_id)
+        self.render_cache.forget(auth_token_or_user_id)
+        await self._render_page(auth_token_or_user_id, initial_state.get_page(process), auth_token)
 
+        self._schedule_eviction()
         return process.state
 
+    async def _render_page(self, auth_token_or_user_id, page: dict, auth_token: str) -> bool:
+        if self.render_cache.is_unchanged(auth_token_or_user_id, page):
+            logger.debug("Page for %s is unchanged, render skipped", auth_token_or_user_id)
+            RENDERS_SKIPPED.inc()
+            return False
+        started = time.perf_counter()
+        try:
+            await self.exec_external_method(
+                "ATRenderer",
+                "render_page",
+                {"page": page},
+                auth_token=auth_token,
+            )
+        except BaseException:
+            # a failed or superseded send may still have reached ATRenderer, the next page is sent whatever it is
+            self.render_cache.forget(auth_token_or_user_id)
+            raise
+        finally:
+            RENDER_PAGE_SECONDS.observe(time.perf_counter() - started)
+        RENDERS_SENT.inc()
+        self.render_cache.mark_sent(auth_token_or_user_id, page)
+        return True
+
     @authorized_method
     async def trigger_transition(
         self, trigger: str, frames: dict, event_data: dict = None, auth_token: str = None
     ) -> str:
         auth_token = auth_token or "default"
         auth_token_or_user_id = await self.get_user_id_or_token(auth_token, raize_on_failed=False)
-        process: StateMachine = self.state_machines.get(auth_token_or_user_id)
+        return await self._call(
+            "trigger_transition",
+            auth_token_or_user_id,
+            lambda: self._trigger_transition(auth_token_or_user_id, trigger, frames, event_data, auth_token),
+            trigger=trigger,
+        )
+
+    async def _trigger_transition(
+        self, auth_token_or_user_id, trigger: str, frames: dict, event_data: dict, auth_token: str
+    ) -> str:
+        process = await self._get_process(auth_token_or_user_id)
 
         if not process:
             return "No process found for this auth token"
 
-        state = process.diagram.get_state(process.state)
         transition = process.diagram.get_transition(trigger)
-        if transition.name in [t.name for t in process.diagram.get_state_exit_transitions(state)]:
-            if transition.actions:
-                await asyncio.gather(*[action.perform(process, frames, event_data) for action in transition.actions])
+        if await self._apply_transition(process, transition, frames, event_data):
+            await self._render_state(auth_token_or_user_id, process, auth_token)
 
-            process.trigger(transition.name)
+        return process.state
 
-            new_state = process.diagram.get_state(process.state)
-            await self.exec_external_method(
-                "ATRenderer",
-                "render_page",
-                {"page": new_state.get_page(process)},
-                auth_token=auth_token,
-            )
+    async def _apply_transition(
+        self, process: StateMachine, transition: Transition, frames: dict, event_data: dict
+    ) -> bool:
+        state = process.diagram.get_state(process.state)
+        if transition.name not in [t.name for t in process.diagram.get_state_exit_transitions(state)]:
+            return False
 
-        return process.state
+        if transition.actions:
+            await asyncio.gather(*[action.perform(process, frames, event_data) for action in transition.actions])
+
+        process.trigger(transition.name)
+        TRANSITIONS.inc()
+        return True
+
+    async def _render_state(self, auth_token_or_user_id, process: StateMachine, auth_token: str):
+        if self.render_scheduler is not None:
+            self.render_scheduler.schedule(auth_token_or_user_id, auth_token)
+            return
+        state = process.diagram.get_state(process.state)
+        await self._render_page(auth_token_or_user_id, state.get_page(process), auth_token)
+
+    async def _render_latest(self, auth_token_or_user_id, auth_token: str):
+        # runs outside the mailbox, the page is built from whatever state the session is in by now
+        process: StateMachine = self.state_machines.get(auth_token_or_user_id)
+        if not process:
+            return
+        state = process.diagram.get_state(process.state)
+        await self._render_page(auth_token_or_user_id, state.get_page(process), auth_token)
 
     @authorized_method
     async def handle_event(
@@ -109,35 +375,509 @@ class ATController(ATComponent):
     ):
         auth_token = auth_token or "default"
         auth_token_or_user_id = await self.get_user_id_or_token(auth_token, raize_on_failed=False)
-        process: StateMachine = self.state_machines.get(auth_token_or_user_id)
+        if self._ignores_event(auth_token_or_user_id, event):
+            EVENTS_IGNORED.inc()
+            return data
+        return await self._call(
+            "handle_event",
+            auth_token_or_user_id,
+            lambda: self._handle_event(auth_token_or_user_id, event, data, frames, auth_token),
+            event=event,
+        )
+
+    def _ignores_event(self, auth_token_or_user_id, event: str) -> bool:
+        """True for an in-memory session whose scenario has no transition and no event definition for the event."""
+        diagram = self.scenarios.get(auth_token_or_user_id)
+        if diagram is None or auth_token_or_user_id not in self.state_machines:
+            return False
+        return not diagram.handles_event(event)
+
+    async def _handle_event(
+        self,
+        auth_token_or_user_id,
+        event: str,
+        data: Union[int, float, bool, str, dict, list],
+        frames: dict,
+        auth_token: str,
+    ):
+        process = await self._get_process(auth_token_or_user_id)
 
         if not process:
             return "No process found for this auth token"
 
+        transition, checking_data = await self._select_event_transition(process, event, data, frames)
+        if transition is None:
+            return data
+
+        # already running in the session's mailbox
+        return await self._trigger_transition(
+            auth_token_or_user_id, transition.name, frames or {}, checking_data, auth_token
+        )
+
+    async def _select_event_transition(
+        self, process: StateMachine, event: str, data: Union[int, float, bool, str, dict, list], frames: dict
+    ) -> Tuple[Optional[EventTransition], Any]:
         state = process.diagram.get_state(process.state)
         diagram_event = process.diagram.get_event(event)
+        candidates = process.diagram.get_event_transitions(state, event)
 
         checking_data = data
+        if diagram_event is None and not candidates:
+            EVENTS_IGNORED.inc()
+            return None, checking_data
 
         if diagram_event:
             checking_data = await diagram_event.handle(event, process, frames, checking_data)
 
-        for transition in process.diagram.get_state_exit_transitions(state):
-            if not transition or not isinstance(transition, EventTransition) or transition.event != event:
+        for transition in candidates:
+            if not self._evaluate_condition(transition, process, frames, checking_data, data):
                 continue
 
-            if isinstance(transition.trigger_condition, Function) and not transition.trigger_condition.call(
-                process, frames, checking_data, data
-            ):
-                continue
+            logger.info("Triggering transition: state=%s, transition=%s, event=%s", state, transition.name, event)
+            EVENTS_TRIGGERED.inc()
+            return transition, checking_data
 
-            if not transition.trigger_condition:
-                continue
+        EVENTS_UNMATCHED.inc()
+        return None, checking_data
 
-            logger.info("Triggering transition: state=%s, transition=%s, event=%s", state, transition.name, event)
+    @staticmethod
+    def _evaluate_condition(
+        transition: EventTransition, process: StateMachine, frames: dict, checking_data: Any, data: Any
+    ) -> bool:
+        if current_span() is None:
+            return transition.compiled_condition(process, frames, checking_data, data)
+        with span("condition", transition=transition.name):
+            return transition.compiled_condition(process, frames, checking_data, data)
 
-            return await self.trigger_transition(
-                transition.name, frames or {}, event_data=checking_data, auth_token=auth_token
-            )
+    @authorized_method
+    async def handle_events(self, events: List[Union[list, dict]], auth_token: str = None):
+        """Applies (event, data, frames) items of one session in order and renders once at the end.
+
+        Items are lists or dicts with ``event``, ``data`` and optional
+        ``frames``. Each item gets the result handle_event would have
+        returned for it.
+        """
+        auth_token = auth_token or "default"
+        auth_token_or_user_id = await self.get_user_id_or_token(auth_token, raize_on_failed=False)
+        batch = [event_batch_item(item) for item in events]
+        return await self._call(
+            "handle_events",
+            auth_token_or_user_id,
+            lambda: self._handle_events(auth_token_or_user_id, batch, auth_token),
+            events=len(batch),
+        )
+
+    async def _handle_events(self, auth_token_or_user_id, events: List[EventItem], auth_token: str):
+        process = await self._get_process(auth_token_or_user_id)
+
+        if not process:
+            return "No process found for this auth token"
+
+        results = []
+        transitioned = False
+        try:
+            for event, data, frames in events:
+                selected, checking_data = await self._select_event_transition(process, event, data, frames)
+                if selected is None:
+                    results.append(data)
+                    continue
+                if await self._apply_transition(process, selected, frames or {}, checking_data):
+                    transitioned = True
+                results.append(process.state)
+        finally:
+            # pages of the intermediate states are never shown
+            if transitioned:
+                await self._render_state(auth_token_or_user_id, process, auth_token)
+
+        return {"state": process.state, "results": results}
+
+    @authorized_method
+    async def get_graph(self, format: str = "svg", auth_token: str = None) -> str:
+        auth_token = auth_token or "default"
+        auth_token_or_user_id = await self.get_user_id_or_token(auth_token, raize_on_failed=False)
+        process = await self.mailboxes.run(auth_token_or_user_id, lambda: self._get_process(auth_token_or_user_id))
+
+        if not process:
+            return "No process found for this auth token"
+
+        graph = self.scenario_cache.get_graph(self.scenario_keys.get(auth_token_or_user_id))
+        if graph is None:
+            return "No scenario found for this auth token"
+
+        if graph.needs_layout(format):
+            # the layout is computed once per scenario by the graphviz binary, keep it off the event loop
+            await asyncio.to_thread(graph.render, process.state, format)
+        return graph.render(process.state, format)
+
+    @authorized_method
+    async def get_metrics(self, format: str = "json", auth_token: str = None) -> Union[dict, str]:
+        """Latency histograms and counters of this process, as a dict or in the Prometheus text format.
+
+        For operators only, see OperatorTokensMixin.
+        """
+        self.check_operator(auth_token)
+        if format == "prometheus":
+            return REGISTRY.to_prometheus()
+        return REGISTRY.snapshot()
+
+    @authorized_method
+    async def enable_tracing(self, user_ids: List, auth_token: str = None) -> dict:
+        """Traces every call of these users' sessions, on top of the sampled ones, until disabled.
+
+        The tracing methods are for operators only, see OperatorTokensMixin.
+        """
+        self.check_operator(auth_token)
+        TRACER.enable(user_ids)
+        return TRACER.stats
+
+    @authorized_method
+    async def disable_tracing(self, user_ids: List = None, auth_token: str = None) -> dict:
+        """Stops tracing the users' calls, or those of every user traced by id without ``user_ids``."""
+        self.check_operator(auth_token)
+        TRACER.disable(user_ids)
+        return TRACER.stats
+
+    @authorized_method
+    async def get_tracing_stats(self, auth_token: str = None) -> dict:
+        self.check_operator(auth_token)
+        return TRACER.stats
+
+    @authorized_method
+    async def enable_expression_profile(self, reset: bool = False, auth_token: str = None) -> bool:
+        """Instruments the trigger conditions of every scenario, keeping what was profiled so far unless ``reset``.
+
+        The expression profile methods are for operators only, see OperatorTokensMixin.
+        """
+        self.check_operator(auth_token)
+        profile = self.scenario_cache.profile
+        if profile is None or reset:
+            profile = ExpressionProfile()
+        self.scenario_cache.set_profile(profile)
+        return True
+
+    @authorized_method
+    async def disable_expression_profile(self, auth_token: str = None) -> bool:
+        """Puts back the uninstrumented conditions and drops the profile."""
+        self.check_operator(auth_token)
+        enabled = self.scenario_cache.profile is not None
+        self.scenario_cache.set_profile(None)
+        return enabled
+
+    @authorized_method
+    async def get_expression_profile(
+        self, limit: Optional[int] = 20, sort: str = "self_seconds", auth_token: str = None
+    ) -> Optional[dict]:
+        """The condition nodes most time went to, None while profiling is off."""
+        self.check_operator(auth_token)
+        check_sort(sort)
+        profile = self.scenario_cache.profile
+        if profile is None:
+            return None
+        return profile.snapshot(limit, sort)
+
+    @authorized_method
+    async def get_render_stats(self, auth_token: str = None) -> dict:
+        self.check_operator(auth_token)
+        stats = dict(self.render_cache.stats)
+        if self.render_scheduler is not None:
+            stats["scheduler"] = self.render_scheduler.stats
+        return stats
 
-        return data
+    @authorized_method
+    async def get_session_metrics(self, auth_token: str = None) -> dict:
+        auth_token = auth_token or "default"
+        auth_token_or_user_id = await self.get_user_id_or_token(auth_token, raize_on_failed=False)
+        return self.mailboxes.metrics(auth_token_or_user_id) or {}
+
+    async def _select_sessions(self, user_ids: Optional[List] = None, scenario_hash: Optional[str] = None) -> List:
+        """The listed sessions, those of a scenario among them or among all, in memory or in the session store."""
+        if user_ids is None and scenario_hash is None:
+            raise ValueError("Either user_ids or scenario_hash is required")
+        if scenario_hash is None:
+            return list(dict.fromkeys(user_ids))
+
+        keys = await self._session_scenario_keys()
+        users = list(dict.fromkeys(user_ids)) if user_ids is not None else list(keys)
+        return [user for user in users if keys.get(user) == scenario_hash]
+
+    async def _session_scenario_keys(self) -> Dict[Any, Optional[str]]:
+        """The scenario key of every session, in memory or in the session store."""
+        keys = {}
+        if self.session_store is not None:
+            # evicted sessions and those of a previous run are only known to the store
+            keys = await asyncio.to_thread(self.session_store.scenario_keys)
+            keys.update((session, snapshot.scenario_key) for session, snapshot in self._evicting.items())
+        # the store may be behind the sessions in memory
+        keys.update((user, self.scenario_keys.get(user)) for user in self.state_machines)
+        return keys
+
+    @authorized_method
+    async def get_session_scenarios(self, user_ids: List = None, auth_token: str = None) -> Dict[str, Optional[str]]:
+        """Scenario keys of the listed sessions, or of every session: the ``scenario_hash`` of bulk operations.
+
+        For operators only, like the bulk operations.
+        """
+        self.check_operator(auth_token)
+        keys = await self._session_scenario_keys()
+        users = list(dict.fromkeys(user_ids)) if user_ids is not None else list(keys)
+        return {str(user): keys.get(user) for user in users}
+
+    async def _run_bulk(
+        self, users: List, operation: Callable[[Any], Awaitable[dict]], parallelism: int
+    ) -> Dict[str, dict]:
+        semaphore = asyncio.Semaphore(max(1, parallelism))
+
+        async def run(user):
+            async with semaphore:
+                try:
+                    return user, {"ok": True, **await operation(user)}
+                except Exception as e:
+                    logger.warning("Bulk operation failed for %s: %s", user, e)
+                    return user, {"ok": False, "error": str(e)}
+
+        return {str(user): summary for user, summary in await asyncio.gather(*[run(user) for user in users])}
+
+    @authorized_method
+    async def bulk_trigger_transition(
+        self,
+        trigger: str,
+        user_ids: List = None,
+        scenario_hash: str = None,
+        frames: dict = None,
+        event_data: dict = None,
+        parallelism: int = BULK_PARALLELISM,
+        auth_token: str = None,
+    ) -> Dict[str, dict]:
+        """Triggers a transition for every listed session, or every session of a scenario.
+
+        Sessions are processed concurrently, at most ``parallelism`` at a
+        time, each one inside its own mailbox and rendered with its own
+        auth token. Sessions in the session store are rehydrated first.
+        Bulk operations are for operators only, see OperatorTokensMixin;
+        get_session_scenarios tells the ``scenario_hash`` of sessions.
+        """
+        self.check_operator(auth_token)
+
+        async def trigger_transition(user):
+            process = await self._get_process(user)
+            if not process:
+                raise LookupError("No process found for this user")
+            transition = process.diagram.get_transition(trigger)
+            if transition is None:
+                raise ValueError(f"Unknown transition: {trigger}")
+            triggered = await self._apply_transition(process, transition, frames or {}, event_data)
+            if triggered:
+                await self._render_state(user, process, process.auth_token)
+            return {"state": process.state, "triggered": triggered}
+
+        users = await self._select_sessions(user_ids, scenario_hash)
+        return await self._run_bulk(
+            users, lambda user: self.mailboxes.run(user, lambda: trigger_transition(user)), parallelism
+        )
+
+    @authorized_method
+    async def bulk_reload_process(
+        self,
+        user_ids: List = None,
+        scenario_hash: str = None,
+        parallelism: int = BULK_PARALLELISM,
+        auth_token: str = None,
+    ) -> Dict[str, dict]:
+        """Reloads the scenario of every listed session, or every session of a scenario.
+
+        Sessions of a previous run are reloaded with the scenario they were
+        stored with. For operators only.
+        """
+        self.check_operator(auth_token)
+
+        async def reload_process(user):
+            scenario = await self._configured_scenario(user)
+            process = await self.mailboxes.run(user, lambda: self._get_process(user))
+            if not scenario or not process:
+                raise LookupError("No configuration found for this user")
+            return {"state": await self._configure(user, scenario, process.auth_token)}
+
+        users = await self._select_sessions(user_ids, scenario_hash)
+        return await self._run_bulk(users, reload_process, parallelism)
+
+    @authorized_method
+    async def invalidate_token_cache(self, tokens: List[str] = None, auth_token: str = None) -> int:
+        self.check_operator(auth_token)
+        if tokens is None:
+            return self.invalidate_auth_token()
+        return sum(self.invalidate_auth_token(token) for token in tokens)
+
+    @authorized_method
+    async def get_token_cache_stats(self, auth_token: str = None) -> dict:
+        self.check_operator(auth_token)
+        return self.token_cache.stats
+
+    @authorized_method
+    async def get_registration_stats(self, auth_token: str = None) -> dict:
+        self.check_operator(auth_token)
+        return self.registrations.stats
+
+    async def _get_process(self, auth_token_or_user_id) -> Optional[StateMachine]:
+        """The session's process, rehydrated from the session store if it was evicted.
+
+        Must run in the session's mailbox.
+        """
+        process: StateMachine = self.state_machines.get(auth_token_or_user_id)
+        if process is not None:
+            self._touch_session(auth_token_or_user_id)
+            return process
+        if self.session_store is None:
+            return None
+        return await self._rehydrate(auth_token_or_user_id)
+
+    async def _get_diagram(self, auth_token_or_user_id) -> Optional[Diagram]:
+        """The session's scenario, also of a session that was evicted to the session store.
+
+        Must run in the session's mailbox.
+        """
+        diagram = self.scenarios.get(auth_token_or_user_id)
+        if diagram is None and await self._get_process(auth_token_or_user_id) is not None:
+            diagram = self.scenarios.get(auth_token_or_user_id)
+        return diagram
+
+    def _touch_session(self, auth_token_or_user_id):
+        self.session_lru.touch(auth_token_or_user_id)
+        if self.snapshot_writer is not None:
+            self.snapshot_writer.mark(auth_token_or_user_id)
+
+    def _snapshot(self, auth_token_or_user_id) -> Optional[SessionSnapshot]:
+        process: StateMachine = self.state_machines.get(auth_token_or_user_id)
+        if process is None:
+            return None
+        return SessionSnapshot(
+            session=auth_token_or_user_id,
+            auth_token=process.auth_token,
+            state=process.state,
+            attributes=dict(process.attributes),
+            scenario_key=self.scenario_keys.get(auth_token_or_user_id),
+        )
+
+    async def flush_sessions(self):
+        """Writes every changed session to the store and stops the snapshot writer, e.g. on shutdown."""
+        if self.eviction is not None:
+            await self.eviction
+        if self.snapshot_writer is not None:
+            await self.snapshot_writer.close()
+
+    def _store_scenario(self, key: str, data):
+        if not self.session_store.has_scenario(key):
+            self.session_store.save_scenario(key, data)
+
+    async def _rehydrate(self, auth_token_or_user_id) -> Optional[StateMachine]:
+        started = time.perf_counter()
+        snapshot = self._evicting.get(auth_token_or_user_id)
+        if snapshot is None:
+            snapshot = await asyncio.to_thread(self.session_store.load, auth_token_or_user_id)
+        if snapshot is None:
+            self.session_stats.misses += 1
+            return None
+
+        key = snapshot.scenario_key
+        diagram = self.scenario_cache.acquire_key(key)
+        if diagram is None:
+            data = await asyncio.to_thread(self.session_store.load_scenario, key)
+            if data is None:
+                logger.warning("Scenario %s of session %s is not stored", key, auth_token_or_user_id)
+                self.session_stats.misses += 1
+                return None
+            key, diagram, compiled = self.scenario_cache.acquire(data)
+            if compiled:
+                # first session of the scenario since a restart
+                await self._warm_scenario(key, diagram)
+
+        process = StateMachine(self, auth_token=snapshot.auth_token, diagram=diagram)
+        process.state = snapshot.state
+        process.attributes = AttributeStore(snapshot.attributes)
+
+        self.state_machines[auth_token_or_user_id] = process
+        self.scenarios[auth_token_or_user_id] = diagram
+        self.scenario_keys[auth_token_or_user_id] = key
+        self._touch_session(auth_token_or_user_id)
+        self.session_stats.rehydrated(time.perf_counter() - started)
+        logger.debug("Rehydrated session %s in state %s", auth_token_or_user_id, process.state)
+
+        self._schedule_eviction()
+        return process
+
+    def _is_idle(self, auth_token_or_user_id) -> bool:
+        if not self.mailboxes.is_idle(auth_token_or_user_id):
+            return False
+        return self.render_scheduler is None or auth_token_or_user_id not in self.render_scheduler.pending
+
+    def _schedule_eviction(self):
+        """Starts evicting idle sessions over the budget unless that is under way already."""
+        if self.max_sessions is None or len(self.state_machines) <= self.max_sessions:
+            return
+        if self.eviction is None:
+            # a task of its own: the job that went over the budget does not wait for other sessions' writes
+            self.eviction = asyncio.get_running_loop().create_task(self._enforce_session_budget())
+
+    async def _enforce_session_budget(self):
+        try:
+            evicted = True
+            while evicted and len(self.state_machines) > self.max_sessions:
+                # sessions may arrive while snapshots are written, they are looked at in the next round
+                evicted = False
+                for session in self.session_lru:
+                    if len(self.state_machines) <= self.max_sessions:
+                        break
+                    if session in self.state_machines and self._is_idle(session):
+                        await self._evict(session)
+                        evicted = True
+        except Exception:
+            logger.exception("Could not enforce the session budget")
+        finally:
+            self.eviction = None
+
+    async def _evict(self, auth_token_or_user_id):
+        started = time.perf_counter()
+        snapshot = self._snapshot(auth_token_or_user_id)
+        if self.snapshot_writer is not None:
+            self.snapshot_writer.forget(auth_token_or_user_id)
+        process: StateMachine = self.state_machines.pop(auth_token_or_user_id)
+        key = self.scenario_keys.pop(auth_token_or_user_id, None)
+        diagram = self.scenarios.pop(auth_token_or_user_id, None)
+        self.session_lru.discard(auth_token_or_user_id)
+        self.render_cache.forget(auth_token_or_user_id)
+        self.mailboxes.discard(auth_token_or_user_id)
+
+        # jobs arriving while the snapshot is written rehydrate from memory
+        self._evicting[auth_token_or_user_id] = snapshot
+        try:
+            await asyncio.to_thread(self.session_store.save, snapshot)
+        except Exception:
+            logger.exception("Could not evict session %s, keeping it in memory", auth_token_or_user_id)
+            if auth_token_or_user_id not in self.state_machines:
+                self.state_machines[auth_token_or_user_id] = process
+                self.scenarios[auth_token_or_user_id] = diagram
+                self.scenario_keys[auth_token_or_user_id] = key
+                self.session_lru.touch(auth_token_or_user_id)
+            elif key is not None:
+                # rehydrated from the snapshot in the meantime, with a reference of its own
+                self.scenario_cache.release(key)
+            return
+        finally:
+            if self._evicting.get(auth_token_or_user_id) is snapshot:
+                del self._evicting[auth_token_or_user_id]
+
+        if key is not None:
+            self.scenario_cache.release(key)
+        self.session_stats.evicted(time.perf_counter() - started)
+        logger.debug("Evicted session %s in state %s", auth_token_or_user_id, process.state)
+
+    @authorized_method
+    async def get_session_store_stats(self, auth_token: str = None) -> dict:
+        self.check_operator(auth_token)
+        stats = {
+            "sessions": len(self.state_machines),
+            "max_sessions": self.max_sessions,
+            **self.session_stats.as_dict(),
+        }
+        if self.snapshot_writer is not None:
+            stats["snapshots"] = self.snapshot_writer.stats
+        return stats
@@ -1,11 +1,13 @@
+from itertools import count
 from typing import Any
 from typing import Dict
+from typing import Iterable
+from typing import Optional
+from typing import Tuple
 from typing import TYPE_CHECKING
 
-from at_queue.core.at_component import ATComponent
-from transitions.extensions import GraphMachine
-
 if TYPE_CHECKING:
+    from at_queue.core.at_component import ATComponent
     from at_controller.diagram.state.diagram import Diagram
 
 
@@ -14,18 +16,124 @@ class SafeDict(dict):
         return "{" + key + "}"
 
 
+# shared by every store, so a version is never reused after a key is deleted and set again
+_clock = count(1)
+
+
+class AttributeStore(SafeDict):
+    """Session attributes that record a version for every write.
+
+    A key's version changes whenever it is assigned, updated or deleted; a
+    key that was never written has version 0. Values mutated in place are
+    not seen, so caches keyed by versions must only hold immutable values.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self.versions: Dict[str, int] = {}
+        self.update(*args, **kwargs)
+
+    def version(self, key: str) -> int:
+        return self.versions.get(key, 0)
+
+    def versions_of(self, keys: Iterable[str]) -> Tuple[int, ...]:
+        versions = self.versions
+        return tuple(versions.get(key, 0) for key in keys)
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.versions[key] = next(_clock)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.versions[key] = next(_clock)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return dict.__getitem__(self, key)
+
+    def pop(self, key, *default):
+        if key in self:
+            self.versions[key] = next(_clock)
+        return super().pop(key, *default)
+
+    def popitem(self):
+        key, value = super().popitem()
+        self.versions[key] = next(_clock)
+        return key, value
+
+    def clear(self):
+        for key in self:
+            self.versions[key] = next(_clock)
+        super().clear()
+
+
+class MachineError(Exception):
+    pass
+
+
+class TransitionTable:
+    """Trigger -> source -> dest moves of a diagram, compiled once and shared by all its sessions."""
+
+    states: frozenset
+    initial: Optional[str]
+    moves: Dict[str, Dict[str, str]]
+
+    def __init__(self, states: Iterable[str], transitions: Iterable[Dict[str, str]], initial: Optional[str] = None):
+        self.states = frozenset(states)
+        self.initial = initial
+        self.moves = {}
+        for transition in transitions:
+            # the first transition declared for a trigger and source wins, like in transitions.Machine
+            self.moves.setdefault(transition["trigger"], {}).setdefault(transition["source"], transition["dest"])
+
+    @classmethod
+    def from_annotation(cls, annotation: Dict[str, Any]) -> "TransitionTable":
+        return cls(annotation["states"], annotation["transitions"], annotation.get("initial"))
+
+    def next_state(self, trigger: str, source: str) -> str:
+        sources = self.moves.get(trigger)
+        if sources is None:
+            raise AttributeError(f"Do not know event named '{trigger}'.")
+        dest = sources.get(source)
+        if dest is None:
+            raise MachineError(f"Can't trigger event {trigger} from state {source}!")
+        return dest
+
+    def may_trigger(self, trigger: str, source: str) -> bool:
+        return source in self.moves.get(trigger, ())
+
+
 class StateMachine(object):
-    component: ATComponent
+    __slots__ = ("component", "auth_token", "attributes", "diagram", "state", "columns")
+
+    component: "ATComponent"
     auth_token: str
-    attributes: Dict[str, Any]
+    attributes: AttributeStore
     diagram: "Diagram"
+    state: Optional[str]
+    # id(frame) -> (versions of the attributes it reads, column); see Frame.get_column
+    columns: Dict[int, Tuple[Tuple[int, ...], Dict[str, Any]]]
 
     def __init__(self, component: "ATComponent", auth_token: "str", diagram: "Diagram"):
         self.component = component
         self.auth_token = auth_token
-        self.attributes = SafeDict()
+        self.attributes = AttributeStore()
         self.attributes["auth_token"] = auth_token
         self.diagram = diagram
         self.attributes.update(diagram.initial_attributes or {})
 
-        self.translated_machine = GraphMachine(model=self, **diagram.annotation)
+        self.state = diagram.transition_table.initial
+        self.columns = {}
+
+    def trigger(self, trigger: str) -> bool:
+        self.state = self.diagram.transition_table.next_state(trigger, self.state)
+        return True
+
+    def may_trigger(self, trigger: str) -> bool:
+        return self.diagram.transition_table.may_trigger(trigger, self.state)
@@ -0,0 +1,100 @@
+from logging import getLogger
+from typing import Dict
+from typing import Literal
+from typing import Optional
+from typing import Tuple
+from typing import TYPE_CHECKING
+
+import graphviz
+from graphviz.quoting import quote
+
+if TYPE_CHECKING:
+    from at_controller.diagram.state.diagram import Diagram
+
+logger = getLogger(__name__)
+
+GraphFormat = Literal["svg", "dot"]
+
+HIGHLIGHT_COLOR = "#91d5ff"
+
+
+class ScenarioGraph:
+    """Drawing of a compiled diagram.
+
+    The DOT source and the SVG layout are produced once per scenario; a
+    request only splices the current state's highlight into the cached text.
+    """
+
+    diagram: "Diagram"
+
+    def __init__(self, diagram: "Diagram", highlight_color: str = HIGHLIGHT_COLOR):
+        self.diagram = diagram
+        self.highlight_color = highlight_color
+        self.node_ids = {state.name: f"node_{i}" for i, state in enumerate(diagram.states)}
+
+        self._dot: Optional[str] = None
+        self._svg: Optional[str] = None
+        self._svg_fills: Dict[str, Tuple[int, int]] = {}
+
+    @property
+    def dot(self) -> str:
+        if self._dot is None:
+            graph = graphviz.Digraph(name="scenario")
+            graph.attr(rankdir="LR")
+            graph.attr("node", shape="box", style="rounded")
+            for state in self.diagram.states:
+                graph.node(
+                    state.name,
+                    id=self.node_ids[state.name],
+                    peripheries="2" if state.initial else "1",
+                )
+            for transition in self.diagram.transitions:
+                annotation = transition.annotation
+                graph.edge(annotation["source"], annotation["dest"], label=transition.name)
+            self._dot = graph.source
+        return self._dot
+
+    @property
+    def svg(self) -> str:
+        if self._svg is None:
+            svg = graphviz.Source(self.dot).pipe(format="svg", encoding="utf-8")
+            self._svg_fills = self._find_fills(svg)
+            self._svg = svg
+        return self._svg
+
+    def _find_fills(self, svg: str) -> Dict[str, Tuple[int, int]]:
+        fills = {}
+        for name, node_id in self.node_ids.items():
+            group = svg.find(f'<g id="{node_id}" class="node">')
+            if group < 0:
+                continue
+            start = svg.find('fill="none"', group, svg.find("</g>", group))
+            if start >= 0:
+                fills[name] = (start, start + len('fill="none"'))
+        return fills
+
+    def needs_layout(self, format: GraphFormat = "svg") -> bool:
+        return format == "svg" and self._svg is None
+
+    def render(self, state: Optional[str] = None, format: GraphFormat = "svg") -> str:
+        if format == "dot":
+            return self.highlight_dot(state)
+        if format == "svg":
+            return self.highlight_svg(state)
+        raise ValueError(f"Unsupported graph format: {format}")
+
+    def highlight_dot(self, state: Optional[str]) -> str:
+        dot = self.dot
+        if state not in self.node_ids:
+            return dot
+        end = dot.rindex("}")
+        highlight = f'\t{quote(state)} [style="rounded,filled" fillcolor="{self.highlight_color}"]\n'
+        return dot[:end] + highlight + dot[end:]
+
+    def highlight_svg(self, state: Optional[str]) -> str:
+        svg = self.svg
+        span = self._svg_fills.get(state)
+        if span is None:
+            return svg
+        start, end = span
+        return svg[:start] + f'fill="{self.highlight_color}"' + svg[end:]
@@ -0,0 +1,149 @@
+import asyncio
+from collections import deque
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Deque
+from typing import Dict
+from typing import Hashable
+from typing import Optional
+from typing import Tuple
+from typing import TypeVar
+
+T = TypeVar("T")
+
+Job = Callable[[], Awaitable[Any]]
+
+
+class SessionMailbox:
+    """Runs the jobs of one session one at a time, in the order they were submitted.
+
+    A worker task is started when a job arrives at an empty mailbox and exits
+    once the queue is drained, so idle sessions cost no task. Jobs of
+    different mailboxes run concurrently on the event loop. A job must not
+    wait for another job of its own mailbox, that would never complete.
+    """
+
+    session: Hashable
+    queue: Deque[Tuple[Job, asyncio.Future, float]]
+
+    def __init__(self, session: Hashable):
+        self.session = session
+        self.queue = deque()
+        self.worker: Optional[asyncio.Task] = None
+        self.running = False
+
+        self.processed = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.last_wait = 0.0
+
+    @property
+    def depth(self) -> int:
+        """Jobs waiting, including the one being run."""
+        return len(self.queue) + self.running
+
+    @property
+    def idle(self) -> bool:
+        return not self.queue and not self.running
+
+    def submit(self, job: Callable[[], Awaitable[T]]) -> "asyncio.Future[T]":
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.queue.append((job, future, loop.time()))
+        self.max_depth = max(self.max_depth, self.depth)
+        if self.worker is None:
+            self.worker = loop.create_task(self._work())
+        return future
+
+    async def run(self, job: Callable[[], Awaitable[T]]) -> T:
+        return await self.submit(job)
+
+    async def _work(self):
+        loop = asyncio.get_running_loop()
+        try:
+            while self.queue:
+                job, future, submitted = self.queue.popleft()
+                if future.cancelled():
+                    continue
+                wait = loop.time() - submitted
+                self.last_wait = wait
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+
+                self.running = True
+                try:
+                    result = await job()
+                except Exception as e:
+                    self.failed += 1
+                    if not future.done():
+                        future.set_exception(e)
+                except asyncio.CancelledError:
+                    if asyncio.current_task().cancelling():
+                        # the worker itself is cancelled, the rest of the queue is cancelled below
+                        raise
+                    # the job was cancelled from within, the next ones still run
+                else:
+                    if not future.done():
+                        future.set_result(result)
+                finally:
+                    self.running = False
+                    self.processed += 1
+                    # a job ended by a cancellation or a BaseException leaves no caller waiting
+                    if not future.done():
+                        self.failed += 1
+                        future.cancel()
+        finally:
+            self.worker = None
+            # jobs left behind by a cancelled worker are failed rather than lost
+            while self.queue:
+                _, future, _ = self.queue.popleft()
+                if not future.done():
+                    future.cancel()
+
+    @property
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "depth": self.depth,
+            "max_depth": self.max_depth,
+            "processed": self.processed,
+            "failed": self.failed,
+            "last_wait": self.last_wait,
+            "max_wait": self.max_wait,
+            "avg_wait": self.total_wait / self.processed if self.processed else 0.0,
+        }
+
+
+class Mailboxes:
+    """Mailbox of every session, created on first use."""
+
+    mailboxes: Dict[Hashable, SessionMailbox]
+
+    def __init__(self):
+        self.mailboxes = {}
+
+    def get(self, session: Hashable) -> SessionMailbox:
+        mailbox = self.mailboxes.get(session)
+        if mailbox is None:
+            mailbox = self.mailboxes[session] = SessionMailbox(session)
+        return mailbox
+
+    async def run(self, session: Hashable, job: Callable[[], Awaitable[T]]) -> T:
+        return await self.get(session).run(job)
+
+    def is_idle(self, session: Hashable) -> bool:
+        mailbox = self.mailboxes.get(session)
+        return mailbox is None or mailbox.idle
+
+    def discard(self, session: Hashable) -> bool:
+        """Drops the mailbox of a session if nothing is queued in it."""
+        if not self.is_idle(session):
+            return False
+        self.mailboxes.pop(session, None)
+        return True
+
+    def metrics(self, session: Hashable) -> Optional[Dict[str, Any]]:
+        mailbox = self.mailboxes.get(session)
+        return mailbox.metrics if mailbox is not None else None
@@ -0,0 +1,215 @@
+import asyncio
+import os
+from bisect import bisect_left
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Tuple
+from typing import Union
+
+# paths run many times per call, like actions, time one in this many runs and count all of them
+TIMING_SAMPLE = 16
+
+# upper bounds in seconds, from a quick attribute write to a slow external component
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class Histogram:
+    """Counts of observations per fixed bucket; ``counts[-1]`` holds those above the last bound."""
+
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def reset(self):
+        self.counts[:] = [0] * len(self.counts)
+        self.sum = 0.0
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def cumulative(self) -> List[Tuple[float, int]]:
+        total = 0
+        result = []
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            result.append((bound, total))
+        return result
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": {format_bound(bound): count for bound, count in self.cumulative()},
+        }
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: int = 1) -> int:
+        """Adds to the counter and returns the new value, for callers that sample every n-th run."""
+        self.value += amount
+        return self.value
+
+    def reset(self):
+        self.value = 0
+
+    def snapshot(self) -> int:
+        return self.value
+
+
+Metric = Union[Histogram, Counter]
+
+
+class Family:
+    """Every series of one metric, one per combination of label values."""
+
+    def __init__(self, name: str, kind: str, help: str, labelnames: Tuple[str, ...], factory: Callable[[], Metric]):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.labelnames = labelnames
+        self.factory = factory
+        self.series: Dict[Tuple[str, ...], Metric] = {}
+
+    def labels(self, *values: str) -> Metric:
+        series = self.series.get(values)
+        if series is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} has labels {self.labelnames}, got {values}")
+            series = self.series[values] = self.factory()
+        return series
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [
+            {"labels": dict(zip(self.labelnames, values)), "value": series.snapshot()}
+            for values, series in self.series.items()
+        ]
+
+
+class MetricsRegistry:
+    """Histograms and counters of the process.
+
+    Metrics are plain Python objects updated in place: an observation is a
+    bisect and three additions, cheap enough for every call on the hot
+    paths. Metrics without labels are returned as the metric itself, with
+    labels as a Family to pick the series from with ``labels``. Hot paths
+    look a series up once and keep it, at module level or on the object.
+    """
+
+    families: Dict[str, Family]
+
+    def __init__(self):
+        self.families = {}
+
+    def _family(self, name: str, kind: str, help: str, labels: Tuple[str, ...], factory) -> Family:
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = Family(name, kind, help, tuple(labels), factory)
+        elif family.kind != kind or family.labelnames != tuple(labels):
+            raise ValueError(f"Metric {name} is already registered as a {family.kind} with labels {family.labelnames}")
+        return family
+
+    def histogram(
+        self, name: str, help: str = "", labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS
+    ) -> Union[Histogram, Family]:
+        family = self._family(name, "histogram", help, labels, lambda: Histogram(buckets))
+        return family if labels else family.labels()
+
+    def counter(self, name: str, help: str = "", labels: Tuple[str, ...] = ()) -> Union[Counter, Family]:
+        family = self._family(name, "counter", help, labels, Counter)
+        return family if labels else family.labels()
+
+    def reset(self):
+        """Drops every observation; series are zeroed in place, handles kept by callers stay registered."""
+        for family in self.families.values():
+            for series in family.series.values():
+                series.reset()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            name: {"type": family.kind, "help": family.help, "series": family.snapshot()}
+            for name, family in sorted(self.families.items())
+        }
+
+    def to_prometheus(self) -> str:
+        """The metrics in the Prometheus text exposition format."""
+        lines = []
+        for name, family in sorted(self.families.items()):
+            lines.append(f"# HELP {name} {family.help}")
+            lines.append(f"# TYPE {name} {family.kind}")
+            for values, series in family.series.items():
+                labels = list(zip(family.labelnames, values))
+                if isinstance(series, Counter):
+                    lines.append(f"{name}{format_labels(labels)} {series.value}")
+                    continue
+                for bound, count in series.cumulative():
+                    lines.append(f"{name}_bucket{format_labels(labels + [('le', format_bound(bound))])} {count}")
+                lines.append(f"{name}_sum{format_labels(labels)} {series.sum!r}")
+                lines.append(f"{name}_count{format_labels(labels)} {series.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str):
+        """Replaces the file atomically, a node exporter textfile collector never reads half of it."""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as f:
+            f.write(self.to_prometheus())
+        os.replace(temporary, path)
+
+
+def format_bound(bound: float) -> str:
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+def format_labels(labels: List[Tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')) for name, value in labels
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+
+async def export_prometheus(registry: "MetricsRegistry", path: str, interval: float):
+    """Rewrites the Prometheus file every ``interval`` seconds until cancelled, and once more then."""
+    try:
+        while True:
+            registry.write_prometheus(path)
+            await asyncio.sleep(interval)
+    finally:
+        registry.write_prometheus(path)
+
+
+REGISTRY = MetricsRegistry()
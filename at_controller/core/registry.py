@@ -0,0 +1,57 @@
+import asyncio
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+
+from at_controller.core.cache import TTLCache
+
+# check_external_registered answers, see ATController.check_external_registered
+REGISTERED_TTL = 60.0
+UNREGISTERED_TTL = 5.0
+
+RegistrationCheck = Callable[[str], Awaitable[bool]]
+
+
+class RegistrationCache:
+    """Answers of check_external_registered kept for a TTL.
+
+    A component that was not registered is asked again after a shorter
+    time, and a registered one is forgotten as soon as a call to it fails
+    because it is not registered any more.
+    """
+
+    def __init__(self, ttl: float = REGISTERED_TTL, unregistered_ttl: float = UNREGISTERED_TTL, max_size: int = 1024):
+        self.cache = TTLCache(max_size=max_size, ttl=ttl)
+        self.unregistered_ttl = unregistered_ttl
+        self.checks = 0
+
+    async def check(self, component: str, check: RegistrationCheck) -> bool:
+        if not isinstance(component, str):
+            return await check(component)
+        found, registered = self.cache.lookup(component)
+        if found:
+            return registered
+        self.checks += 1
+        registered = await check(component)
+        self.cache.set(component, registered, ttl=None if registered else self.unregistered_ttl)
+        return registered
+
+    async def warm(self, components: Iterable[str], check: RegistrationCheck) -> Dict[str, bool]:
+        components = sorted(set(components))
+        registered = await asyncio.gather(*[self.check(component, check) for component in components])
+        return dict(zip(components, registered))
+
+    def invalidate(self, component: str) -> bool:
+        return self.cache.invalidate(component)
+
+    def call_failed(self, component: str, error: BaseException) -> bool:
+        """Forgets the component if the error says it is not registered."""
+        if isinstance(component, str) and "not registered" in str(error).lower():
+            return self.invalidate(component)
+        return False
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {**self.cache.stats, "checks": self.checks}
@@ -0,0 +1,121 @@
+import asyncio
+from logging import getLogger
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Dict
+from typing import Hashable
+
+logger = getLogger(__name__)
+
+Page = Dict[str, Any]
+
+# seconds a render waits for newer transitions of the same session
+RENDER_WINDOW = 0.005
+
+
+class RenderCache:
+    """Last page sent to ATRenderer for every session.
+
+    The stored page is its own fingerprint: header, handlers, footer and
+    control are the state's shared skeleton objects, so comparing with the
+    next page short-circuits on identity and only the grid columns are
+    compared by value. Pages are never mutated once built.
+    """
+
+    pages: Dict[Hashable, Page]
+
+    def __init__(self):
+        self.pages = {}
+        self.sent = 0
+        self.skipped = 0
+
+    def is_unchanged(self, session: Hashable, page: Page) -> bool:
+        last = self.pages.get(session)
+        if last is not None and (last is page or last == page):
+            self.skipped += 1
+            return True
+        return False
+
+    def mark_sent(self, session: Hashable, page: Page):
+        """Records a page once ATRenderer has accepted it."""
+        self.pages[session] = page
+        self.sent += 1
+
+    def forget(self, session: Hashable):
+        self.pages.pop(session, None)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self.pages),
+            "sent": self.sent,
+            "skipped": self.skipped,
+        }
+
+
+class RenderScheduler:
+    """Debounces page renders of every session.
+
+    ``schedule`` starts a render ``window`` seconds later; a session scheduled
+    again before that - or while its render is still being sent - cancels
+    the superseded one, so a burst of transitions ends in a single render of
+    the latest state. ``render`` builds the page only when it runs. Errors of
+    a render are logged, nobody awaits it.
+    """
+
+    pending: Dict[Hashable, asyncio.Task]
+
+    def __init__(self, render: Callable[..., Awaitable[Any]], window: float = RENDER_WINDOW):
+        self.render = render
+        self.window = window
+        self.pending = {}
+
+        self.scheduled = 0
+        self.superseded = 0
+        self.rendered = 0
+        self.failed = 0
+
+    def schedule(self, session: Hashable, *args):
+        self.scheduled += 1
+        if self.cancel(session):
+            self.superseded += 1
+        self.pending[session] = asyncio.get_running_loop().create_task(self._render_later(session, *args))
+
+    def cancel(self, session: Hashable) -> bool:
+        task = self.pending.pop(session, None)
+        if task is None or task.done():
+            return False
+        task.cancel()
+        return True
+
+    async def _render_later(self, session: Hashable, *args):
+        try:
+            if self.window > 0:
+                await asyncio.sleep(self.window)
+            await self.render(session, *args)
+            self.rendered += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.failed += 1
+            logger.exception("Render for %s failed", session)
+        finally:
+            if self.pending.get(session) is asyncio.current_task():
+                del self.pending[session]
+
+    async def flush(self):
+        """Waits for the renders scheduled so far."""
+        tasks = list(self.pending.values())
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": len(self.pending),
+            "scheduled": self.scheduled,
+            "superseded": self.superseded,
+            "rendered": self.rendered,
+            "failed": self.failed,
+        }
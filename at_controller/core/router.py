@@ -0,0 +1,247 @@
+import asyncio
+from logging import getLogger
+from typing import Any
+from typing import Dict
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Union
+
+from at_config.core.at_config_handler import ATComponentConfig
+from at_queue.core.at_component import ATComponent
+from at_queue.core.session import ConnectionParameters
+from at_queue.utils.decorators import authorized_method
+
+from at_controller.core.controller import BULK_PARALLELISM
+from at_controller.core.sharding import partition
+from at_controller.core.sharding import ROUTER_NAME
+from at_controller.core.sharding import shard_of
+from at_controller.core.sharding import worker_name
+from at_controller.core.tokens import OperatorTokensMixin
+from at_controller.core.tokens import TOKEN_CACHE_SIZE
+from at_controller.core.tokens import TOKEN_CACHE_TTL
+from at_controller.core.tokens import TokenCacheMixin
+from at_controller.diagram.state.profiler import check_sort
+
+logger = getLogger(__name__)
+
+
+class ATControllerRouter(TokenCacheMixin, OperatorTokensMixin, ATComponent):
+    """Registers as ATController and forwards every call to the worker owning the session.
+
+    Workers are ATController processes registered as ``ATController_<i>``;
+    a session belongs to worker ``shard_of(user id, workers)``. Calls about
+    one session are forwarded with the caller's auth token, so the worker
+    authorizes them as before. Bulk operations and stats are split among
+    or gathered from all workers.
+    """
+
+    workers: int = 1
+    router_token: Optional[str] = None
+
+    def __init__(
+        self,
+        connection_parameters: ConnectionParameters,
+        *args,
+        workers: int = 1,
+        token_cache_size: int = TOKEN_CACHE_SIZE,
+        token_cache_ttl: float = TOKEN_CACHE_TTL,
+        operator_tokens: Optional[Iterable[str]] = None,
+        router_token: Optional[str] = None,
+        **kwargs,
+    ):
+        kwargs.setdefault("name", ROUTER_NAME)
+        super().__init__(connection_parameters=connection_parameters, *args, **kwargs)
+        self.workers = workers
+        self.token_cache = self.token_cache_for(token_cache_size, token_cache_ttl)
+        self.set_operator_tokens(operator_tokens)
+        # shared with the workers, their configure_scenario accepts only calls carrying it
+        self.router_token = router_token
+
+    async def _worker_of(self, auth_token: str) -> str:
+        auth_token_or_user_id = await self.get_user_id_or_token(auth_token, raize_on_failed=False)
+        return worker_name(shard_of(auth_token_or_user_id, self.workers))
+
+    async def _forward(self, method: str, method_args: Dict[str, Any], auth_token: str = None):
+        auth_token = auth_token or "default"
+        worker = await self._worker_of(auth_token)
+        return await self.exec_external_method(worker, method, method_args, auth_token=auth_token)
+
+    async def _broadcast(self, method: str, method_args: Dict[str, Any], auth_token: str = None) -> Dict[str, Any]:
+        workers = [worker_name(index) for index in range(self.workers)]
+        results = await asyncio.gather(
+            *[self.exec_external_method(worker, method, method_args, auth_token=auth_token) for worker in workers]
+        )
+        return dict(zip(workers, results))
+
+    async def perform_configurate(self, config: ATComponentConfig, auth_token: str = None, *args, **kwargs) -> bool:
+        method_args = {"scenario": config.items.get("scenario").data, "router_token": self.router_token}
+        await self._forward("configure_scenario", method_args, auth_token)
+        return True
+
+    @authorized_method
+    async def reload_process(self, auth_token: str = None):
+        return await self._forward("reload_process", {}, auth_token)
+
+    @authorized_method
+    async def start_process(self, auth_token: str = None) -> str:
+        return await self._forward("start_process", {}, auth_token)
+
+    @authorized_method
+    async def trigger_transition(
+        self, trigger: str, frames: dict, event_data: dict = None, auth_token: str = None
+    ) -> str:
+        return await self._forward(
+            "trigger_transition", {"trigger": trigger, "frames": frames, "event_data": event_data}, auth_token
+        )
+
+    @authorized_method
+    async def handle_event(
+        self,
+        event: str,
+        data: Union[int, float, bool, str, dict, list],
+        frames: dict = None,
+        auth_token: str = None,
+    ):
+        return await self._forward("handle_event", {"event": event, "data": data, "frames": frames}, auth_token)
+
+    @authorized_method
+    async def handle_events(self, events: List[Union[list, dict]], auth_token: str = None):
+        return await self._forward("handle_events", {"events": events}, auth_token)
+
+    @authorized_method
+    async def get_graph(self, format: str = "svg", auth_token: str = None) -> str:
+        return await self._forward("get_graph", {"format": format}, auth_token)
+
+    @authorized_method
+    async def get_session_metrics(self, auth_token: str = None) -> dict:
+        return await self._forward("get_session_metrics", {}, auth_token)
+
+    async def _bulk(self, method: str, method_args: Dict[str, Any], user_ids: List, auth_token: str) -> Dict[str, dict]:
+        if user_ids is None:
+            # sessions of a scenario may be on every worker
+            shards = {index: None for index in range(self.workers)}
+        else:
+            shards = partition(dict.fromkeys(user_ids), self.workers)
+        results = await asyncio.gather(
+            *[
+                self.exec_external_method(
+                    worker_name(index), method, {**method_args, "user_ids": users}, auth_token=auth_token
+                )
+                for index, users in shards.items()
+            ]
+        )
+        merged = {}
+        for result in results:
+            merged.update(result)
+        return merged
+
+    @authorized_method
+    async def bulk_trigger_transition(
+        self,
+        trigger: str,
+        user_ids: List = None,
+        scenario_hash: str = None,
+        frames: dict = None,
+        event_data: dict = None,
+        parallelism: int = BULK_PARALLELISM,
+        auth_token: str = None,
+    ) -> Dict[str, dict]:
+        self.check_operator(auth_token)
+        if user_ids is None and scenario_hash is None:
+            raise ValueError("Either user_ids or scenario_hash is required")
+        method_args = {
+            "trigger": trigger,
+            "scenario_hash": scenario_hash,
+            "frames": frames,
+            "event_data": event_data,
+            "parallelism": parallelism,
+        }
+        return await self._bulk("bulk_trigger_transition", method_args, user_ids, auth_token)
+
+    @authorized_method
+    async def bulk_reload_process(
+        self,
+        user_ids: List = None,
+        scenario_hash: str = None,
+        parallelism: int = BULK_PARALLELISM,
+        auth_token: str = None,
+    ) -> Dict[str, dict]:
+        self.check_operator(auth_token)
+        if user_ids is None and scenario_hash is None:
+            raise ValueError("Either user_ids or scenario_hash is required")
+        method_args = {"scenario_hash": scenario_hash, "parallelism": parallelism}
+        return await self._bulk("bulk_reload_process", method_args, user_ids, auth_token)
+
+    @authorized_method
+    async def get_session_scenarios(self, user_ids: List = None, auth_token: str = None) -> Dict[str, Optional[str]]:
+        self.check_operator(auth_token)
+        return await self._bulk("get_session_scenarios", {}, user_ids, auth_token)
+
+    @authorized_method
+    async def invalidate_token_cache(self, tokens: List[str] = None, auth_token: str = None) -> int:
+        self.check_operator(auth_token)
+        if tokens is None:
+            count = self.invalidate_auth_token()
+        else:
+            count = sum(self.invalidate_auth_token(token) for token in tokens)
+        await self._broadcast("invalidate_token_cache", {"tokens": tokens}, auth_token)
+        return count
+
+    @authorized_method
+    async def get_token_cache_stats(self, auth_token: str = None) -> dict:
+        self.check_operator(auth_token)
+        return {ROUTER_NAME: self.token_cache.stats, **await self._broadcast("get_token_cache_stats", {}, auth_token)}
+
+    @authorized_method
+    async def get_metrics(self, format: str = "json", auth_token: str = None) -> dict:
+        self.check_operator(auth_token)
+        return await self._broadcast("get_metrics", {"format": format}, auth_token)
+
+    @authorized_method
+    async def enable_tracing(self, user_ids: List, auth_token: str = None) -> dict:
+        self.check_operator(auth_token)
+        return await self._broadcast("enable_tracing", {"user_ids": user_ids}, auth_token)
+
+    @authorized_method
+    async def disable_tracing(self, user_ids: List = None, auth_token: str = None) -> dict:
+        self.check_operator(auth_token)
+        return await self._broadcast("disable_tracing", {"user_ids": user_ids}, auth_token)
+
+    @authorized_method
+    async def get_tracing_stats(self, auth_token: str = None) -> dict:
+        self.check_operator(auth_token)
+        return await self._broadcast("get_tracing_stats", {}, auth_token)
+
+    @authorized_method
+    async def enable_expression_profile(self, reset: bool = False, auth_token: str = None) -> dict:
+        self.check_operator(auth_token)
+        return await self._broadcast("enable_expression_profile", {"reset": reset}, auth_token)
+
+    @authorized_method
+    async def disable_expression_profile(self, auth_token: str = None) -> dict:
+        self.check_operator(auth_token)
+        return await self._broadcast("disable_expression_profile", {}, auth_token)
+
+    @authorized_method
+    async def get_expression_profile(
+        self, limit: Optional[int] = 20, sort: str = "self_seconds", auth_token: str = None
+    ) -> dict:
+        self.check_operator(auth_token)
+        check_sort(sort)
+        return await self._broadcast("get_expression_profile", {"limit": limit, "sort": sort}, auth_token)
+
+    @authorized_method
+    async def get_render_stats(self, auth_token: str = None) -> dict:
+        self.check_operator(auth_token)
+        return await self._broadcast("get_render_stats", {}, auth_token)
+
+    @authorized_method
+    async def get_registration_stats(self, auth_token: str = None) -> dict:
+        self.check_operator(auth_token)
+        return await self._broadcast("get_registration_stats", {}, auth_token)
+
+    @authorized_method
+    async def get_session_store_stats(self, auth_token: str = None) -> dict:
+        self.check_operator(auth_token)
+        return await self._broadcast("get_session_store_stats", {}, auth_token)
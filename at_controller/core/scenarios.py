@@ -0,0 +1,142 @@
+import hashlib
+import json
+from dataclasses import dataclass
+from dataclasses import field
+from logging import getLogger
+from typing import Any
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from yaml import safe_load
+
+from at_controller.core.graph import ScenarioGraph
+from at_controller.diagram.models.diagram import DiagramModel
+from at_controller.diagram.state.diagram import Diagram
+from at_controller.diagram.state.profiler import ExpressionProfile
+from at_controller.diagram.state.profiler import profile_diagram
+
+logger = getLogger(__name__)
+
+
+def load_scenario(data: Union[str, dict]) -> dict:
+    if isinstance(data, str):
+        return safe_load(data)
+    return data
+
+
+def compile_scenario(data: Union[str, dict]) -> Diagram:
+    diagram_model = DiagramModel(**load_scenario(data))
+    return diagram_model.to_internal()
+
+
+def scenario_hash(data: dict) -> str:
+    normalized = json.dumps(data, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+@dataclass(kw_only=True)
+class ScenarioEntry:
+    key: str
+    diagram: Diagram
+    references: int = 0
+    graph: Optional[ScenarioGraph] = field(default=None)
+
+
+class ScenarioCache:
+    """Compiled diagrams shared by every session configured with the same scenario.
+
+    Entries are keyed by the hash of the normalized scenario and are evicted as
+    soon as the last session holding them releases its reference. Cached
+    diagrams are shared between users, so nothing may mutate them after
+    compilation - per-session data lives in the StateMachine. The one
+    exception are trigger conditions swapped for instrumented ones while an
+    expression profile is set, which evaluate the same.
+    """
+
+    entries: Dict[str, ScenarioEntry]
+    profile: Optional[ExpressionProfile] = None
+
+    def __init__(self):
+        self.entries = {}
+        self._raw_keys = {}
+        self.hits = 0
+        self.misses = 0
+
+    def set_profile(self, profile: Optional[ExpressionProfile]):
+        """Instruments the conditions of every cached and later compiled scenario for the profile, None removes it."""
+        self.profile = profile
+        for key, entry in self.entries.items():
+            profile_diagram(entry.diagram, profile, key)
+
+    def get_key(self, data: Union[str, dict]) -> Tuple[str, Any, Optional[str]]:
+        """The scenario's key, its loaded data unless a cached text was recognized, and the hash of the text."""
+        if isinstance(data, str):
+            raw_key = hashlib.sha256(data.encode("utf-8")).hexdigest()
+            key = self._raw_keys.get(raw_key)
+            if key is not None and key in self.entries:
+                return key, None, raw_key
+            data = load_scenario(data)
+            return scenario_hash(data), data, raw_key
+        return scenario_hash(data), data, None
+
+    def acquire(self, data: Union[str, dict]) -> Tuple[str, Diagram, bool]:
+        """The scenario's key and diagram, and whether it was compiled by this call rather than shared."""
+        key, loaded, raw_key = self.get_key(data)
+        entry = self.entries.get(key)
+        compiled = entry is None
+        if compiled:
+            self.misses += 1
+            entry = ScenarioEntry(key=key, diagram=compile_scenario(loaded))
+            if self.profile is not None:
+                profile_diagram(entry.diagram, self.profile, key)
+            self.entries[key] = entry
+            logger.info("Compiled scenario %s, folded %d constant expression nodes", key, entry.diagram.folded_nodes)
+        else:
+            self.hits += 1
+        # only texts of scenarios that compiled are remembered
+        if raw_key is not None:
+            self._raw_keys[raw_key] = key
+        entry.references += 1
+        return key, entry.diagram, compiled
+
+    def acquire_key(self, key: str) -> Union[Diagram, None]:
+        """Takes another reference to an already compiled scenario."""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        self.hits += 1
+        entry.references += 1
+        return entry.diagram
+
+    def release(self, key: str):
+        entry = self.entries.get(key)
+        if entry is None:
+            return
+        entry.references -= 1
+        if entry.references <= 0:
+            del self.entries[key]
+            self._raw_keys = {raw: k for raw, k in self._raw_keys.items() if k != key}
+            logger.info("Evicted scenario %s", key)
+
+    def get(self, key: str) -> Union[Diagram, None]:
+        entry = self.entries.get(key)
+        return entry.diagram if entry else None
+
+    def get_graph(self, key: str) -> Union[ScenarioGraph, None]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.graph is None:
+            entry.graph = ScenarioGraph(entry.diagram)
+        return entry.graph
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "scenarios": len(self.entries),
+            "references": sum(entry.references for entry in self.entries.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -0,0 +1,290 @@
+import hashlib
+import os
+import pickle
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Dict
+from typing import Hashable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Union
+
+# prefix of the private FileSessionStore directory created when only a session budget is configured
+SESSIONS_PREFIX = "at_controller_sessions_"
+
+
+@dataclass(kw_only=True)
+class SessionSnapshot:
+    """Everything needed to rebuild an evicted session's StateMachine."""
+
+    session: Hashable
+    auth_token: str
+    state: Optional[str]
+    attributes: Dict[str, Any]
+    scenario_key: str
+    saved_at: float = field(default_factory=time.time)
+
+
+class SessionStore:
+    """Place evicted sessions and the scenarios they run are spilled to.
+
+    Scenarios are stored once per ScenarioCache key, so sessions of the
+    same scenario share the blob. Implementations are synchronous; the
+    controller calls them from a worker thread.
+    """
+
+    def save(self, snapshot: SessionSnapshot):
+        raise NotImplementedError
+
+    def load(self, session: Hashable) -> Optional[SessionSnapshot]:
+        raise NotImplementedError
+
+    def save_many(self, snapshots: List[SessionSnapshot]):
+        for snapshot in snapshots:
+            self.save(snapshot)
+
+    def delete(self, session: Hashable):
+        raise NotImplementedError
+
+    def scenario_keys(self) -> Dict[Hashable, str]:
+        """Scenario key of every stored session; reads every snapshot, meant for rare bulk operations."""
+        raise NotImplementedError
+
+    def has_scenario(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def save_scenario(self, key: str, data: Union[str, dict]):
+        raise NotImplementedError
+
+    def load_scenario(self, key: str) -> Optional[Union[str, dict]]:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class FileSessionStore(SessionStore):
+    """One pickle file per session and per scenario under ``path``.
+
+    Pickles are loaded as they are, so the directories are created
+    readable and writable by the controller's user only.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.join(path, "sessions"), mode=0o700, exist_ok=True)
+        os.makedirs(os.path.join(path, "scenarios"), mode=0o700, exist_ok=True)
+
+    @classmethod
+    def private(cls) -> "FileSessionStore":
+        """Store in a new directory of the system's temporary one, for this process alone."""
+        return cls(tempfile.mkdtemp(prefix=SESSIONS_PREFIX))
+
+    def _session_path(self, session: Hashable) -> str:
+        # the type is part of the name: user 1 and token "1" are different sessions
+        name = hashlib.sha256(repr(session).encode("utf-8")).hexdigest()
+        return os.path.join(self.path, "sessions", f"{name}.pickle")
+
+    def _scenario_path(self, key: str) -> str:
+        return os.path.join(self.path, "scenarios", f"{key}.pickle")
+
+    @staticmethod
+    def _write(path: str, value: Any):
+        # a temporary file of its own per write, concurrent saves of a session never share one
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary, path)
+        except BaseException:
+            try:
+                os.remove(temporary)
+            except FileNotFoundError:
+                pass
+            raise
+
+    @staticmethod
+    def _read(path: str) -> Any:
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+
+    def save(self, snapshot: SessionSnapshot):
+        self._write(self._session_path(snapshot.session), snapshot)
+
+    def load(self, session: Hashable) -> Optional[SessionSnapshot]:
+        return self._read(self._session_path(session))
+
+    def delete(self, session: Hashable):
+        try:
+            os.remove(self._session_path(session))
+        except FileNotFoundError:
+            pass
+
+    def scenario_keys(self) -> Dict[Hashable, str]:
+        directory = os.path.join(self.path, "sessions")
+        keys = {}
+        for name in os.listdir(directory):
+            if not name.endswith(".pickle"):
+                continue
+            snapshot = self._read(os.path.join(directory, name))
+            if snapshot is not None:
+                keys[snapshot.session] = snapshot.scenario_key
+        return keys
+
+    def has_scenario(self, key: str) -> bool:
+        return os.path.exists(self._scenario_path(key))
+
+    def save_scenario(self, key: str, data: Union[str, dict]):
+        self._write(self._scenario_path(key), data)
+
+    def load_scenario(self, key: str) -> Optional[Union[str, dict]]:
+        return self._read(self._scenario_path(key))
+
+
+class SqliteSessionStore(SessionStore):
+    """Snapshots in one SQLite file, written in batches by the snapshot writer.
+
+    The connection is shared by the worker threads the controller calls the
+    store from, so every statement runs under a lock.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions (session TEXT PRIMARY KEY, snapshot BLOB NOT NULL, saved_at REAL)"
+            )
+            self.connection.execute("CREATE TABLE IF NOT EXISTS scenarios (key TEXT PRIMARY KEY, data BLOB NOT NULL)")
+
+    @staticmethod
+    def _key(session: Hashable) -> str:
+        # the type is part of the key: user 1 and token "1" are different sessions
+        return repr(session)
+
+    @staticmethod
+    def _row(snapshot: SessionSnapshot):
+        data = pickle.dumps(snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+        return SqliteSessionStore._key(snapshot.session), data, snapshot.saved_at
+
+    def save(self, snapshot: SessionSnapshot):
+        self.save_many([snapshot])
+
+    def save_many(self, snapshots: List[SessionSnapshot]):
+        rows = [self._row(snapshot) for snapshot in snapshots]
+        with self.lock, self.connection:
+            # a batch written behind may reach the file after a newer eviction snapshot
+            self.connection.executemany(
+                "INSERT INTO sessions VALUES (?, ?, ?) ON CONFLICT(session) DO UPDATE "
+                "SET snapshot = excluded.snapshot, saved_at = excluded.saved_at "
+                "WHERE excluded.saved_at >= sessions.saved_at",
+                rows,
+            )
+
+    def load(self, session: Hashable) -> Optional[SessionSnapshot]:
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT snapshot FROM sessions WHERE session = ?", (self._key(session),)
+            ).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def delete(self, session: Hashable):
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM sessions WHERE session = ?", (self._key(session),))
+
+    def scenario_keys(self) -> Dict[Hashable, str]:
+        with self.lock:
+            rows = self.connection.execute("SELECT snapshot FROM sessions").fetchall()
+        snapshots = [pickle.loads(row[0]) for row in rows]
+        return {snapshot.session: snapshot.scenario_key for snapshot in snapshots}
+
+    def count(self) -> int:
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def has_scenario(self, key: str) -> bool:
+        with self.lock:
+            return self.connection.execute("SELECT 1 FROM scenarios WHERE key = ?", (key,)).fetchone() is not None
+
+    def save_scenario(self, key: str, data: Union[str, dict]):
+        blob = pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock, self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO scenarios VALUES (?, ?)", (key, blob))
+
+    def load_scenario(self, key: str) -> Optional[Union[str, dict]]:
+        with self.lock:
+            row = self.connection.execute("SELECT data FROM scenarios WHERE key = ?", (key,)).fetchone()
+        return pickle.loads(row[0]) if row else None
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+class SessionLRU:
+    """Order in which in-memory sessions were last used, least recent first."""
+
+    order: "OrderedDict[Hashable, None]"
+
+    def __init__(self):
+        self.order = OrderedDict()
+
+    def touch(self, session: Hashable):
+        self.order[session] = None
+        self.order.move_to_end(session)
+
+    def discard(self, session: Hashable):
+        self.order.pop(session, None)
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(list(self.order))
+
+    def __len__(self) -> int:
+        return len(self.order)
+
+
+class SessionStats:
+    def __init__(self):
+        self.evictions = 0
+        self.rehydrations = 0
+        self.misses = 0
+        self.eviction_time = 0.0
+        self.rehydration_time = 0.0
+        self.max_eviction_time = 0.0
+        self.max_rehydration_time = 0.0
+
+    def evicted(self, seconds: float):
+        self.evictions += 1
+        self.eviction_time += seconds
+        self.max_eviction_time = max(self.max_eviction_time, seconds)
+
+    def rehydrated(self, seconds: float):
+        self.rehydrations += 1
+        self.rehydration_time += seconds
+        self.max_rehydration_time = max(self.max_rehydration_time, seconds)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "evictions": self.evictions,
+            "rehydrations": self.rehydrations,
+            "misses": self.misses,
+            "avg_eviction_time": self.eviction_time / self.evictions if self.evictions else 0.0,
+            "max_eviction_time": self.max_eviction_time,
+            "avg_rehydration_time": self.rehydration_time / self.rehydrations if self.rehydrations else 0.0,
+            "max_rehydration_time": self.max_rehydration_time,
+        }
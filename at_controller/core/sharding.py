@@ -0,0 +1,46 @@
+import os
+import zlib
+from typing import Dict
+from typing import Hashable
+from typing import Iterable
+from typing import List
+from typing import Optional
+
+# component name of the router, the one other components call
+ROUTER_NAME = "ATController"
+
+
+def worker_name(index: int) -> str:
+    return f"{ROUTER_NAME}_{index}"
+
+
+def shard_of(session: Hashable, workers: int) -> int:
+    """Index of the worker owning a session.
+
+    crc32 of the session's repr is the same in every process and after a
+    restart, unlike ``hash`` of a str, and user 1 and token "1" stay
+    different sessions.
+    """
+    if workers <= 1:
+        return 0
+    return zlib.crc32(repr(session).encode("utf-8")) % workers
+
+
+def partition(sessions: Iterable[Hashable], workers: int) -> Dict[int, List[Hashable]]:
+    """Sessions grouped by the worker owning them, in their original order."""
+    shards: Dict[int, List[Hashable]] = {}
+    for session in sessions:
+        shards.setdefault(shard_of(session, workers), []).append(session)
+    return shards
+
+
+def shard_path(path: Optional[str], index: int, workers: int) -> Optional[str]:
+    """Session store path of a worker: ``sessions.sqlite`` becomes ``sessions.2.sqlite``.
+
+    A single worker keeps the path as given, so a non-sharded deployment
+    finds the sessions of its previous run.
+    """
+    if path is None or workers <= 1:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}.{index}{extension}"
@@ -0,0 +1,126 @@
+import asyncio
+import time
+from logging import getLogger
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Hashable
+from typing import Optional
+
+from at_controller.core.sessions import SessionSnapshot
+from at_controller.core.sessions import SessionStore
+
+logger = getLogger(__name__)
+
+# seconds between flushes of changed sessions
+SNAPSHOT_INTERVAL = 1.0
+# changed sessions that trigger a flush before the interval is over
+SNAPSHOT_BATCH = 500
+
+
+class SnapshotWriter:
+    """Write-behind persistence of changed sessions.
+
+    Sessions are marked when a job touches them; every ``interval`` seconds
+    (or once ``max_batch`` are waiting) the idle ones are snapshotted on the
+    event loop and written in one batch from a worker thread. Sessions
+    still busy stay marked for the next flush, so a snapshot never catches a
+    job halfway. A failed batch is retried with the next flush.
+    """
+
+    dirty: Dict[Hashable, None]
+
+    def __init__(
+        self,
+        store: SessionStore,
+        snapshot: Callable[[Hashable], Optional[SessionSnapshot]],
+        is_idle: Callable[[Hashable], bool],
+        interval: float = SNAPSHOT_INTERVAL,
+        max_batch: int = SNAPSHOT_BATCH,
+    ):
+        self.store = store
+        self.snapshot = snapshot
+        self.is_idle = is_idle
+        self.interval = interval
+        self.max_batch = max_batch
+
+        self.dirty = {}
+        self.task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._lock: Optional[asyncio.Lock] = None
+
+        self.batches = 0
+        self.written = 0
+        self.failed = 0
+        self.max_flush_time = 0.0
+
+    def mark(self, session: Hashable):
+        self.dirty[session] = None
+        if self.task is None:
+            self._wakeup = asyncio.Event()
+            self._lock = asyncio.Lock()
+            self.task = asyncio.get_running_loop().create_task(self._run())
+        if len(self.dirty) >= self.max_batch:
+            self._wakeup.set()
+
+    def forget(self, session: Hashable):
+        self.dirty.pop(session, None)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Could not write session snapshots")
+
+    async def flush(self, busy: bool = False) -> int:
+        """Writes the changed sessions; ``busy`` includes sessions whose jobs are still running."""
+        if self._lock is None:
+            return 0
+        async with self._lock:
+            started = time.perf_counter()
+            snapshots = []
+            for session in list(self.dirty):
+                if not busy and not self.is_idle(session):
+                    continue
+                del self.dirty[session]
+                snapshot = self.snapshot(session)
+                if snapshot is not None:
+                    snapshots.append(snapshot)
+            if not snapshots:
+                return 0
+            try:
+                await asyncio.to_thread(self.store.save_many, snapshots)
+            except Exception:
+                self.failed += len(snapshots)
+                for snapshot in snapshots:
+                    self.dirty.setdefault(snapshot.session, None)
+                raise
+            self.batches += 1
+            self.written += len(snapshots)
+            self.max_flush_time = max(self.max_flush_time, time.perf_counter() - started)
+            return len(snapshots)
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        await self.flush(busy=True)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "dirty": len(self.dirty),
+            "batches": self.batches,
+            "written": self.written,
+            "failed": self.failed,
+            "max_flush_time": self.max_flush_time,
+        }
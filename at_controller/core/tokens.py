@@ -0,0 +1,72 @@
+from typing import FrozenSet
+from typing import Hashable
+from typing import Iterable
+from typing import Optional
+
+from at_controller.core.cache import TTLCache
+
+# auth token -> user id resolutions, see TokenCacheMixin.get_user_id_or_token
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TTL = 300.0
+UNRESOLVED_TOKEN_TTL = 5.0
+
+
+class TokenCacheMixin:
+    """Caches the auth component's answers of ``get_user_id_or_token`` for the component it is mixed into.
+
+    Goes before ATComponent in the bases; ``token_cache`` is set by the
+    component's constructor, usually through ``token_cache_for``.
+    """
+
+    token_cache: TTLCache = None
+
+    @staticmethod
+    def token_cache_for(size: int = TOKEN_CACHE_SIZE, ttl: float = TOKEN_CACHE_TTL) -> TTLCache:
+        return TTLCache(max_size=size, ttl=ttl)
+
+    async def get_user_id_or_token(self, auth_token: str, *args, **kwargs):
+        """Resolves auth tokens through the auth component once per TTL.
+
+        A token that did not resolve to a user id comes back unchanged; that
+        answer is kept for a shorter time so a user who just logged in is
+        picked up soon.
+        """
+        found, resolved = self.token_cache.lookup(auth_token)
+        if found:
+            return resolved
+        resolved = await super().get_user_id_or_token(auth_token, *args, **kwargs)
+        ttl = UNRESOLVED_TOKEN_TTL if resolved == auth_token else None
+        self.token_cache.set(auth_token, resolved, ttl=ttl)
+        return resolved
+
+    def invalidate_auth_token(self, auth_token: str = None, user_id: Optional[Hashable] = None) -> int:
+        """Forgets a token, every token of a user, or with no arguments the whole token cache."""
+        if auth_token is None and user_id is None:
+            count = len(self.token_cache)
+            self.token_cache.clear()
+            return count
+        count = int(auth_token is not None and self.token_cache.invalidate(auth_token))
+        if user_id is not None:
+            count += self.token_cache.invalidate_where(lambda _, resolved: resolved == user_id)
+        return count
+
+
+class OperatorTokensMixin:
+    """Keeps the methods that act on the whole process to operators.
+
+    Those are the metrics, tracing, expression profiles, bulk operations,
+    the token cache and the stats of the caches and the session store.
+
+    ``authorized_method`` lets every learner's token through, these methods
+    also check that the caller's token is one of ``operator_tokens``. With
+    no operator tokens configured they are refused to everyone.
+    """
+
+    operator_tokens: FrozenSet[str] = frozenset()
+
+    def set_operator_tokens(self, operator_tokens: Optional[Iterable[str]]):
+        self.operator_tokens = frozenset(operator_tokens or ())
+
+    def check_operator(self, auth_token: Optional[str]):
+        if auth_token is None or auth_token not in self.operator_tokens:
+            raise PermissionError("Only operator auth tokens may call this method, see --operator-token")
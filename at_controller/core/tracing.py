@@ -0,0 +1,275 @@
+import json
+import os
+import random
+import time
+from contextvars import ContextVar
+from logging import getLogger
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Dict
+from typing import Hashable
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Set
+from typing import TypeVar
+
+logger = getLogger(__name__)
+
+T = TypeVar("T")
+
+TRACE_MAX_BYTES = 10 * 1024 * 1024
+TRACE_BACKUPS = 5
+
+# span of the running call in the current task, None outside a traced call
+_current: ContextVar[Optional["Span"]] = ContextVar("at_controller_span", default=None)
+
+
+class Trace:
+    """Spans of one call of a session, written together once the root span ends."""
+
+    __slots__ = ("trace_id", "user", "tracer", "spans", "next_id", "closed")
+
+    def __init__(self, tracer: "Tracer", user: Hashable):
+        self.trace_id = os.urandom(8).hex()
+        self.user = user
+        self.tracer = tracer
+        self.spans: List["Span"] = []
+        self.next_id = 0
+        self.closed = False
+
+    def span_id(self) -> int:
+        self.next_id += 1
+        return self.next_id
+
+
+class Span:
+    """A timed step of a trace: an action, an evaluation, an external call.
+
+    Used as a context manager, the span is the parent of spans started
+    inside it in the same task and in tasks created there, like those of
+    ``asyncio.gather``.
+    """
+
+    __slots__ = (
+        "trace",
+        "span_id",
+        "parent_id",
+        "name",
+        "attributes",
+        "started",
+        "duration",
+        "error",
+        "_clock",
+        "_token",
+    )
+
+    def __init__(self, trace: Trace, parent_id: Optional[int], name: str, attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = trace.span_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.started = 0.0
+        self.duration = 0.0
+        self.error = None
+        self._clock = 0.0
+        self._token = None
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        self.started = time.time()
+        self._clock = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._clock
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        _current.reset(self._token)
+        if self.trace.closed:
+            # a task started inside the call outlived it, e.g. a deferred render
+            self.trace.tracer.late_spans += 1
+            return
+        self.trace.spans.append(self)
+        if self.parent_id is None:
+            self.trace.closed = True
+            self.trace.tracer.finish(self.trace)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "user": self.trace.user,
+            "name": self.name,
+            "start": self.started,
+            "duration_ms": self.duration * 1000,
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class NoSpan:
+    """Stands in for a span outside traced calls; entering and leaving it does nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        return None
+
+
+NO_SPAN = NoSpan()
+
+
+class TraceWriter:
+    """Appends spans as JSON lines, rotating the file like ``logging.handlers.RotatingFileHandler``.
+
+    ``path`` is moved to ``path.1`` once it would grow over ``max_bytes``,
+    ``path.1`` to ``path.2`` and so on; files over ``backups`` are removed.
+    """
+
+    def __init__(self, path: str, max_bytes: int = TRACE_MAX_BYTES, backups: int = TRACE_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.file = open(path, "ab")
+        self.size = self.file.tell()
+
+    def write(self, spans: Iterable[Span]):
+        data = "".join(json.dumps(span.to_dict(), default=str) + "\n" for span in spans).encode("utf-8")
+        if self.size and self.size + len(data) > self.max_bytes:
+            self.rotate()
+        self.file.write(data)
+        self.file.flush()
+        self.size += len(data)
+
+    def rotate(self):
+        self.file.close()
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.file = open(self.path, "ab")
+        self.size = 0
+
+    def close(self):
+        self.file.close()
+
+
+class Tracer:
+    """Starts traces of sampled calls and of calls of users tracing was enabled for.
+
+    Nothing is traced without a writer. Spans of a trace are kept in
+    memory until its root span ends and then written at once; a traced
+    call costs a few small buffered writes, calls that are not traced a
+    context variable lookup per span.
+    """
+
+    writer: Optional[TraceWriter]
+    sample_rate: float
+    users: Set[Hashable]
+
+    def __init__(self, writer: Optional[TraceWriter] = None, sample_rate: float = 0.0):
+        self.writer = writer
+        self.sample_rate = sample_rate
+        self.users = set()
+        self.traces = 0
+        self.spans = 0
+        self.late_spans = 0
+
+    def configure(self, writer: Optional[TraceWriter], sample_rate: float = 0.0):
+        if self.writer is not None and self.writer is not writer:
+            self.writer.close()
+        self.writer = writer
+        self.sample_rate = sample_rate
+
+    @property
+    def enabled(self) -> bool:
+        return self.writer is not None
+
+    def enable(self, users: Iterable[Hashable]):
+        if not self.enabled:
+            raise ValueError("Tracing is off, it needs a trace file")
+        self.users.update(users)
+
+    def disable(self, users: Optional[Iterable[Hashable]] = None):
+        """Stops tracing the users, or every one of them without arguments; sampling goes on."""
+        if users is None:
+            self.users.clear()
+        else:
+            self.users.difference_update(users)
+
+    def trace(self, name: str, user: Hashable, **attributes) -> Any:
+        """Root span of a call of the user's session if it is traced, or a child span inside a traced call."""
+        parent = _current.get()
+        if parent is not None:
+            return Span(parent.trace, parent.span_id, name, attributes)
+        if self.writer is None:
+            return NO_SPAN
+        if user not in self.users and not (self.sample_rate and random.random() < self.sample_rate):
+            return NO_SPAN
+        return Span(Trace(self, user), None, name, attributes)
+
+    def finish(self, trace: Trace):
+        self.traces += 1
+        self.spans += len(trace.spans)
+        if self.writer is None:
+            return
+        try:
+            # children end before their parent, sorted they read top down
+            self.writer.write(sorted(trace.spans, key=lambda span: span.span_id))
+        except OSError as e:
+            logger.warning("Could not write trace %s: %s", trace.trace_id, e)
+
+    @property
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "path": self.writer.path if self.writer is not None else None,
+            "sample_rate": self.sample_rate,
+            "users": sorted(self.users, key=repr),
+            "traces": self.traces,
+            "spans": self.spans,
+            "late_spans": self.late_spans,
+        }
+
+
+def span(name: str, **attributes) -> Any:
+    """Child span of the current one, or a span that does nothing outside traced calls."""
+    parent = _current.get()
+    if parent is None:
+        return NO_SPAN
+    return Span(parent.trace, parent.span_id, name, attributes)
+
+
+# the span of the running call or None, a bound C method so the check on hot paths is a single call
+current_span: Callable[[], Optional[Span]] = _current.get
+
+
+def bind(job: Callable[[], Awaitable[T]]) -> Callable[[], Awaitable[T]]:
+    """The job running under the current span, for jobs another task runs, like a session mailbox's worker."""
+    parent = _current.get()
+    if parent is None:
+        return job
+
+    async def run() -> T:
+        token = _current.set(parent)
+        try:
+            return await job()
+        finally:
+            _current.reset(token)
+
+    return run
+
+
+TRACER = Tracer()
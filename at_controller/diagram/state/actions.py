@@ -1,7 +1,10 @@
 import asyncio
+import time
 from dataclasses import dataclass
 from dataclasses import field
+from functools import cached_property
 from logging import getLogger
+from typing import Callable
 from typing import Dict
 from typing import List
 from typing import Literal
@@ -9,13 +12,28 @@ from typing import Optional
 from typing import TYPE_CHECKING
 from typing import Union
 
-from at_controller.diagram.state.functions import Function
+from at_controller.core.metrics import REGISTRY
+from at_controller.core.metrics import TIMING_SAMPLE
+from at_controller.core.tracing import current_span
+from at_controller.core.tracing import span
+from at_controller.diagram.state.compiler import compile_action_value
+from at_controller.diagram.state.compiler import compile_value
+from at_controller.diagram.state.optimizer import optimize
+from at_controller.diagram.state.optimizer import optimize_structure
 
 logger = getLogger(__name__)
 
+ACTIONS = REGISTRY.counter("at_controller_actions_total", "Actions run", labels=("type",))
+ACTION_SECONDS = REGISTRY.histogram(
+    "at_controller_action_seconds",
+    f"Run time of every {TIMING_SAMPLE}th action of a type, without its next actions",
+    labels=("type",),
+)
+
 
 if TYPE_CHECKING:
     from at_controller.core.fsm import StateMachine
+    from at_controller.diagram.state.functions import Function
 
 
 @dataclass(kw_only=True)
@@ -23,8 +41,24 @@ class Action:
     type: str
     next: Optional[List["Action"]] = field(default=None)
 
+    folded_nodes: int = field(default=0, init=False, repr=False, compare=False)
+
     async def perform(self, state_machine: "StateMachine", frames: Dict[str, str], event_data=None):
-        result = await self.action(state_machine, frames, event_data=event_data)
+        if current_span() is None:
+            return await self._perform(state_machine, frames, event_data)
+        # next actions are children of the action's span
+        with span("action", type=self.type, **self.trace_attributes()):
+            return await self._perform(state_machine, frames, event_data)
+
+    async def _perform(self, state_machine: "StateMachine", frames: Dict[str, str], event_data=None):
+        if self._calls.inc() % TIMING_SAMPLE:
+            result = await self.action(state_machine, frames, event_data=event_data)
+        else:
+            started = time.perf_counter()
+            try:
+                result = await self.action(state_machine, frames, event_data=event_data)
+            finally:
+                self._seconds.observe(time.perf_counter() - started)
         if self.next:
             await asyncio.gather(
                 *[next_action.perform(state_machine, frames, event_data=event_data) for next_action in self.next]
@@ -34,6 +68,24 @@ class Action:
     async def action(self, state_machine: "StateMachine", frames: Dict[str, str], event_data=None):
         pass
 
+    def evaluate(self, compiled: Callable, state_machine: "StateMachine", frames: Dict[str, str], event_data=None):
+        """Runs a compiled value of the action, as an ``evaluate`` span in traced calls."""
+        if current_span() is None:
+            return compiled(state_machine, frames, event_data)
+        with span("evaluate", **self.trace_attributes()):
+            return compiled(state_machine, frames, event_data)
+
+    def trace_attributes(self) -> Dict[str, str]:
+        return {}
+
+    @cached_property
+    def _calls(self):
+        return ACTIONS.labels(self.type)
+
+    @cached_property
+    def _seconds(self):
+        return ACTION_SECONDS.labels(self.type)
+
 
 @dataclass(kw_only=True)
 class SetAttributeAction(Action):
@@ -41,16 +93,23 @@ class SetAttributeAction(Action):
     attribute: str
     value: Union[str, int, float, bool, "Function", list, dict]
 
+    compiled_value: Callable = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.value, self.folded_nodes = optimize(self.value)
+        self.compiled_value = compile_action_value(self.value)
+
     async def action(self, state_machine: "StateMachine", frames: Dict[str, str], event_data=None):
-        value = self.value
-        if isinstance(value, Function):
-            value = value.exec(state_machine, frames, event_data=event_data, **value.kwargs)
+        value = self.evaluate(self.compiled_value, state_machine, frames, event_data)
         state_machine.attributes[self.attribute] = value
 
         result = {}
         result[self.attribute] = value
         return result
 
+    def trace_attributes(self) -> Dict[str, str]:
+        return {"attribute": self.attribute}
+
 
 @dataclass(kw_only=True)
 class ShowMessageAction(Action):
@@ -85,12 +144,20 @@ class ExecMethodAction(Action):
     method_args: Optional[Dict[str, Union[str, int, float, bool, list, dict, "Function"]]] = field(default_factory=dict)
     auth_token: Optional[str] = field(default=None)
 
+    compiled_method_args: Callable = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.method_args, self.folded_nodes = optimize_structure(self.method_args)
+        self.compiled_method_args = compile_value(self.method_args)
+
     async def action(self, state_machine: "StateMachine", frames: Dict[str, str], event_data=None):
         if not await state_machine.component.check_external_registered(self.component):
             raise ValueError(f'Component "{self.component}" is not registered')
-        method_args = self.method_args
-        method_args = Function.search_and_call_functions(method_args, state_machine, frames, event_data=event_data)
+        method_args = self.evaluate(self.compiled_method_args, state_machine, frames, event_data)
         auth_token = self.auth_token or state_machine.auth_token
         return await state_machine.component.exec_external_method(
             self.component, self.method, method_args, auth_token=auth_token
         )
+
+    def trace_attributes(self) -> Dict[str, str]:
+        return {"component": self.component, "method": self.method}
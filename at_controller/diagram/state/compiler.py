@@ -0,0 +1,420 @@
+"""Compiles Function trees into plain Python closures.
+
+Every compiled callable takes ``(state_machine, frames, event_data, initial_event_data)``
+and returns exactly what the interpreted ``Function.call``/``Function.exec``
+path returns, including its quirks: ``Function.call`` does not forward
+``initial_event_data`` to ``exec``, unary and binary functions evaluate their
+operands without it, and nested kwargs are evaluated with ``exec``.
+"""
+import math
+import operator
+import re
+from contextvars import ContextVar
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Literal
+from typing import Optional
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from at_controller.diagram.state.functions import AndFunction
+from at_controller.diagram.state.functions import AuthToken
+from at_controller.diagram.state.functions import BinaryFunction
+from at_controller.diagram.state.functions import EventData
+from at_controller.diagram.state.functions import FrameUrl
+from at_controller.diagram.state.functions import Function
+from at_controller.diagram.state.functions import GetAttribute
+from at_controller.diagram.state.functions import InitialEventData
+from at_controller.diagram.state.functions import OrFunction
+from at_controller.diagram.state.functions import UnaryFunction
+
+if TYPE_CHECKING:
+    from at_controller.core.fsm import StateMachine
+    from at_controller.diagram.state.profiler import ProfileScope
+
+CompiledFunction = Callable[["StateMachine", Dict[str, str], Any, Any], Any]
+
+# how the interpreter reaches a function:
+#   call   - Function.call(state_machine, frames, event_data, initial_event_data)
+#   exec   - Function.exec(state_machine, frames, event_data=..., initial_event_data=...),
+#            as done for functions nested in another function's kwargs
+#   action - Function.exec(state_machine, frames, event_data=..., **function.kwargs),
+#            as done by SetAttributeAction
+Mode = Literal["call", "exec", "action"]
+
+# set while compiling a condition with every node instrumented, see profiler.compile_profiled
+PROFILING: ContextVar[Optional["ProfileScope"]] = ContextVar("at_controller_profiling", default=None)
+
+UNARY_OPERATIONS: Dict[str, Callable[[Any], Any]] = {
+    "len": len,
+    "sqrt": math.sqrt,
+    "abs": abs,
+    "ceil": math.ceil,
+    "floor": math.floor,
+    "round": round,
+    "sign": lambda value: math.copysign(1, value),
+    "log": math.log,
+    "exp": math.exp,
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "asin": math.asin,
+    "acos": math.acos,
+    "atan": math.atan,
+    "neg": operator.neg,
+    "transpose": np.transpose,
+    "det": np.linalg.det,
+    "inv": np.linalg.inv,
+    "norm": np.linalg.norm,
+    "trace": np.trace,
+    "is_null": lambda value: value is None,
+    "not": operator.not_,
+}
+
+BINARY_OPERATIONS: Dict[str, Callable[[Any, Any], Any]] = {
+    "add": operator.add,
+    "sub": operator.sub,
+    "mul": operator.mul,
+    "div": operator.truediv,
+    "mod": operator.mod,
+    "pow": operator.pow,
+    "logical_and": lambda left, right: left and right,
+    "logical_or": lambda left, right: left or right,
+    "xor": operator.xor,
+    "max": max,
+    "min": min,
+    "equal": operator.eq,
+    "not_equal": operator.ne,
+    "less_than": operator.lt,
+    "less_or_equal": operator.le,
+    "greater_than": operator.gt,
+    "greater_or_equal": operator.ge,
+    "get_attr": operator.getitem,
+    "has_attr": lambda left, right: right in left,
+}
+
+
+def constant(value: Any) -> CompiledFunction:
+    def compiled(state_machine, frames, event_data=None, initial_event_data=None):
+        return value
+
+    return compiled
+
+
+def unsupported(name: str) -> Callable[..., Any]:
+    def operation(*values):
+        raise ValueError(f"Unsupported operation type: {name}")
+
+    return operation
+
+
+def has_functions(value: Any) -> bool:
+    if isinstance(value, Function):
+        return True
+    if isinstance(value, dict):
+        return any(has_functions(item) for item in value.values())
+    if isinstance(value, list):
+        return any(has_functions(item) for item in value)
+    return False
+
+
+def compile_call(function: Function) -> CompiledFunction:
+    """Equivalent of ``function.call(state_machine, frames, event_data, initial_event_data)``."""
+    return _compile(function, "call")
+
+
+def compile_condition(condition: Any) -> CompiledFunction:
+    """Trigger condition of an EventTransition; literal conditions are returned as is."""
+    if isinstance(condition, Function):
+        return compile_call(condition)
+    return constant(condition)
+
+
+def compile_action_value(value: Any) -> CompiledFunction:
+    """Value of a SetAttributeAction, evaluated with ``value.exec(..., **value.kwargs)``."""
+    if isinstance(value, Function):
+        return _compile(value, "action")
+    return constant(value)
+
+
+def compile_value(value: Any) -> CompiledFunction:
+    """Equivalent of ``Function.search_and_call_functions`` over a structure with nested functions.
+
+    Dicts and lists are rebuilt on every evaluation, so callers may mutate the result.
+    """
+    if isinstance(value, Function):
+        compiled = compile_call(value)
+
+        def call_without_initial(state_machine, frames, event_data=None, initial_event_data=None):
+            return compiled(state_machine, frames, event_data, None)
+
+        return call_without_initial
+    if isinstance(value, dict):
+        items = [(key, compile_value(item)) for key, item in value.items()]
+
+        def build_dict(state_machine, frames, event_data=None, initial_event_data=None):
+            return {key: item(state_machine, frames, event_data) for key, item in items}
+
+        return build_dict
+    if isinstance(value, list):
+        items = [compile_value(item) for item in value]
+
+        def build_list(state_machine, frames, event_data=None, initial_event_data=None):
+            return [item(state_machine, frames, event_data) for item in items]
+
+        return build_list
+    return constant(value)
+
+
+def _compile_nested(value: Any) -> CompiledFunction:
+    # Function._search_and_call_functions: nested functions are exec'ed, containers rebuilt
+    if isinstance(value, Function):
+        return _compile(value, "exec")
+    if not has_functions(value):
+        return constant(value)
+    if isinstance(value, dict):
+        items = [(key, _compile_nested(item)) for key, item in value.items()]
+
+        def build_dict(state_machine, frames, event_data=None, initial_event_data=None):
+            return {key: item(state_machine, frames, event_data, initial_event_data) for key, item in items}
+
+        return build_dict
+    items = [_compile_nested(item) for item in value]
+
+    def build_list(state_machine, frames, event_data=None, initial_event_data=None):
+        return [item(state_machine, frames, event_data, initial_event_data) for item in items]
+
+    return build_list
+
+
+def _compile(function: Function, mode: Mode) -> CompiledFunction:
+    scope = PROFILING.get()
+    if scope is not None:
+        return scope.instrument(function, mode, _compile_function)
+    return _compile_function(function, mode)
+
+
+def _compile_function(function: Function, mode: Mode) -> CompiledFunction:
+    if isinstance(function, (AndFunction, OrFunction)):
+        return _compile_logical(function, mode)
+    if isinstance(function, (UnaryFunction, BinaryFunction)) and mode == "call" and _resolves_differently(function):
+        return _interpreted(function, mode)
+    if isinstance(function, UnaryFunction):
+        return _compile_unary(function)
+    if isinstance(function, BinaryFunction):
+        return _compile_binary(function)
+    if isinstance(function, FrameUrl):
+        return _compile_frame_url(function, mode)
+    if isinstance(function, (GetAttribute, AuthToken, EventData, InitialEventData)) and not has_functions(
+        function.kwargs
+    ):
+        return _compile_leaf(function, mode)
+    return _interpreted(function, mode)
+
+
+PURE_FUNCTIONS = (AndFunction, OrFunction, UnaryFunction, BinaryFunction, GetAttribute, AuthToken, EventData)
+
+
+def _resolves_differently(function: Function) -> bool:
+    # Function.call of unary and binary functions first exec's everything in their kwargs and then
+    # evaluates the operands again with call. Skipping that first pass is only safe when it cannot
+    # behave differently, i.e. every function in kwargs is a direct operand evaluated the same way.
+    operand_keys = ("value",) if isinstance(function, UnaryFunction) else ("left_value", "right_value")
+    for key, value in function.kwargs.items():
+        if key not in operand_keys or not isinstance(value, Function):
+            if has_functions(value):
+                return True
+        elif not isinstance(value, PURE_FUNCTIONS):
+            return True
+    return False
+
+
+def _interpreted(function: Function, mode: Mode) -> CompiledFunction:
+    if mode == "call":
+
+        def compiled(state_machine, frames, event_data=None, initial_event_data=None):
+            return function.call(state_machine, frames, event_data, initial_event_data)
+
+    elif mode == "exec":
+
+        def compiled(state_machine, frames, event_data=None, initial_event_data=None):
+            return function.exec(state_machine, frames, event_data=event_data, initial_event_data=initial_event_data)
+
+    else:
+
+        def compiled(state_machine, frames, event_data=None, initial_event_data=None):
+            return function.exec(state_machine, frames, event_data=event_data, **function.kwargs)
+
+    return compiled
+
+
+def _compile_leaf(function: Function, mode: Mode) -> CompiledFunction:
+    if isinstance(function, GetAttribute):
+        attribute = function.kwargs["attribute"]
+
+        def get_attribute(state_machine, frames, event_data=None, initial_event_data=None):
+            return state_machine.attributes.get(attribute)
+
+        return get_attribute
+
+    if isinstance(function, AuthToken):
+
+        def auth_token(state_machine, frames, event_data=None, initial_event_data=None):
+            return state_machine.auth_token
+
+        return auth_token
+
+    key_path = function.kwargs.get("key_path") if function.kwargs else None
+
+    if isinstance(function, InitialEventData) and mode != "exec":
+        # only the exec path of the interpreter receives initial_event_data
+        return constant(EventData.extract(None, key_path) if key_path else None)
+
+    if isinstance(function, InitialEventData):
+        if key_path:
+
+            def initial_event_data_path(state_machine, frames, event_data=None, initial_event_data=None):
+                return EventData.extract(initial_event_data, key_path)
+
+            return initial_event_data_path
+
+        def initial_event_data_value(state_machine, frames, event_data=None, initial_event_data=None):
+            return initial_event_data
+
+        return initial_event_data_value
+
+    if key_path:
+
+        def event_data_path(state_machine, frames, event_data=None, initial_event_data=None):
+            return EventData.extract(event_data, key_path)
+
+        return event_data_path
+
+    def event_data_value(state_machine, frames, event_data=None, initial_event_data=None):
+        return event_data
+
+    return event_data_value
+
+
+def _compile_logical(function: Function, mode: Mode) -> CompiledFunction:
+    items = [compile_call(item) if isinstance(item, Function) else constant(item) for item in function.kwargs["items"]]
+    forward_initial = mode != "action"
+    is_and = isinstance(function, AndFunction)
+
+    if is_and:
+
+        def logical(state_machine, frames, event_data=None, initial_event_data=None):
+            initial = initial_event_data if forward_initial else None
+            result = True
+            for item in items:
+                result = item(state_machine, frames, event_data, initial)
+                if not result:
+                    return result
+            return result
+
+    else:
+
+        def logical(state_machine, frames, event_data=None, initial_event_data=None):
+            initial = initial_event_data if forward_initial else None
+            result = False
+            for item in items:
+                result = item(state_machine, frames, event_data, initial)
+                if result:
+                    return result
+            return result
+
+    return logical
+
+
+def _compile_operand(value: Any) -> CompiledFunction:
+    if isinstance(value, Function):
+        return compile_call(value)
+    return constant(value)
+
+
+def _compile_unary(function: UnaryFunction) -> CompiledFunction:
+    operand = _compile_operand(function.value)
+
+    if function.name == "state_attr":
+
+        def state_attr(state_machine, frames, event_data=None, initial_event_data=None):
+            return state_machine.attributes.get(operand(state_machine, frames, event_data, None))
+
+        return state_attr
+
+    operation = UNARY_OPERATIONS.get(function.name) or unsupported(function.name)
+
+    def unary(state_machine, frames, event_data=None, initial_event_data=None):
+        return operation(operand(state_machine, frames, event_data, None))
+
+    return unary
+
+
+def _compile_binary(function: BinaryFunction) -> CompiledFunction:
+    left = _compile_operand(function.left_value)
+    right = _compile_operand(function.right_value)
+
+    if function.name == "state_attr":
+
+        def state_attr(state_machine, frames, event_data=None, initial_event_data=None):
+            left(state_machine, frames, event_data, None)
+            return state_machine.attributes.get(right(state_machine, frames, event_data, None))
+
+        return state_attr
+
+    operation = BINARY_OPERATIONS.get(function.name) or unsupported(function.name)
+
+    def binary(state_machine, frames, event_data=None, initial_event_data=None):
+        return operation(left(state_machine, frames, event_data, None), right(state_machine, frames, event_data, None))
+
+    return binary
+
+
+def _compile_frame_url(function: FrameUrl, mode: Mode) -> CompiledFunction:
+    if mode == "exec":
+        # exec without kwargs, the interpreter fails to find the frame id
+        def missing_frame_id(state_machine, frames, event_data=None, initial_event_data=None):
+            raise KeyError("frame_id")
+
+        return missing_frame_id
+
+    if mode == "action":
+        kwargs = constant(function.kwargs)
+        static_kwargs = function.kwargs
+    else:
+        kwargs = _compile_nested(function.kwargs)
+        static_kwargs = None if has_functions(function.kwargs) else function.kwargs
+
+    if static_kwargs is None or "frame_id" not in static_kwargs:
+        static_kwargs = {}
+    parse = static_kwargs.get("parse")
+
+    if isinstance(parse, dict) and isinstance(parse.get("regexp"), str) and "group" in parse:
+        frame_id = static_kwargs["frame_id"]
+        pattern = re.compile(parse["regexp"])
+        group = parse["group"]
+
+        def parse_frame_url(state_machine, frames, event_data=None, initial_event_data=None):
+            match = pattern.match(frames.get(frame_id))
+            if match is None:
+                return None
+            return match.groups()[group]
+
+        return parse_frame_url
+
+    if static_kwargs and "parse" not in static_kwargs and "query_params" not in static_kwargs:
+        frame_id = static_kwargs["frame_id"]
+
+        def frame_url(state_machine, frames, event_data=None, initial_event_data=None):
+            return frames.get(frame_id)
+
+        return frame_url
+
+    def generic_frame_url(state_machine, frames, event_data=None, initial_event_data=None):
+        return function.exec(
+            state_machine, frames, event_data, **kwargs(state_machine, frames, event_data, initial_event_data)
+        )
+
+    return generic_frame_url
@@ -3,12 +3,19 @@ from dataclasses import field
 from logging import getLogger
 from typing import Any
 from typing import Dict
+from typing import FrozenSet
 from typing import List
 from typing import Optional
+from typing import Set
+from typing import Tuple
 from typing import Union
 
+from at_controller.core.fsm import TransitionTable
+from at_controller.diagram.state.actions import Action
+from at_controller.diagram.state.actions import ExecMethodAction
 from at_controller.diagram.state.events import Event
 from at_controller.diagram.state.states import State
+from at_controller.diagram.state.transitions import EventTransition
 from at_controller.diagram.state.transitions import Transition
 
 
@@ -22,6 +29,53 @@ class Diagram:
     events: List[Event]
     initial_attributes: Optional[Dict[str, Any]] = field(default_factory=dict)
 
+    _states_by_name: Dict[str, State] = field(init=False, repr=False, compare=False)
+    _transitions_by_name: Dict[str, Transition] = field(init=False, repr=False, compare=False)
+    _events_by_name: Dict[str, Event] = field(init=False, repr=False, compare=False)
+    _exit_transitions: Dict[str, List[Transition]] = field(init=False, repr=False, compare=False)
+    _enter_transitions: Dict[str, List[Transition]] = field(init=False, repr=False, compare=False)
+    _event_transitions: Dict[Tuple[str, str], Tuple[EventTransition, ...]] = field(
+        init=False, repr=False, compare=False
+    )
+    _handled_events: FrozenSet[str] = field(init=False, repr=False, compare=False)
+    transition_table: TransitionTable = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        self.build_indexes()
+
+    def build_indexes(self):
+        # first definition wins, as it did with the linear scans
+        self._states_by_name = {}
+        for state in self.states:
+            self._states_by_name.setdefault(state.name, state)
+
+        self._transitions_by_name = {}
+        self._exit_transitions = {}
+        self._enter_transitions = {}
+        for transition in self.transitions:
+            self._transitions_by_name.setdefault(transition.name, transition)
+            annotation = transition.annotation
+            self._exit_transitions.setdefault(annotation["source"], []).append(transition)
+            self._enter_transitions.setdefault(annotation["dest"], []).append(transition)
+
+        for state in self.states:
+            state.page_skeleton = state.compile_page(self._exit_transitions.get(state.annotation, []))
+
+        self._events_by_name = {}
+        for event in self.events:
+            self._events_by_name.setdefault(event.name, event)
+
+        # candidates of handle_event, in exit transition order
+        event_transitions: Dict[Tuple[str, str], List[EventTransition]] = {}
+        for transition in self.transitions:
+            if isinstance(transition, EventTransition):
+                key = (transition.annotation["source"], transition.event)
+                event_transitions.setdefault(key, []).append(transition)
+        self._event_transitions = {key: tuple(candidates) for key, candidates in event_transitions.items()}
+        self._handled_events = frozenset(event for _, event in event_transitions) | frozenset(self._events_by_name)
+
+        self.transition_table = TransitionTable.from_annotation(self.annotation)
+
     @property
     def annotation(self):
         return {
@@ -30,29 +84,61 @@ class Diagram:
             "initial": next((state.annotation for state in self.states if state.initial), None),
         }
 
+    def iter_actions(self):
+        """Every action of the transitions and events, including the ``next`` chains."""
+        actions: List[Action] = [action for transition in self.transitions for action in transition.actions or []]
+        actions += [action for event in self.events for action in event.actions or []]
+        while actions:
+            action = actions.pop()
+            yield action
+            actions.extend(action.next or [])
+
+    @property
+    def folded_nodes(self) -> int:
+        """Expression nodes removed by constant folding over the whole scenario."""
+        total = sum(transition.folded_nodes for transition in self.transitions)
+        return total + sum(action.folded_nodes for action in self.iter_actions())
+
+    @property
+    def referenced_components(self) -> Set[str]:
+        """Components the scenario calls by name: exec_method targets and event handlers."""
+        components = {event.handler_component for event in self.events if event.handler_component}
+        for action in self.iter_actions():
+            if isinstance(action, ExecMethodAction) and isinstance(action.component, str):
+                components.add(action.component)
+        return components
+
     def get_state(self, name: str) -> Union[State, None]:
-        return next((state for state in self.states if state.name == name), None)
+        return self._states_by_name.get(name)
 
     def get_transition(self, name: str) -> Union[Transition, None]:
-        return next(
-            (transition for transition in self.transitions if transition.name == name),
-            None,
-        )
+        return self._transitions_by_name.get(name)
 
     def get_state_exit_transitions(self, state: Union[str, State]) -> List[Transition]:
         if isinstance(state, State):
             state = state.annotation
 
-        return [transition for transition in self.transitions if transition.annotation["source"] == state]
+        return list(self._exit_transitions.get(state, ()))
 
     def get_state_enter_transitions(self, state: Union[str, State]) -> List[Transition]:
         if isinstance(state, State):
             state = state.annotation
 
-        return [transition for transition in self.transitions if transition.annotation["dest"] == state]
+        return list(self._enter_transitions.get(state, ()))
 
     def get_state_all_transitions(self, state: Union[str, State]) -> List[Transition]:
         return self.get_state_exit_transitions(state) + self.get_state_enter_transitions(state)
 
     def get_event(self, name: str) -> Union[Event, None]:
-        return next((event for event in self.events if event.name == name), None)
+        return self._events_by_name.get(name)
+
+    def get_event_transitions(self, state: Union[str, State], event: str) -> Tuple[EventTransition, ...]:
+        """Exit transitions of the state triggered by the event, in the order their conditions are checked."""
+        if isinstance(state, State):
+            state = state.annotation
+
+        return self._event_transitions.get((state, event), ())
+
+    def handles_event(self, event: str) -> bool:
+        """Whether any transition or event definition of the scenario reacts to the event."""
+        return event in self._handled_events
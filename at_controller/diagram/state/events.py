@@ -1,4 +1,5 @@
 import asyncio
+import time
 from dataclasses import dataclass
 from dataclasses import field
 from logging import getLogger
@@ -8,6 +9,10 @@ from typing import List
 from typing import Optional
 from typing import TYPE_CHECKING
 
+from at_controller.core.metrics import REGISTRY
+from at_controller.core.metrics import TIMING_SAMPLE
+from at_controller.core.tracing import current_span
+from at_controller.core.tracing import span
 from at_controller.diagram.state.actions import Action
 
 
@@ -16,6 +21,12 @@ if TYPE_CHECKING:
 
 logger = getLogger(__name__)
 
+EVENT_HANDLES = REGISTRY.counter("at_controller_event_handles_total", "Event.handle runs")
+EVENT_HANDLE_SECONDS = REGISTRY.histogram(
+    "at_controller_event_handle_seconds",
+    f"Run time of every {TIMING_SAMPLE}th Event.handle: the handler component call and the event's actions",
+)
+
 
 @dataclass(kw_only=True)
 class Event:
@@ -28,6 +39,17 @@ class Event:
     async def handle(
         self, event: str, state_machine: "StateMachine", frames: Dict[str, str], event_data: Any = None, **kwargs
     ):
+        started = None if EVENT_HANDLES.inc() % TIMING_SAMPLE else time.perf_counter()
+        try:
+            if current_span() is None:
+                return await self._handle(event, state_machine, frames, event_data)
+            with span("event", event=event, handler=self.handler_component):
+                return await self._handle(event, state_machine, frames, event_data)
+        finally:
+            if started is not None:
+                EVENT_HANDLE_SECONDS.observe(time.perf_counter() - started)
+
+    async def _handle(self, event: str, state_machine: "StateMachine", frames: Dict[str, str], event_data: Any):
         checking_data = event_data
         if self.handler_component and self.handler_method:
             if await state_machine.component.check_external_registered(self.handler_component):
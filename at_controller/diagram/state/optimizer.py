@@ -0,0 +1,132 @@
+"""Load-time simplification of Function trees.
+
+Folds unary and binary functions whose operands are literals, drops neutral
+literals from ``and``/``or`` items and replaces logical nodes whose outcome is
+already decided by a literal. Every rewrite keeps the value the interpreter
+would return; anything whose evaluation fails or gives a mutable result is
+left for run time.
+"""
+from dataclasses import replace
+from typing import Any
+from typing import Tuple
+
+import numpy as np
+
+from at_controller.diagram.state.compiler import BINARY_OPERATIONS
+from at_controller.diagram.state.compiler import has_functions
+from at_controller.diagram.state.compiler import UNARY_OPERATIONS
+from at_controller.diagram.state.functions import AndFunction
+from at_controller.diagram.state.functions import AuthToken
+from at_controller.diagram.state.functions import BinaryFunction
+from at_controller.diagram.state.functions import EventData
+from at_controller.diagram.state.functions import Function
+from at_controller.diagram.state.functions import GetAttribute
+from at_controller.diagram.state.functions import OrFunction
+from at_controller.diagram.state.functions import UnaryFunction
+
+FOLDABLE_RESULTS = (bool, int, float, str, type(None), np.generic)
+
+# functions that give the same result whether they are reached with call or exec,
+# so an ``and``/``or`` wrapping only one of them can be replaced by it
+UNWRAPPABLE_FUNCTIONS = (AndFunction, OrFunction, UnaryFunction, BinaryFunction, GetAttribute, AuthToken, EventData)
+
+
+def count_nodes(value: Any) -> int:
+    if isinstance(value, Function):
+        return 1 + count_nodes(value.kwargs)
+    if isinstance(value, dict):
+        return sum(count_nodes(item) for item in value.values())
+    if isinstance(value, list):
+        return sum(count_nodes(item) for item in value)
+    return 0
+
+
+def optimize(value: Any) -> Tuple[Any, int]:
+    """Folds an expression; returns the new expression and the number of eliminated nodes."""
+    folded = fold(value)
+    return folded, count_nodes(value) - count_nodes(folded)
+
+
+def optimize_structure(value: Any) -> Tuple[Any, int]:
+    """Same as optimize for dicts and lists evaluated with Function.search_and_call_functions."""
+    folded = fold_structure(value)
+    return folded, count_nodes(value) - count_nodes(folded)
+
+
+def fold_structure(value: Any) -> Any:
+    if isinstance(value, Function):
+        return fold(value)
+    if isinstance(value, dict):
+        return {key: fold_structure(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [fold_structure(item) for item in value]
+    return value
+
+
+def fold(value: Any) -> Any:
+    if isinstance(value, (AndFunction, OrFunction)) and set(value.kwargs) == {"items"}:
+        return fold_logical(value)
+    if isinstance(value, UnaryFunction) and set(value.kwargs) == {"value"}:
+        return fold_unary(value)
+    if isinstance(value, BinaryFunction) and set(value.kwargs) == {"left_value", "right_value"}:
+        return fold_binary(value)
+    return value
+
+
+def _evaluate(operation, *operands) -> Tuple[bool, Any]:
+    if operation is None or any(has_functions(operand) for operand in operands):
+        return False, None
+    try:
+        result = operation(*operands)
+    except Exception:
+        return False, None
+    return isinstance(result, FOLDABLE_RESULTS), result
+
+
+def fold_unary(function: UnaryFunction) -> Any:
+    operand = fold(function.value)
+    operation = None if function.name == "state_attr" else UNARY_OPERATIONS.get(function.name)
+    folded, result = _evaluate(operation, operand)
+    if folded:
+        return result
+    if operand is function.value:
+        return function
+    return replace(function, kwargs={"value": operand})
+
+
+def fold_binary(function: BinaryFunction) -> Any:
+    left = fold(function.left_value)
+    right = fold(function.right_value)
+    folded, result = _evaluate(BINARY_OPERATIONS.get(function.name), left, right)
+    if folded:
+        return result
+    if left is function.left_value and right is function.right_value:
+        return function
+    return replace(function, kwargs={"left_value": left, "right_value": right})
+
+
+def fold_logical(function: Function) -> Any:
+    is_and = isinstance(function, AndFunction)
+    items = [fold(item) for item in function.kwargs["items"]]
+    if not items:
+        return is_and
+
+    kept = []
+    for i, item in enumerate(items):
+        if isinstance(item, Function):
+            kept.append(item)
+            continue
+        if bool(item) != is_and:
+            # falsy in ``and`` / truthy in ``or``: evaluation stops here
+            kept.append(item)
+            break
+        if i == len(items) - 1:
+            kept.append(item)
+
+    if not isinstance(kept[0], Function):
+        return kept[0]
+    if len(kept) == 1 and isinstance(kept[0], UNWRAPPABLE_FUNCTIONS):
+        return kept[0]
+    if len(kept) == len(items) and all(new is old for new, old in zip(kept, function.kwargs["items"])):
+        return function
+    return replace(function, kwargs={"items": kept})
@@ -0,0 +1,197 @@
+"""Calls and time per node of compiled trigger conditions.
+
+Conditions compiled with ``compile_profiled`` are instrumented at every
+Function node: each node's closure counts its calls and accumulates its run
+time, children included. A node is identified by the scenario, the
+transition and its path from the root of the condition, e.g.
+``and/1:greater_than/0:det`` for the ``det`` operand of the second item of
+an ``and``. The self time of a node is its time without that of its
+instrumented children. Subtrees the compiler leaves to the interpreter are
+timed as a whole.
+
+Uninstrumented conditions are not touched, profiling costs nothing until a
+scenario is compiled with a profile.
+"""
+import time
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import TYPE_CHECKING
+
+from at_controller.diagram.state.compiler import compile_condition
+from at_controller.diagram.state.compiler import CompiledFunction
+from at_controller.diagram.state.compiler import Mode
+from at_controller.diagram.state.compiler import PROFILING
+from at_controller.diagram.state.functions import Function
+from at_controller.diagram.state.transitions import EventTransition
+
+if TYPE_CHECKING:
+    from at_controller.diagram.state.diagram import Diagram
+
+# length of a node's expression text in profiles
+EXPRESSION_LENGTH = 120
+
+# entry fields profiles are sorted by, most first
+SORTS = ("self_seconds", "seconds", "calls", "mean_us")
+
+NodeKey = Tuple[str, str, str]
+
+
+class NodeStats:
+    __slots__ = ("expression", "calls", "errors", "seconds")
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+
+class ExpressionProfile:
+    """Stats of every instrumented node, keyed by (scenario, transition, path)."""
+
+    nodes: Dict[NodeKey, NodeStats]
+
+    def __init__(self):
+        self.nodes = {}
+        self.started = time.time()
+
+    def wrap(self, compiled: CompiledFunction, key: NodeKey, expression: str) -> CompiledFunction:
+        stats = self.nodes.get(key)
+        if stats is None:
+            stats = self.nodes[key] = NodeStats(expression)
+        clock = time.perf_counter
+
+        def profiled(state_machine, frames, event_data=None, initial_event_data=None):
+            started = clock()
+            try:
+                return compiled(state_machine, frames, event_data, initial_event_data)
+            except Exception:
+                stats.errors += 1
+                raise
+            finally:
+                stats.calls += 1
+                stats.seconds += clock() - started
+
+        return profiled
+
+    def reset(self):
+        for stats in self.nodes.values():
+            stats.calls = 0
+            stats.errors = 0
+            stats.seconds = 0.0
+        self.started = time.time()
+
+    def entries(self) -> List[Dict[str, Any]]:
+        children_seconds: Dict[NodeKey, float] = {}
+        for (scenario, transition, path), stats in self.nodes.items():
+            if "/" in path:
+                parent = (scenario, transition, path.rsplit("/", 1)[0])
+                children_seconds[parent] = children_seconds.get(parent, 0.0) + stats.seconds
+        return [
+            {
+                "scenario": scenario,
+                "transition": transition,
+                "path": path,
+                "expression": stats.expression,
+                "calls": stats.calls,
+                "errors": stats.errors,
+                "seconds": stats.seconds,
+                "self_seconds": max(0.0, stats.seconds - children_seconds.get((scenario, transition, path), 0.0)),
+                "mean_us": stats.seconds / stats.calls * 1e6 if stats.calls else 0.0,
+            }
+            for (scenario, transition, path), stats in self.nodes.items()
+        ]
+
+    def hottest(self, limit: Optional[int] = 20, sort: str = "self_seconds") -> List[Dict[str, Any]]:
+        """Nodes by ``self_seconds``, ``seconds``, ``calls`` or ``mean_us``, most first."""
+        check_sort(sort)
+        entries = sorted(self.entries(), key=lambda entry: entry[sort], reverse=True)
+        return entries[:limit] if limit is not None else entries
+
+    def snapshot(self, limit: Optional[int] = 20, sort: str = "self_seconds") -> Dict[str, Any]:
+        return {
+            "since": self.started,
+            "seconds": time.time() - self.started,
+            "nodes": len(self.nodes),
+            "sort": sort,
+            "hottest": self.hottest(limit, sort),
+        }
+
+
+def check_sort(sort: str):
+    if sort not in SORTS:
+        raise ValueError(f"Unknown sort {sort!r}, expected one of {', '.join(SORTS)}")
+
+
+class ProfileScope:
+    """Instruments every node compiled while it is set in ``PROFILING``."""
+
+    def __init__(self, profile: ExpressionProfile, scenario: str, transition: str):
+        self.profile = profile
+        self.scenario = scenario
+        self.transition = transition
+        self.path: List[str] = []
+        # instrumented children of every node on the path so far, the root level included
+        self.children: List[int] = [0]
+
+    def instrument(
+        self, function: Function, mode: Mode, compile: Callable[[Function, Mode], CompiledFunction]
+    ) -> CompiledFunction:
+        index = self.children[-1]
+        self.children[-1] += 1
+        self.path.append(f"{index}:{function.name}" if self.path else function.name)
+        path = "/".join(self.path)
+        self.children.append(0)
+        try:
+            compiled = compile(function, mode)
+        finally:
+            self.path.pop()
+            self.children.pop()
+        return self.profile.wrap(compiled, (self.scenario, self.transition, path), describe(function))
+
+
+def compile_profiled(condition: Any, profile: ExpressionProfile, scenario: str, transition: str) -> CompiledFunction:
+    """``compile_condition`` with every Function node instrumented for the profile."""
+    token = PROFILING.set(ProfileScope(profile, scenario, transition))
+    try:
+        return compile_condition(condition)
+    finally:
+        PROFILING.reset(token)
+
+
+def profile_diagram(diagram: "Diagram", profile: Optional[ExpressionProfile], scenario: str = ""):
+    """Recompiles the trigger conditions of a diagram, instrumented for the profile or plain without one."""
+    for transition in diagram.transitions:
+        if not isinstance(transition, EventTransition):
+            continue
+        if profile is None:
+            transition.compiled_condition = compile_condition(transition.trigger_condition)
+        else:
+            transition.compiled_condition = compile_profiled(
+                transition.trigger_condition, profile, scenario, transition.name
+            )
+
+
+def describe(value: Any, limit: int = EXPRESSION_LENGTH) -> str:
+    """Short text of an expression, like ``greater_than(event_data(['result']), 0.5)``."""
+    text = _describe(value)
+    return text if len(text) <= limit else text[: limit - 3] + "..."
+
+
+def _describe(value: Any) -> str:
+    if isinstance(value, Function):
+        kwargs = value.kwargs or {}
+        if len(kwargs) == 1 and isinstance(next(iter(kwargs.values())), list) and "items" in kwargs:
+            arguments = [_describe(item) for item in kwargs["items"]]
+        else:
+            arguments = [_describe(item) for item in kwargs.values()]
+        return f"{value.name}({', '.join(arguments)})"
+    if isinstance(value, dict):
+        return "{" + ", ".join(f"{key}: {_describe(item)}" for key, item in value.items()) + "}"
+    if isinstance(value, list):
+        return "[" + ", ".join(_describe(item) for item in value) + "]"
+    return repr(value)
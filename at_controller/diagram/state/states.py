@@ -1,9 +1,13 @@
 from dataclasses import dataclass
 from dataclasses import field
 from logging import getLogger
+from typing import Any
+from typing import Dict
+from typing import FrozenSet
 from typing import List
 from typing import Literal
 from typing import Optional
+from typing import Tuple
 from typing import TYPE_CHECKING
 from typing import Union
 from urllib.parse import parse_qs
@@ -12,14 +16,28 @@ from urllib.parse import urlencode
 from urllib.parse import urlparse
 from urllib.parse import urlunparse
 
+from at_controller.core.fsm import AttributeStore
+from at_controller.diagram.state.templates import Template
 
 if TYPE_CHECKING:
     from at_controller.core.fsm import StateMachine
-    from at_controller.diagram.state.transitions import LinkTransition, FrameHandlerTransition
+    from at_controller.diagram.state.transitions import LinkTransition, FrameHandlerTransition, Transition
 
 logger = getLogger(__name__)
 
 
+DOCS_SRC = "/docview?asFrame=true&viewing=true&docs="
+
+# stands in for the query while the static parts of a redirect url are split off
+QUERY_PLACEHOLDER = "\x00"
+
+# split urls kept per frame whose src is formatted from attributes, e.g. per auth token
+URL_CACHE_SIZE = 1024
+
+# attribute values a column can be reused for: a write is the only way to change them
+CACHEABLE_VALUES = (str, int, float, bool, type(None))
+
+
 @dataclass(kw_only=True)
 class Frame:
     frame_id: str
@@ -30,58 +48,212 @@ class Frame:
     type: Literal["basic", "format_attributes", "docs"] = field(default="basic")
     span: Optional[Union[int, str]] = field(default="auto")
 
-    def format_src(self, state_machine: "StateMachine"):
+    src_template: Optional[Template] = field(default=None, init=False, repr=False, compare=False)
+    redirect_template: Optional[Template] = field(default=None, init=False, repr=False, compare=False)
+
+    _props: Optional[Dict[str, Any]] = field(default=None, init=False, repr=False, compare=False)
+    _column: Optional[Dict[str, Any]] = field(default=None, init=False, repr=False, compare=False)
+    _docs_template: Optional[Template] = field(default=None, init=False, repr=False, compare=False)
+    _url_parts: Optional[Tuple[str, str]] = field(default=None, init=False, repr=False, compare=False)
+    _attribute_keys: Optional[Tuple[str, ...]] = field(default=None, init=False, repr=False, compare=False)
+    _url_cache: Dict[str, Optional[Tuple[str, str]]] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+
+    def __post_init__(self):
         if self.type == "format_attributes" or self.type == "docs":
-            return self.src.format(**state_machine.attributes)
-        return self.src
+            self.src_template = Template(self.src)
+        if self.type == "format_attributes" and self.redirect is not None:
+            self.redirect_template = Template(self.redirect)
+
+        self._props = {"flex": self.span, "style": {"height": "100%"}}
+        if self.type == "docs":
+            self._docs_template = Template(self.src, escape=quote_plus)
+        if self.redirect is not None and self._is_constant(self.src_template):
+            self._url_parts = self._split_url(self.src_template.constant if self.src_template else self.src)
+        attribute_names = self.attribute_names
+        if attribute_names is not None:
+            self._attribute_keys = tuple(sorted(attribute_names))
+        if attribute_names == frozenset():
+            try:
+                self._column = self._build_column({})
+            except Exception:
+                # keep the error for render time, where it used to be raised
+                self._column = None
+
+    @staticmethod
+    def _is_constant(template: Optional[Template]) -> bool:
+        return template is None or template.is_constant
+
+    @property
+    def attribute_names(self) -> Optional[FrozenSet[str]]:
+        """Attributes the frame is rendered from; None if they can't be told from the templates."""
+        names = frozenset()
+        for template in (self.src_template, self.redirect_template):
+            if template is not None:
+                if template.attributes is None:
+                    return None
+                names |= template.attributes
+        return names
+
+    def _split_url(self, src: str) -> Optional[Tuple[str, str]]:
+        # urlencode of the final query is the "&" join of every key's own encoding,
+        # so only the redirect value is left to encode per render
+        if QUERY_PLACEHOLDER in src:
+            return None
+        parsed_url = urlparse(src)
+        parsed_query = parse_qs(parsed_url.query)
+
+        redirect_param = self.redirect_param or "to"
+        parsed_query[redirect_param] = None
+
+        frame_id_param = self.frame_id_param or "frame_id"
+        if frame_id_param == redirect_param:
+            return None
+        parsed_query[frame_id_param] = [self.frame_id]
+
+        keys = list(parsed_query)
+        position = keys.index(redirect_param)
+        before = [urlencode({key: parsed_query[key]}, doseq=True) for key in keys[:position]]
+        after = [urlencode({key: parsed_query[key]}, doseq=True) for key in keys[position + 1 :]]
+
+        url = urlunparse(
+            (
+                parsed_url.scheme,
+                parsed_url.netloc,
+                parsed_url.path,
+                parsed_url.params,
+                QUERY_PLACEHOLDER,
+                parsed_url.fragment,
+            )
+        )
+        prefix, suffix = url.split(QUERY_PLACEHOLDER)
+        head = prefix + "".join(piece + "&" for piece in before) + quote_plus(redirect_param) + "="
+        tail = "".join("&" + piece for piece in after) + suffix
+        return head, tail
+
+    def format_src(self, state_machine: "StateMachine"):
+        return self._format_src(state_machine.attributes)
 
     def format_redirect(self, state_machine: "StateMachine"):
-        if self.type == "format_attributes" and self.redirect is not None:
-            return self.redirect.format_map(state_machine.attributes)
-        return self.redirect
+        return self._format_redirect(state_machine.attributes)
 
     def get_src(self, state_machine: "StateMachine"):
-        if self.type == "docs":
-            src = "/docview?asFrame=true&viewing=true&docs="
-            docs = self.format_src(state_machine)
-            formatted_docs = quote_plus(docs)
-            src += formatted_docs
-            return src
-        src = self.format_src(state_machine)
-        if self.redirect is not None:
-            redirect = self.format_redirect(state_machine)
-            parsed_url = urlparse(src)
-            parsed_query = parse_qs(parsed_url.query)
-
-            redirect_param = self.redirect_param or "to"
-            parsed_query[redirect_param] = [redirect]
-
-            frame_id_param = self.frame_id_param or "frame_id"
-            parsed_query[frame_id_param] = [self.frame_id]
-
-            new_query_string = urlencode(parsed_query, doseq=True)
-
-            final_src = urlunparse(
-                (
-                    parsed_url.scheme,
-                    parsed_url.netloc,
-                    parsed_url.path,
-                    parsed_url.params,
-                    new_query_string,
-                    parsed_url.fragment,
-                )
+        return self._render_src(state_machine.attributes)
+
+    def _format_src(self, attributes: Dict[str, Any]):
+        if self.src_template is not None:
+            return self.src_template.format(attributes)
+        return self.src
+
+    def _format_redirect(self, attributes: Dict[str, Any]):
+        if self.redirect_template is not None:
+            return self.redirect_template.format_map(attributes)
+        return self.redirect
+
+    def _render_src(self, attributes: Dict[str, Any]):
+        if self._docs_template is not None:
+            return DOCS_SRC + self._docs_template.format(attributes)
+        if self.redirect is None:
+            return self._format_src(attributes)
+
+        if self._url_parts is not None:
+            url_parts = self._url_parts
+        else:
+            src = self._format_src(attributes)
+            url_parts = self._cached_url_parts(src)
+        if url_parts is not None:
+            head, tail = url_parts
+            return head + quote_plus(self._format_redirect(attributes)) + tail
+
+        redirect = self._format_redirect(attributes)
+        parsed_url = urlparse(src)
+        parsed_query = parse_qs(parsed_url.query)
+
+        redirect_param = self.redirect_param or "to"
+        parsed_query[redirect_param] = [redirect]
+
+        frame_id_param = self.frame_id_param or "frame_id"
+        parsed_query[frame_id_param] = [self.frame_id]
+
+        new_query_string = urlencode(parsed_query, doseq=True)
+
+        final_src = urlunparse(
+            (
+                parsed_url.scheme,
+                parsed_url.netloc,
+                parsed_url.path,
+                parsed_url.params,
+                new_query_string,
+                parsed_url.fragment,
             )
+        )
 
-            return final_src
-        return src
+        return final_src
 
-    def get_column(self, state_machine: "StateMachine"):
+    def _cached_url_parts(self, src: str) -> Optional[Tuple[str, str]]:
+        try:
+            return self._url_cache[src]
+        except KeyError:
+            pass
+        if len(self._url_cache) >= URL_CACHE_SIZE:
+            self._url_cache.clear()
+        url_parts = self._url_cache[src] = self._split_url(src)
+        return url_parts
+
+    def _build_column(self, attributes: Dict[str, Any]):
         return {
-            "src": self.get_src(state_machine),
+            "src": self._render_src(attributes),
             "frame_id": self.frame_id,
-            "props": {"flex": self.span, "style": {"height": "100%"}},
+            "props": self._props,
         }
 
+    def get_column(self, state_machine: "StateMachine"):
+        if self._column is not None:
+            return self._column
+        attributes = state_machine.attributes
+        columns = getattr(state_machine, "columns", None)
+        if self._attribute_keys is None or columns is None or not isinstance(attributes, AttributeStore):
+            return self._build_column(attributes)
+
+        versions = attributes.versions_of(self._attribute_keys)
+        cached = columns.get(id(self))
+        if cached is not None and cached[0] == versions:
+            return cached[1]
+
+        column = self._build_column(attributes)
+        if all(type(attributes.get(key)) in CACHEABLE_VALUES for key in self._attribute_keys):
+            columns[id(self)] = (versions, column)
+        else:
+            columns.pop(id(self), None)
+        return column
+
+
+ROW_PROPS = {"style": {"height": "100%"}}
+
+
+@dataclass(frozen=True)
+class PageSkeleton:
+    """Session independent part of a state's page, shared by every render; never mutate it."""
+
+    header: Dict[str, Any]
+    handlers: List[Dict[str, Any]]
+    footer: Optional[Dict[str, Any]] = field(default=None)
+    control: Optional[Dict[str, Any]] = field(default=None)
+
+
+def transition_link(transition: "LinkTransition"):
+    return {
+        "type": "component_method",
+        "label": transition.label,
+        "component": "ATController",
+        "method": "trigger_transition",
+        "kwargs": {
+            "trigger": transition.name,
+        },
+        "framedata_field": "frames",
+    }
+
 
 @dataclass(kw_only=True)
 class State:
@@ -93,69 +265,34 @@ class State:
     translation: Optional[str] = field(default=None)
     initial: Optional[bool] = field(default=False)
 
+    page_skeleton: Optional[PageSkeleton] = field(default=None, init=False, repr=False, compare=False)
+
     @property
     def annotation(self):
         return self.name
 
-    def get_page(self, state_machine: "StateMachine"):
-        link_transitions: List["LinkTransition"] = [
-            t for t in state_machine.diagram.get_state_exit_transitions(self) if t.type == "link"
-        ]
+    def compile_page(self, exit_transitions: List["Transition"]) -> PageSkeleton:
+        link_transitions: List["LinkTransition"] = [t for t in exit_transitions if t.type == "link"]
         frame_handler_transitions: List["FrameHandlerTransition"] = [
-            t for t in state_machine.diagram.get_state_exit_transitions(self) if t.type == "frame_handler"
+            t for t in exit_transitions if t.type == "frame_handler"
         ]
 
         header = {
             "label": self.label,
             "links": [
-                {
-                    "type": "component_method",
-                    "label": transition.label,
-                    "component": "ATController",
-                    "method": "trigger_transition",
-                    "kwargs": {
-                        "trigger": transition.name,
-                    },
-                    "framedata_field": "frames",
-                }
-                for transition in link_transitions
-                if transition.position == "header"
+                transition_link(transition) for transition in link_transitions if transition.position == "header"
             ],
         }
 
         footer = {
-            "links": [
-                {
-                    "type": "component_method",
-                    "label": transition.label,
-                    "component": "ATController",
-                    "method": "trigger_transition",
-                    "kwargs": {
-                        "trigger": transition.name,
-                    },
-                    "framedata_field": "frames",
-                }
-                for transition in link_transitions
-                if transition.position == "footer"
-            ]
+            "links": [transition_link(transition) for transition in link_transitions if transition.position == "footer"]
         }
 
         control = {
             "label": self.control_label or "",
             "subtitle": self.control_subtitle or "",
             "links": [
-                {
-                    "type": "component_method",
-                    "label": transition.label,
-                    "component": "ATController",
-                    "method": "trigger_transition",
-                    "kwargs": {
-                        "trigger": transition.name,
-                    },
-                    "framedata_field": "frames",
-                }
-                for transition in link_transitions
-                if transition.position == "control"
+                transition_link(transition) for transition in link_transitions if transition.position == "control"
             ],
         }
 
@@ -174,23 +311,33 @@ class State:
             for transition in frame_handler_transitions
         ]
 
+        return PageSkeleton(
+            header=header,
+            handlers=handlers,
+            footer=footer if footer["links"] else None,
+            control=control if control["label"] or control["subtitle"] or control["links"] else None,
+        )
+
+    def get_page(self, state_machine: "StateMachine"):
+        skeleton = self.page_skeleton or self.compile_page(state_machine.diagram.get_state_exit_transitions(self))
+
         result = {
             "grid": {
                 "rows": [
                     {
-                        "props": {"style": {"height": "100%"}},
+                        "props": ROW_PROPS,
                         "cols": [frame.get_column(state_machine) for frame in frame_row],
                     }
                     for frame_row in self.frame_rows
                 ]
             },
-            "header": header,
-            "handlers": handlers,
+            "header": skeleton.header,
+            "handlers": skeleton.handlers,
         }
 
-        if footer["links"]:
-            result["footer"] = footer
-        if control["label"] or control["subtitle"] or control["links"]:
-            result["control"] = control
+        if skeleton.footer:
+            result["footer"] = skeleton.footer
+        if skeleton.control:
+            result["control"] = skeleton.control
 
         return result
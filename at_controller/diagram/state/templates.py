@@ -0,0 +1,98 @@
+from string import Formatter
+from typing import Any
+from typing import Callable
+from typing import FrozenSet
+from typing import List
+from typing import Mapping
+from typing import Optional
+from typing import Tuple
+
+_formatter = Formatter()
+
+
+def _is_simple_field(field_name: str, format_spec: Optional[str], conversion: Optional[str]) -> bool:
+    if not field_name or field_name.isdigit() or format_spec or conversion:
+        return False
+    return "." not in field_name and "[" not in field_name
+
+
+def _format_value(value: Any) -> str:
+    return value if type(value) is str else format(value)
+
+
+class Template:
+    """A ``str.format`` template split once into literal text and attribute fields.
+
+    Only templates made of plain ``{name}`` fields are analysed; anything
+    using positional fields, attribute/index access, conversions or format
+    specs is formatted as a whole so the result and the errors stay the
+    same. ``attributes`` is None when the referenced keys are not known.
+
+    ``escape`` is applied to the literal text once and to every formatted
+    value, which is only valid for escapes that work character by character
+    such as ``quote_plus``.
+    """
+
+    template: str
+    segments: List[Tuple[str, Optional[str]]]
+    attributes: Optional[FrozenSet[str]]
+    simple: bool
+    escape: Optional[Callable[[str], str]]
+
+    def __init__(self, template: str, escape: Optional[Callable[[str], str]] = None):
+        self.template = template
+        self.escape = escape
+        self.segments = []
+        self.simple = True
+        try:
+            for literal, field_name, format_spec, conversion in _formatter.parse(template):
+                if field_name is not None and not _is_simple_field(field_name, format_spec, conversion):
+                    self.simple = False
+                    break
+                self.segments.append((escape(literal) if escape else literal, field_name))
+        except ValueError:
+            self.simple = False
+        if self.simple:
+            self.attributes = frozenset(name for _, name in self.segments if name is not None)
+        else:
+            self.segments = []
+            self.attributes = None
+
+    @property
+    def is_constant(self) -> bool:
+        return self.simple and not self.attributes
+
+    @property
+    def constant(self) -> str:
+        return "".join(literal for literal, _ in self.segments)
+
+    def _escaped(self, text: str) -> str:
+        return self.escape(text) if self.escape else text
+
+    def format(self, values: Mapping[str, Any]) -> str:
+        """Same as ``template.format(**values)``: missing keys raise KeyError."""
+        if not self.simple:
+            return self._escaped(self.template.format(**values))
+        for name in self.attributes:
+            if name not in values:
+                raise KeyError(name)
+        if self.escape is None:
+            # every key is present, so a __missing__ of the mapping can't change the result
+            return self.template.format_map(values)
+        return self._render(values)
+
+    def format_map(self, values: Mapping[str, Any]) -> str:
+        """Same as ``template.format_map(values)``, so ``__missing__`` of the mapping applies."""
+        if not self.simple:
+            return self._escaped(self.template.format_map(values))
+        if self.escape is None:
+            return self.template.format_map(values)
+        return self._render(values)
+
+    def _render(self, values: Mapping[str, Any]) -> str:
+        parts = []
+        for literal, name in self.segments:
+            parts.append(literal)
+            if name is not None:
+                parts.append(self.escape(_format_value(values[name])))
+        return "".join(parts)
@@ -1,13 +1,16 @@
 from dataclasses import dataclass
 from dataclasses import field
 from logging import getLogger
+from typing import Callable
 from typing import List
 from typing import Literal
 from typing import Optional
 from typing import TYPE_CHECKING
 from typing import Union
 
+from at_controller.diagram.state.compiler import compile_condition
 from at_controller.diagram.state.functions import Function
+from at_controller.diagram.state.optimizer import optimize
 from at_controller.diagram.state.states import State
 
 
@@ -28,6 +31,8 @@ class Transition:
     translation: Optional[str] = field(default=None)
     tags: Optional[List[str]] = field(default=None)
 
+    folded_nodes: int = field(default=0, init=False, repr=False, compare=False)
+
     @property
     def annotation(self):
         return {
@@ -72,6 +77,10 @@ class EventTransition(Transition):
     translation: Optional[str] = field(default=None)
     tags: Optional[List[str]] = field(default=None)
 
+    compiled_condition: Callable = field(init=False, repr=False, compare=False)
+
     def __post_init__(self):
         if not self.event:
             self.event = self.name
+        self.trigger_condition, self.folded_nodes = optimize(self.trigger_condition)
+        self.compiled_condition = compile_condition(self.trigger_condition)
@@ -0,0 +1,140 @@
+"""Prints the trigger condition nodes a live controller spends most time in.
+
+Run with ``python -m at_controller.expression_profile`` and the connection
+arguments of ``at-controller``. Profiling is off by default; ``--enable``
+turns it on (or start the controller with ``--profile-expressions``), let
+learners work for a while, then run again to see the hottest nodes.
+``--auth-token`` must be one of the controller's ``--operator-token``.
+Profiles of all workers of a sharded controller are merged. ``--output``
+saves the profile as JSON, ``--input`` prints a saved one.
+"""
+import argparse
+import asyncio
+import json
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from at_queue.core.at_component import ATComponent
+from at_queue.core.session import ConnectionParameters
+
+from at_controller.core.arguments import add_connection_arguments
+from at_controller.core.sharding import ROUTER_NAME
+from at_controller.diagram.state.profiler import SORTS
+
+
+def merge_profiles(result: Optional[Dict[str, Any]], sort: str, limit: Optional[int]) -> Optional[Dict[str, Any]]:
+    """One profile out of a controller's, or of the per-worker ones the router returns."""
+    if result is None or "hottest" in result:
+        profiles = [result] if result is not None else []
+    else:
+        profiles = [profile for profile in result.values() if profile is not None]
+    if not profiles:
+        return None
+
+    merged: Dict[tuple, Dict[str, Any]] = {}
+    for profile in profiles:
+        for entry in profile["hottest"]:
+            key = (entry["scenario"], entry["transition"], entry["path"])
+            if key not in merged:
+                merged[key] = dict(entry)
+                continue
+            for field in ("calls", "errors", "seconds", "self_seconds"):
+                merged[key][field] += entry[field]
+    entries = list(merged.values())
+    for entry in entries:
+        entry["mean_us"] = entry["seconds"] / entry["calls"] * 1e6 if entry["calls"] else 0.0
+    entries.sort(key=lambda entry: entry[sort], reverse=True)
+    return {
+        "seconds": max(profile["seconds"] for profile in profiles),
+        "nodes": len(entries),
+        "sort": sort,
+        "hottest": entries[:limit] if limit is not None else entries,
+    }
+
+
+def format_profile(profile: Optional[Dict[str, Any]], width: int = 60) -> str:
+    if profile is None:
+        return "Expression profiling is off, enable it with --enable"
+    lines = [
+        f"{profile['nodes']} condition nodes over {profile['seconds']:.0f} s, by {profile['sort']}",
+        f"{'self, ms':>10} {'total, ms':>10} {'calls':>9} {'mean, us':>9}  {'transition':<24} path / expression",
+    ]
+    for entry in profile["hottest"]:
+        expression = entry["expression"]
+        if len(expression) > width:
+            expression = expression[: width - 3] + "..."
+        lines.append(
+            f"{entry['self_seconds'] * 1000:>10.2f} {entry['seconds'] * 1000:>10.2f} {entry['calls']:>9}"
+            f" {entry['mean_us']:>9.1f}  {entry['transition']:<24} {entry['path']}"
+        )
+        lines.append(f"{'':>43}  {'':<24} {expression}")
+    return "\n".join(lines)
+
+
+async def call_controller(connection: Dict[str, Any], calls: List[tuple], auth_token: str) -> List[Any]:
+    client = ATComponent(connection_parameters=ConnectionParameters(**connection), name="ATControllerProfiler")
+    await client.initialize()
+    await client.register()
+    # answers arrive through the component's own queue
+    listener = asyncio.create_task(client.start())
+    try:
+        return [
+            await client.exec_external_method(ROUTER_NAME, method, method_args, auth_token=auth_token)
+            for method, method_args in calls
+        ]
+    finally:
+        listener.cancel()
+        await asyncio.gather(listener, return_exceptions=True)
+
+
+def get_args() -> dict:
+    parser = argparse.ArgumentParser(
+        prog="at-controller-profile", description="Hottest trigger condition nodes of a running AT controller"
+    )
+    add_connection_arguments(parser)
+    parser.add_argument(
+        "--auth-token", help="Operator auth token the controller was started with, see --operator-token", default=None
+    )
+    parser.add_argument("--limit", type=int, help="Nodes printed", default=20)
+    parser.add_argument("--sort", choices=SORTS, help="Order of the nodes", default="self_seconds")
+    parser.add_argument("--enable", action="store_true", help="Turn profiling on")
+    parser.add_argument("--reset", action="store_true", help="Turn profiling on, dropping what was profiled so far")
+    parser.add_argument("--disable", action="store_true", help="Print the profile, then turn profiling off")
+    parser.add_argument("--output", help="JSON file the merged profile is saved to")
+    parser.add_argument("--input", help="Print a profile saved with --output instead of asking the controller")
+    return vars(parser.parse_args())
+
+
+def main():
+    args = get_args()
+    options = {
+        key: args.pop(key) for key in ("auth_token", "limit", "sort", "enable", "reset", "disable", "output", "input")
+    }
+    if options["input"]:
+        with open(options["input"]) as f:
+            print(format_profile(merge_profiles(json.load(f), options["sort"], options["limit"])))
+        return
+
+    calls = []
+    if options["enable"] or options["reset"]:
+        calls.append(("enable_expression_profile", {"reset": options["reset"]}))
+    # every node, the workers' profiles are merged before the limit applies
+    profile_call = len(calls)
+    calls.append(("get_expression_profile", {"limit": None, "sort": options["sort"]}))
+    if options["disable"]:
+        calls.append(("disable_expression_profile", {}))
+
+    results = asyncio.run(call_controller(args, calls, options["auth_token"]))
+    profile = merge_profiles(results[profile_call], options["sort"], None)
+    if options["output"] and profile is not None:
+        with open(options["output"], "w") as f:
+            json.dump(profile, f, indent=2)
+    if profile is not None:
+        profile = dict(profile, hottest=profile["hottest"][: options["limit"]])
+    print(format_profile(profile))
+
+
+if __name__ == "__main__":
+    main()
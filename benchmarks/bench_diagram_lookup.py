@@ -0,0 +1,41 @@
+"""Measures Diagram lookup cost against scenario size.
+
+Run with ``python -m benchmarks.bench_diagram_lookup``. Lookup time per call
+must stay flat while the number of transitions grows.
+"""
+import timeit
+
+from at_controller.diagram.models.diagram import DiagramModel
+from benchmarks.generator import generate_scenario
+
+SIZES = [20, 100, 500, 1000, 5000]
+STATES_PER_TRANSITION = 0.25
+NUMBER = 20000
+
+
+def bench(transitions: int):
+    states = max(2, int(transitions * STATES_PER_TRANSITION))
+    diagram = DiagramModel(**generate_scenario(states=states, transitions=transitions)).to_internal()
+
+    state = diagram.states[-1]
+    transition_name = diagram.transitions[-1].name
+
+    def lookup():
+        diagram.get_state(state.name)
+        diagram.get_transition(transition_name)
+        diagram.get_event("missing")
+        diagram.get_state_exit_transitions(state)
+        diagram.handles_event("missing")
+        diagram.get_event_transitions(state, "missing")
+
+    return timeit.timeit(lookup, number=NUMBER) / NUMBER
+
+
+def main():
+    print(f"{'transitions':>12} {'per lookup round, us':>22}")
+    for size in SIZES:
+        print(f"{size:>12} {bench(size) * 1e6:>22.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Cost of rendering a frame column.
+
+Run with ``python -m benchmarks.bench_frames``. "formatted" is the previous
+Frame.get_src: str.format of the templates and a full parse/encode of the
+url on every call.
+"""
+import timeit
+from urllib.parse import parse_qs
+from urllib.parse import quote_plus
+from urllib.parse import urlencode
+from urllib.parse import urlparse
+from urllib.parse import urlunparse
+
+from at_controller.core.fsm import SafeDict
+from at_controller.diagram.state.states import Frame
+
+NUMBER = 20000
+ATTRIBUTES = {"auth_token": "8b1f0c", "selected_kb": 12, "name": "types guide"}
+FRAMES = {
+    "constant": Frame(frame_id="editor", src="http://editor/kb?lang=ru", redirect="/knowledge_bases", type="basic"),
+    "redirect": Frame(
+        frame_id="editor",
+        src="http://editor/kb?lang=ru",
+        redirect="/knowledge_bases/{selected_kb}/types",
+        type="format_attributes",
+    ),
+    "src+redirect": Frame(
+        frame_id="editor",
+        src="http://editor/{auth_token}?token={auth_token}",
+        redirect="/knowledge_bases/{selected_kb}",
+        type="format_attributes",
+    ),
+    "docs": Frame(frame_id="docs", src="/guides/{name}.md", type="docs"),
+}
+
+
+def formatted(frame: Frame, attributes):
+    if frame.type == "docs":
+        return "/docview?asFrame=true&viewing=true&docs=" + quote_plus(frame.src.format(**attributes))
+    src = frame.src.format(**attributes) if frame.type == "format_attributes" else frame.src
+    redirect = frame.redirect.format_map(attributes) if frame.type == "format_attributes" else frame.redirect
+    parsed_url = urlparse(src)
+    parsed_query = parse_qs(parsed_url.query)
+    parsed_query[frame.redirect_param or "to"] = [redirect]
+    parsed_query[frame.frame_id_param or "frame_id"] = [frame.frame_id]
+    query = urlencode(parsed_query, doseq=True)
+    return urlunparse(
+        (parsed_url.scheme, parsed_url.netloc, parsed_url.path, parsed_url.params, query, parsed_url.fragment)
+    )
+
+
+class Session:
+    def __init__(self):
+        self.attributes = SafeDict()
+        self.attributes.update(ATTRIBUTES)
+
+
+def main():
+    session = Session()
+    print(f"{'frame':>14} {'formatted, us':>14} {'templates, us':>14}")
+    for name, frame in FRAMES.items():
+        assert formatted(frame, session.attributes) == frame.get_src(session)
+        old = timeit.timeit(lambda: formatted(frame, session.attributes), number=NUMBER) / NUMBER
+        new = timeit.timeit(lambda: frame.get_column(session), number=NUMBER) / NUMBER
+        print(f"{name:>14} {old * 1e6:>14.2f} {new * 1e6:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Interpreted Function.call against the compiled condition closures.
+
+Run with ``python -m benchmarks.bench_function_compiler``. Uses the nested
+or/and/has_attr trigger conditions of tests/test_diagram_loading.py.
+"""
+import timeit
+from types import SimpleNamespace
+
+import yaml
+
+from at_controller.core.fsm import SafeDict
+from at_controller.diagram.models.transitions import Transitions
+
+NUMBER = 50000
+
+CONDITIONS = """
+errors_in_update_type:
+  type: event
+  event: kbTypes/update
+  source: building_types
+  dest: building_types
+  trigger_condition:
+    or:
+      - not:
+          has_attr:
+            left_value: { get_attribute: skills_result }
+            right_value: stage_done
+      - and:
+          - has_attr:
+              left_value: { get_attribute: skills_result }
+              right_value: stage_done
+          - not:
+              get_attr:
+                left_value: { get_attribute: skills_result }
+                right_value: stage_done
+
+all_types_updated:
+  type: event
+  event: kbTypes/update
+  source: building_types
+  dest: building_types
+  trigger_condition:
+    and:
+      - has_attr:
+          left_value: { get_attribute: skills_result }
+          right_value: stage_done
+      - get_attr:
+          left_value: { get_attribute: skills_result }
+          right_value: stage_done
+"""
+
+
+def main():
+    transitions = Transitions(**yaml.safe_load(CONDITIONS)).to_internal()
+    attributes = SafeDict(skills_result={"stage_done": True})
+    state_machine = SimpleNamespace(attributes=attributes, auth_token="token")
+    frames = {}
+
+    print(f"{'transition':>22} {'interpreted, us':>16} {'compiled, us':>13} {'speedup':>8}")
+    for transition in transitions:
+        condition = transition.trigger_condition
+        compiled = transition.compiled_condition
+        assert condition.call(state_machine, frames, None, None) == compiled(state_machine, frames, None, None)
+
+        interpreted_time = timeit.timeit(lambda: condition.call(state_machine, frames, None, None), number=NUMBER)
+        compiled_time = timeit.timeit(lambda: compiled(state_machine, frames, None, None), number=NUMBER)
+        print(
+            f"{transition.name:>22} {interpreted_time / NUMBER * 1e6:>16.3f} {compiled_time / NUMBER * 1e6:>13.3f} "
+            f"{interpreted_time / compiled_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
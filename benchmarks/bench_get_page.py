@@ -0,0 +1,45 @@
+"""Cost of building a render page for states with many links and frames.
+
+Run with ``python -m benchmarks.bench_get_page``. "rebuilt" compiles the
+page skeleton on every call, which is what State.get_page used to do;
+"skeleton" formats every frame on every call and "reused" keeps the
+session's columns between renders when no attribute was written.
+"""
+import timeit
+
+from at_controller.core.fsm import StateMachine
+from at_controller.diagram.models.diagram import DiagramModel
+from benchmarks.generator import generate_scenario
+
+NUMBER = 2000
+CASES = [(5, 2), (20, 4), (50, 8), (100, 16)]
+
+
+def main():
+    print(f"{'links':>6} {'frames':>7} {'rebuilt, us':>12} {'skeleton, us':>13} {'reused, us':>11}")
+    for links, frames in CASES:
+        diagram = DiagramModel(**generate_scenario(states=1, transitions=links, frames=frames)).to_internal()
+        state = diagram.states[0]
+        state_machine = StateMachine(None, "token", diagram)
+        exits = diagram.get_state_exit_transitions(state)
+
+        def rebuilt():
+            skeleton = state.page_skeleton
+            state.page_skeleton = state.compile_page(exits)
+            state_machine.columns.clear()
+            state.get_page(state_machine)
+            state.page_skeleton = skeleton
+
+        def formatted():
+            state_machine.columns.clear()
+            state.get_page(state_machine)
+
+        rebuilt_time = timeit.timeit(rebuilt, number=NUMBER) / NUMBER
+        skeleton_time = timeit.timeit(formatted, number=NUMBER) / NUMBER
+        reused_time = timeit.timeit(lambda: state.get_page(state_machine), number=NUMBER) / NUMBER
+        times = f"{rebuilt_time * 1e6:>12.1f} {skeleton_time * 1e6:>13.1f} {reused_time * 1e6:>11.1f}"
+        print(f"{links:>6} {frames:>7} {times}")
+
+
+if __name__ == "__main__":
+    main()
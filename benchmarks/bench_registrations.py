@@ -0,0 +1,72 @@
+"""Bus round-trips spent on the kbTypes/update -> all_types_updated path of the fixture scenario.
+
+Run with ``python -m benchmarks.bench_registrations``. Every call that would
+go over RabbitMQ is counted instead of sent; "checks" are
+check_external_registered requests, "calls" are exec_external_method.
+"""
+import argparse
+import asyncio
+
+import yaml
+
+from at_controller.core.fsm import StateMachine
+from at_controller.core.registry import RegistrationCache
+from at_controller.diagram.models.diagram import DiagramModel
+
+SCENARIO = "./tests/fixtures/scenario.yaml"
+
+
+class CountingBus:
+    """Stands in for ATController's bus methods, optionally behind the registration cache."""
+
+    def __init__(self, cached: bool):
+        self.registrations = RegistrationCache() if cached else None
+        self.checks = 0
+        self.calls = 0
+
+    async def _ask_registered(self, component: str) -> bool:
+        self.checks += 1
+        return True
+
+    async def check_external_registered(self, component: str) -> bool:
+        if self.registrations is None:
+            return await self._ask_registered(component)
+        return await self.registrations.check(component, self._ask_registered)
+
+    async def exec_external_method(self, reciever: str, method: str, method_args: dict, auth_token: str = None):
+        self.calls += 1
+        return {"stage_done": True}
+
+
+async def run(cached: bool, transitions: int):
+    diagram = DiagramModel(**yaml.safe_load(open(SCENARIO))).to_internal()
+    bus = CountingBus(cached)
+    if cached:
+        await bus.registrations.warm(diagram.referenced_components, bus._ask_registered)
+    warm_checks = bus.checks
+
+    event = diagram.get_event("kbTypes/update")
+    transition = diagram.get_transition("all_types_updated")
+    for _ in range(transitions):
+        process = StateMachine(bus, "token", diagram)
+        process.state = "building_types"
+        data = await event.handle("kbTypes/update", process, {}, {})
+        await asyncio.gather(*[action.perform(process, {}, data) for action in transition.actions])
+    return bus, warm_checks
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transitions", type=int, default=1000)
+    args = parser.parse_args()
+
+    print(f"{'mode':>8} {'warm-up':>8} {'checks':>8} {'calls':>8} {'round-trips/transition':>23}")
+    for cached in (False, True):
+        bus, warm_checks = asyncio.run(run(cached, args.transitions))
+        per_transition = (bus.checks - warm_checks + bus.calls) / args.transitions
+        mode = "cached" if cached else "uncached"
+        print(f"{mode:>8} {warm_checks:>8} {bus.checks - warm_checks:>8} {bus.calls:>8} {per_transition:>23.2f}")
+
+
+if __name__ == "__main__":
+    main()
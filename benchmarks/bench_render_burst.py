@@ -0,0 +1,99 @@
+"""Render latency for bursts of transitions of one user.
+
+Run with ``python -m benchmarks.bench_render_burst``. Each session gets
+bursts of transitions a few milliseconds apart, handled one by one in its
+mailbox like ATController does, against a renderer that takes
+``--render-ms`` per page. Latency is measured from the last transition of a
+burst arriving until the page of its final state reached the renderer.
+"inline" is the previous behaviour: every transition waits for its render.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+
+from at_controller.core.mailbox import Mailboxes
+from at_controller.core.render import RenderScheduler
+
+
+class Renderer:
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.sent = 0
+        self.pages = 0
+        self.delivered = {}
+
+    async def render_page(self, session, version: int):
+        # a cancelled render has still been sent to the renderer
+        self.sent += 1
+        await asyncio.sleep(self.latency)
+        self.pages += 1
+        self.delivered[session] = (version, asyncio.get_running_loop().time())
+
+
+async def run(window, sessions: int, bursts: int, burst_size: int, gap: float, render_latency: float):
+    renderer = Renderer(render_latency)
+    mailboxes = Mailboxes()
+    versions = {}
+
+    async def render_latest(session):
+        await renderer.render_page(session, versions[session])
+
+    scheduler = RenderScheduler(render_latest, window) if window is not None else None
+
+    async def transition(session):
+        versions[session] += 1
+        if scheduler is None:
+            await render_latest(session)
+        else:
+            scheduler.schedule(session)
+
+    latencies = []
+
+    async def user(session, rng: random.Random):
+        versions[session] = 0
+        loop = asyncio.get_running_loop()
+        for _ in range(bursts):
+            jobs = []
+            for _ in range(burst_size):
+                jobs.append(asyncio.ensure_future(mailboxes.run(session, lambda: transition(session))))
+                await asyncio.sleep(rng.uniform(0, gap))
+            last = loop.time()
+            await asyncio.gather(*jobs)
+            target = versions[session]
+            while renderer.delivered.get(session, (0,))[0] < target:
+                await asyncio.sleep(0.0005)
+            latencies.append(renderer.delivered[session][1] - last)
+            await asyncio.sleep(rng.uniform(0.05, 0.1))
+
+    await asyncio.gather(*[user(i, random.Random(i)) for i in range(sessions)])
+    return latencies, renderer.sent, renderer.pages
+
+
+def percentile(values, q):
+    return statistics.quantiles(values, n=100)[q - 1] if len(values) > 1 else values[0]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--bursts", type=int, default=10)
+    parser.add_argument("--burst-size", type=int, default=8)
+    parser.add_argument("--gap-ms", type=float, default=2.0)
+    parser.add_argument("--render-ms", type=float, default=5.0)
+    args = parser.parse_args()
+
+    transitions = args.sessions * args.bursts * args.burst_size
+    print(f"{transitions} transitions in bursts of {args.burst_size}, renderer {args.render_ms} ms/page")
+    print(f"{'window':>8} {'sent':>6} {'shown':>6} {'p50, ms':>8} {'p95, ms':>8} {'p99, ms':>8}")
+    for window in (None, 0.0, 0.002, 0.005, 0.01):
+        latencies, sent, pages = asyncio.run(
+            run(window, args.sessions, args.bursts, args.burst_size, args.gap_ms / 1000, args.render_ms / 1000)
+        )
+        name = "inline" if window is None else f"{window * 1000:g} ms"
+        p50, p95, p99 = (percentile(latencies, q) * 1000 for q in (50, 95, 99))
+        print(f"{name:>8} {sent:>6} {pages:>6} {p50:>8.1f} {p95:>8.1f} {p99:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Restart-to-ready time with sessions kept in a SQLite snapshot file.
+
+Run with ``python -m benchmarks.bench_restart [--sessions 10000]``. The
+first controller configures every learner, starts its process and moves it
+one state on, its snapshot writer writing the sessions in batches, and is
+shut down. The restarted controller runs in a fresh interpreter on the same
+snapshot file: it is ready once its modules are imported and the file is
+open. Sessions of the previous run are rehydrated lazily by their first
+call; every learner then makes one call to the restarted controller -
+trigger_transition, start_process or reload_process in turns - and the
+latency of each is measured, all through the loopback bus of
+benchmarks.load.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+from typing import Dict
+from typing import List
+from typing import Tuple
+
+from at_controller.core.sessions import SqliteSessionStore
+from at_controller.core.sharding import ROUTER_NAME
+from benchmarks.generator import generate_scenario
+from benchmarks.load import FakeRenderer
+from benchmarks.load import LOOPBACK_ROUTER_TOKEN
+from benchmarks.load import LoopbackBus
+from benchmarks.load import LoopbackController
+
+# calls of the learners after the restart, in turns
+CALLS = ["trigger_transition", "start_process", "reload_process"]
+
+
+def controller_on(path: str) -> LoopbackBus:
+    bus = LoopbackBus()
+    controller = LoopbackController(bus, session_store=SqliteSessionStore(path), snapshot_interval=60)
+    bus.register(ROUTER_NAME, controller)
+    bus.register("ATRenderer", FakeRenderer())
+    return bus
+
+
+async def populate(path: str, sessions: int, scenario: dict) -> Tuple[float, dict]:
+    bus = controller_on(path)
+    controller = bus.components[ROUTER_NAME]
+    for user in range(sessions):
+        token = f"learner-{user}"
+        await controller.configure_scenario(scenario, LOOPBACK_ROUTER_TOKEN, auth_token=token)
+        await bus.call(ROUTER_NAME, "start_process", {}, token)
+        await bus.call(ROUTER_NAME, "trigger_transition", {"trigger": "transition_0", "frames": {}}, token)
+
+    started = time.perf_counter()
+    await controller.flush_sessions()
+    elapsed = time.perf_counter() - started
+    controller.session_store.close()
+    return elapsed, controller.snapshot_writer.stats
+
+
+async def call_restarted(path: str, sessions: int, started: float):
+    bus = controller_on(path)
+    ready = time.time() - started
+
+    latencies: Dict[str, List[float]] = {call: [] for call in CALLS}
+    arguments = {"trigger_transition": {"trigger": "transition_1", "frames": {}}}
+    for user in range(sessions):
+        call = CALLS[user % len(CALLS)]
+        begin = time.perf_counter()
+        await bus.call(ROUTER_NAME, call, arguments.get(call, {}), f"learner-{user}")
+        latencies[call].append(time.perf_counter() - begin)
+    states = bus.components[ROUTER_NAME].state_machines
+    rehydrated = sum(states[user].state == "state_2" for user in range(0, sessions, len(CALLS)))
+    return ready, latencies, rehydrated
+
+
+def restart(path: str, sessions: int, started: float, results):
+    results.put(asyncio.run(call_restarted(path, sessions, started)))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--states", type=int, default=40)
+    parser.add_argument("--frames", type=int, default=4)
+    args = parser.parse_args()
+
+    scenario = generate_scenario(states=args.states, transitions=args.states * 3, frames=args.frames)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sessions.sqlite")
+        shutdown, writes = asyncio.run(populate(path, args.sessions, scenario))
+        size = os.path.getsize(path) / 2**20
+
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        started = time.time()
+        process = context.Process(target=restart, args=(path, args.sessions, started, results))
+        process.start()
+        ready, latencies, rehydrated = results.get()
+        process.join()
+
+    print(f"sessions:                  {args.sessions}")
+    print(
+        f"snapshot write:            {writes['written']} sessions in {writes['batches']} batches,"
+        f" slowest {writes['max_flush_time'] * 1000:.0f} ms, {shutdown * 1000:.0f} ms on shutdown, file {size:.1f} MiB"
+    )
+    print(f"restart to ready:          {ready * 1000:.0f} ms (interpreter start, imports, open snapshot file)")
+    first = latencies[CALLS[0]][0]
+    print(f"first call:                {first * 1000:.1f} ms (rehydrates the session, compiles the scenario)")
+    for call in CALLS:
+        # the first call is shown above
+        rest = sorted(latencies[call][1:] if call == CALLS[0] else latencies[call]) or latencies[call]
+        p50, p99 = statistics.median(rest), rest[max(0, int(len(rest) * 0.99) - 1)]
+        print(f"{call + ':':<26} p50 {p50 * 1e6:.0f} us, p99 {p99 * 1e6:.0f} us")
+    total = ready + sum(sum(values) for values in latencies.values())
+    print(f"all sessions called:       {total * 1000:.0f} ms after restart")
+    print(f"transitions resumed:       {rehydrated} of {len(latencies[CALLS[0]])} in their stored state")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Configuration latency and memory for many users sharing one scenario.
+
+Run with ``python -m benchmarks.bench_scenario_cache``. Compares compiling
+the scenario for every user (the old ``perform_configurate`` path) with the
+shared ScenarioCache.
+"""
+import argparse
+import gc
+import os
+import resource
+import time
+
+from at_controller.core.scenarios import compile_scenario
+from at_controller.core.scenarios import ScenarioCache
+
+SCENARIO_PATH = "./tests/fixtures/scenario.yaml"
+
+
+def per_user(scenario: str, users: int):
+    scenarios = {}
+    for user in range(users):
+        scenarios[user] = compile_scenario(scenario)
+    return scenarios
+
+
+def shared(scenario: str, users: int):
+    cache = ScenarioCache()
+    scenarios = {}
+    for user in range(users):
+        _, scenarios[user], _ = cache.acquire(scenario)
+    return cache, scenarios
+
+
+def resident_memory() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def measure(name: str, func, scenario: str, users: int):
+    gc.collect()
+    before = resident_memory()
+    start = time.perf_counter()
+    result = func(scenario, users)
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    resident = resident_memory() - before
+    print(
+        f"{name:>10}: {elapsed / users * 1e3:8.3f} ms/user, {elapsed:7.2f} s total, "
+        f"{resident / 2**20:8.2f} MiB resident for {users} users"
+    )
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    args = parser.parse_args()
+
+    with open(SCENARIO_PATH) as f:
+        scenario = f.read()
+    # pydantic finishes building its validators on first use, keep that out of the measurement
+    compile_scenario(scenario)
+
+    result = measure("per-user", per_user, scenario, args.users)
+    del result
+    measure("shared", shared, scenario, args.users)
+
+
+if __name__ == "__main__":
+    main()
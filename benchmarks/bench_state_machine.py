@@ -0,0 +1,63 @@
+"""Per-session StateMachine construction time and memory.
+
+Run with ``python -m benchmarks.bench_state_machine``. Compares the shared
+TransitionTable engine with building a transitions GraphMachine for every
+session, as StateMachine did before.
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from transitions.extensions import GraphMachine
+
+from at_controller.core.fsm import SafeDict
+from at_controller.core.fsm import StateMachine
+from at_controller.core.scenarios import compile_scenario
+
+SCENARIO_PATH = "./tests/fixtures/scenario.yaml"
+
+
+class GraphStateMachine(object):
+    def __init__(self, component, auth_token, diagram):
+        self.component = component
+        self.auth_token = auth_token
+        self.attributes = SafeDict()
+        self.attributes["auth_token"] = auth_token
+        self.diagram = diagram
+        self.attributes.update(diagram.initial_attributes or {})
+
+        self.translated_machine = GraphMachine(model=self, **diagram.annotation)
+
+
+def measure(name: str, machine_class, diagram, sessions: int):
+    gc.collect()
+    start = time.perf_counter()
+    machines = [machine_class(None, f"token-{i}", diagram) for i in range(sessions)]
+    elapsed = time.perf_counter() - start
+    del machines
+
+    gc.collect()
+    tracemalloc.start()
+    machines = [machine_class(None, f"token-{i}", diagram) for i in range(sessions)]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del machines
+    print(f"{name:>14}: {elapsed / sessions * 1e6:10.1f} us/session, {current / sessions / 1024:8.2f} KiB/session")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=1000)
+    args = parser.parse_args()
+
+    with open(SCENARIO_PATH) as f:
+        diagram = compile_scenario(f.read())
+
+    # GraphMachine leaves a lot of cyclic garbage behind, measure it last so it does not slow the other run
+    measure("TransitionTable", StateMachine, diagram, args.sessions)
+    measure("GraphMachine", GraphStateMachine, diagram, args.sessions)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Transition throughput of sharded controller workers.
+
+Run with ``python -m benchmarks.bench_workers``. The main process runs
+ATControllerRouter, every worker process an ATController registered as
+``ATController_<i>`` - both unchanged, on the loopback bus of benchmarks.load
+in place of the at_queue transport. A worker's calls from the router cross
+a pipe between the processes instead of the broker; a worker renders its
+pages to a fake ATRenderer of its own.
+
+Learners are configured through the router's perform_configurate and start
+their process. Then every learner clicks exits of the state it is in, one
+trigger_transition after another, all learners at once. The router itself
+is one process, throughput stops growing once it is the bottleneck, and no
+speedup is to be expected beyond the number of cores.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import secrets
+import threading
+import time
+from multiprocessing.connection import Connection
+from types import SimpleNamespace
+from typing import Dict
+from typing import List
+
+from at_controller.core.sharding import ROUTER_NAME
+from at_controller.core.sharding import worker_name
+from benchmarks.generator import generate_scenario
+from benchmarks.load import FakeRenderer
+from benchmarks.load import LoopbackBus
+from benchmarks.load import LoopbackController
+from benchmarks.load import LoopbackRouter
+
+
+def receive(connection: Connection, loop: asyncio.AbstractEventLoop, handle):
+    # a thread per pipe, so that neither process blocks sending while the other one sends too
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            message = None
+        loop.call_soon_threadsafe(handle, message)
+        if message is None:
+            return
+
+
+class WorkerPipe:
+    """Component on the router's bus that sends its calls to a worker process."""
+
+    def __init__(self, connection: Connection):
+        self.connection = connection
+        self.calls: Dict[int, asyncio.Future] = {}
+        self.sent = 0
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        threading.Thread(target=receive, args=(self.connection, loop, self.reply), daemon=True).start()
+
+    def reply(self, message):
+        if message is None:
+            return
+        call, result, error = message
+        future = self.calls.pop(call)
+        if error is not None:
+            future.set_exception(RuntimeError(error))
+        else:
+            future.set_result(result)
+
+    def __getattr__(self, method: str):
+        async def call(auth_token: str = None, **method_args):
+            self.sent += 1
+            future = self.calls[self.sent] = asyncio.get_running_loop().create_future()
+            self.connection.send((self.sent, method, method_args, auth_token))
+            return await future
+
+        return call
+
+
+async def serve_calls(connection: Connection, index: int, router_token: str):
+    bus = LoopbackBus()
+    controller = LoopbackController(bus, name=worker_name(index), router_token=router_token)
+    bus.register(controller.name, controller)
+    bus.register("ATRenderer", FakeRenderer())
+    loop = asyncio.get_running_loop()
+    stopped = loop.create_future()
+    tasks = set()
+
+    async def answer(call: int, method: str, method_args: dict, auth_token: str):
+        try:
+            result = await bus.call(controller.name, method, method_args, auth_token)
+        except Exception as e:
+            connection.send((call, None, f"{type(e).__name__}: {e}"))
+        else:
+            connection.send((call, result, None))
+
+    def handle(message):
+        if message is None:
+            stopped.set_result(None)
+            return
+        task = loop.create_task(answer(*message))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    threading.Thread(target=receive, args=(connection, loop, handle), daemon=True).start()
+    await stopped
+    await asyncio.gather(*tasks)
+    if controller.render_scheduler is not None:
+        await controller.render_scheduler.flush()
+
+
+def run_worker(connection: Connection, index: int, router_token: str):
+    asyncio.run(serve_calls(connection, index, router_token))
+
+
+def exits_of(scenario: dict) -> Dict[str, List[str]]:
+    exits = {}
+    for name, transition in scenario["transitions"].items():
+        exits.setdefault(transition["source"], []).append(name)
+    return exits
+
+
+async def learner(bus: LoopbackBus, user: int, exits: Dict[str, List[str]], state: str, transitions: int):
+    token = f"learner-{user}"
+    for step in range(transitions):
+        options = exits[state]
+        trigger = options[(user + step) % len(options)]
+        state = await bus.call(ROUTER_NAME, "trigger_transition", {"trigger": trigger, "frames": {}}, token)
+
+
+async def run(workers: int, users: int, transitions: int, scenario: dict) -> float:
+    router_token = secrets.token_urlsafe(32)
+    context = multiprocessing.get_context("spawn")
+    bus = LoopbackBus()
+    router = LoopbackRouter(bus, workers=workers, router_token=router_token)
+    bus.register(router.name, router)
+    processes = []
+    for index in range(workers):
+        connection, worker_connection = context.Pipe()
+        process = context.Process(target=run_worker, args=(worker_connection, index, router_token))
+        process.start()
+        worker_connection.close()
+        processes.append(process)
+        pipe = WorkerPipe(connection)
+        pipe.start()
+        bus.register(worker_name(index), pipe)
+
+    try:
+        config = SimpleNamespace(items={"scenario": SimpleNamespace(data=scenario)})
+        await asyncio.gather(
+            *[router.perform_configurate(config, auth_token=f"learner-{user}") for user in range(1, users + 1)]
+        )
+        states = await asyncio.gather(
+            *[bus.call(router.name, "start_process", {}, f"learner-{user}") for user in range(1, users + 1)]
+        )
+
+        exits = exits_of(scenario)
+        started = time.perf_counter()
+        await asyncio.gather(
+            *[
+                learner(bus, user, exits, state, transitions // users)
+                for user, state in zip(range(1, users + 1), states)
+            ]
+        )
+        return users * (transitions // users) / (time.perf_counter() - started)
+    finally:
+        for index in range(workers):
+            bus.components[worker_name(index)].connection.send(None)
+        for process in processes:
+            await asyncio.to_thread(process.join)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--transitions", type=int, default=40000)
+    parser.add_argument("--states", type=int, default=20)
+    parser.add_argument("--frames", type=int, default=4)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    scenario = generate_scenario(states=args.states, transitions=args.states * 3, frames=args.frames)
+    print(f"{args.transitions} transitions of {args.users} users, {os.cpu_count()} cores")
+    print(f"{'workers':>8} {'transitions/s':>14} {'speedup':>8}")
+    base = None
+    for workers in args.workers:
+        throughput = asyncio.run(run(workers, args.users, args.transitions, scenario))
+        base = base or throughput
+        print(f"{workers:>8} {throughput:>14.0f} {throughput / base:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+from typing import Any
+from typing import Dict
+
+LINK_POSITIONS = ["header", "footer", "control"]
+
+
+def generate_condition(depth: int) -> Dict[str, Any]:
+    """A trigger condition nested ``depth`` levels deep that holds for event data with a ``result`` key.
+
+    It reads the event data and the session's attributes, so constant
+    folding cannot remove any of it.
+    """
+    leaf = {"has_attr": {"left_value": "$event_data", "right_value": "result"}}
+    if depth <= 1:
+        return leaf
+    return {"and": [{"not": {"is_null": {"get_attribute": "attempts"}}}, {"or": [generate_condition(depth - 1), leaf]}]}
+
+
+def generate_scenario(
+    states: int = 10, transitions: int = 20, frames: int = 2, events: int = 0, condition_depth: int = 0
+) -> Dict[str, Any]:
+    """Builds a synthetic scenario dict in the same shape as tests/fixtures/scenario.yaml.
+
+    Transitions are spread over the states round-robin, so every state has
+    roughly ``transitions / states`` exits whatever the scenario size is.
+    Every fifth transition is a frame handler, the rest are links.
+
+    ``events`` adds that many event definitions, each with an event
+    transition out of state ``i % states`` guarded by a condition of
+    ``condition_depth`` levels. Every other event asks a handler component
+    for the data its transition checks.
+    """
+    state_names = [f"state_{i}" for i in range(states)]
+    scenario_states = {}
+    for i, name in enumerate(state_names):
+        frame_row = {
+            "editor": {
+                "src": "http://localhost:8787/token?token={auth_token}&frame_id=editor",
+                "type": "format_attributes",
+                "redirect": f"/knowledge_bases/{{selected_kb}}/step/{i}",
+                "span": 20,
+            },
+        }
+        for j in range(1, frames):
+            frame_row[f"docs_{j}"] = {"src": f"/docview?viewing=true&docs=step+{i}+part+{j}", "span": 4}
+        scenario_states[name] = {
+            "label": f"State {i}",
+            "control_label": f"Control {i}",
+            "initial": i == 0,
+            "frame_rows": frame_row,
+        }
+
+    scenario_transitions = {}
+    for i in range(transitions):
+        source = state_names[i % states]
+        dest = state_names[(i + 1 + i // states) % states]
+        transition = {
+            "source": source,
+            "dest": dest,
+            "actions": [{"set_attribute": {"attribute": "last_transition", "value": f"transition_{i}"}}],
+        }
+        if i % 5 == 4:
+            transition.update(type="frame_handler", frame_id="editor", test=f"/knowledge_bases/\\d+/step/{i}")
+        else:
+            transition.update(type="link", position=LINK_POSITIONS[i % 3], label=f"Transition {i}")
+        scenario_transitions[f"transition_{i}"] = transition
+
+    scenario_events = {}
+    for i in range(events):
+        name = f"event_{i}"
+        scenario_events[name] = {"actions": [{"set_attribute": {"attribute": "last_event", "value": "$event_data"}}]}
+        if i % 2:
+            scenario_events[name].update(handler_component="ATTutoringSkills", handler_method=f"handle_{name}")
+        transition = {
+            "type": "event",
+            "event": name,
+            "source": state_names[i % states],
+            "dest": state_names[(i + 1) % states],
+            "actions": [{"set_attribute": {"attribute": "last_transition", "value": f"event_transition_{i}"}}],
+        }
+        if condition_depth > 0:
+            transition["trigger_condition"] = generate_condition(condition_depth)
+        scenario_transitions[f"event_transition_{i}"] = transition
+
+    scenario = {
+        "initial_attributes": {"attempts": 0},
+        "states": scenario_states,
+        "transitions": scenario_transitions,
+    }
+    if scenario_events:
+        scenario["events"] = scenario_events
+    return scenario
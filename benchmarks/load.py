@@ -0,0 +1,361 @@
+"""Load test of one ATController with thousands of simulated learners.
+
+Run with ``python -m benchmarks.load --users 100 1000 5000``. The
+controller runs unchanged on top of an in-memory loopback in place of the
+at_queue transport. Calls between components are plain coroutine calls
+with JSON round trips of their payloads and an optional ``--bus-ms``
+delay. ATRenderer is a fake that keeps the last page of every learner.
+Event handler components echo the event data back.
+
+Every learner is configured, starts its process and then, after a
+lognormal think time each, clicks a link of the page it was last shown
+(trigger_transition) or emits an editor event (handle_event). Learners
+start evenly over ``--ramp`` seconds; throughput, call latency and event
+loop lag are measured after the ramp.
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import statistics
+import time
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+
+import yaml
+from at_queue.core.at_component import ATComponent
+from at_queue.core.session import ConnectionParameters
+
+from at_controller.core.controller import ATController
+from at_controller.core.router import ATControllerRouter
+from at_controller.core.sharding import ROUTER_NAME
+from benchmarks.generator import generate_scenario
+
+# ConnectionParameters of ``at-controller`` without arguments, nothing connects to them
+CONNECTION = {
+    "url": None,
+    "host": "localhost",
+    "port": 5672,
+    "login": "guest",
+    "password": "guest",
+    "virtualhost": "/",
+}
+
+# router_token of the loopback controllers, passed to configure_scenario in place of the router
+LOOPBACK_ROUTER_TOKEN = "loopback-router"
+
+
+def round_trip(value: Any) -> Any:
+    # what crossing the message bus does to arguments and results
+    return json.loads(json.dumps(value, default=str))
+
+
+class LoopbackBus:
+    """Delivers calls between in-process components as the message bus would."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.components: Dict[str, Any] = {}
+        self.messages = 0
+
+    def register(self, name: str, component: Any):
+        self.components[name] = component
+
+    async def call(self, reciever: str, method: str, method_args: Optional[dict], auth_token: str = None):
+        component = self.components.get(reciever)
+        if component is None:
+            raise ValueError(f"Component {reciever} is not registered")
+        self.messages += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        result = await getattr(component, method)(**round_trip(method_args or {}), auth_token=auth_token)
+        return round_trip(result)
+
+
+class FakeRenderer:
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.pages: Dict[str, dict] = {}
+        self.rendered = 0
+        self.messages = 0
+
+    async def render_page(self, page: dict, auth_token: str = None):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.pages[auth_token] = page
+        self.rendered += 1
+
+    async def show_message(self, auth_token: str = None, **kwargs):
+        self.messages += 1
+
+
+class EchoComponent:
+    """Event handler component answering every method with the event's data."""
+
+    def __getattr__(self, method: str):
+        async def handle(event: str = None, data: Any = None, **kwargs):
+            return data
+
+        return handle
+
+
+class LoopbackComponent(ATComponent):
+    """ATComponent whose calls to other components go through the loopback bus.
+
+    Auth tokens ``learner-<i>`` resolve to user id ``i``.
+    """
+
+    bus: LoopbackBus = None
+
+    async def check_external_registered(self, component: str, *args, **kwargs) -> bool:
+        return component in self.bus.components
+
+    async def exec_external_method(self, reciever: str, methode_name: str, method_args: dict, *args, **kwargs):
+        return await self.bus.call(reciever, methode_name, method_args, auth_token=kwargs.get("auth_token"))
+
+    async def get_user_id_or_token(self, auth_token: str, *args, **kwargs):
+        prefix, _, user_id = auth_token.rpartition("-")
+        return int(user_id) if prefix == "learner" and user_id.isdigit() else auth_token
+
+
+class LoopbackController(ATController, LoopbackComponent):
+    """ATController on the loopback bus, its own overrides - caches, mailboxes, renders - run unchanged.
+
+    Learners are configured with configure_scenario, as the router of a
+    sharded controller does, with ``LOOPBACK_ROUTER_TOKEN``.
+    """
+
+    def __init__(self, bus: LoopbackBus, **kwargs):
+        kwargs.setdefault("router_token", LOOPBACK_ROUTER_TOKEN)
+        super().__init__(connection_parameters=ConnectionParameters(**CONNECTION), **kwargs)
+        self.bus = bus
+
+
+class LoopbackRouter(ATControllerRouter, LoopbackComponent):
+    """ATControllerRouter on the loopback bus, it configures the workers with ``LOOPBACK_ROUTER_TOKEN``."""
+
+    def __init__(self, bus: LoopbackBus, **kwargs):
+        kwargs.setdefault("router_token", LOOPBACK_ROUTER_TOKEN)
+        super().__init__(connection_parameters=ConnectionParameters(**CONNECTION), **kwargs)
+        self.bus = bus
+
+
+class ThinkTime:
+    """Lognormal pauses between a learner's actions with the given mean."""
+
+    def __init__(self, mean: float, sigma: float = 0.8):
+        self.sigma = sigma
+        self.mu = math.log(mean) - sigma**2 / 2 if mean > 0 else None
+
+    def sample(self, rng: random.Random) -> float:
+        return rng.lognormvariate(self.mu, self.sigma) if self.mu is not None else 0.0
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors = 0
+        self.measuring = False
+
+    async def measure(self, operation: str, call):
+        started = time.perf_counter()
+        try:
+            return await call
+        except Exception:
+            self.errors += self.measuring
+            return None
+        finally:
+            if self.measuring:
+                self.latencies.setdefault(operation, []).append(time.perf_counter() - started)
+
+
+def page_links(page: Optional[dict]) -> List[dict]:
+    if not page:
+        return []
+    links = []
+    for position in ("header", "footer", "control"):
+        links += (page.get(position) or {}).get("links") or []
+    return [link for link in links if link.get("method") == "trigger_transition"]
+
+
+async def learner(
+    index: int,
+    bus: LoopbackBus,
+    renderer: FakeRenderer,
+    recorder: Recorder,
+    scenario: dict,
+    events: List[str],
+    think: ThinkTime,
+    link_share: float,
+    start: float,
+    deadline: float,
+):
+    rng = random.Random(index)
+    loop = asyncio.get_running_loop()
+    token = f"learner-{index}"
+    await asyncio.sleep(max(0.0, start - loop.time()))
+
+    await recorder.measure(
+        "configure",
+        bus.call(
+            ROUTER_NAME, "configure_scenario", {"scenario": scenario, "router_token": LOOPBACK_ROUTER_TOKEN}, token
+        ),
+    )
+    await recorder.measure("start_process", bus.call(ROUTER_NAME, "start_process", {}, token))
+    while True:
+        await asyncio.sleep(think.sample(rng))
+        if loop.time() >= deadline:
+            return
+        links = page_links(renderer.pages.get(token))
+        if links and (not events or rng.random() < link_share):
+            link = rng.choice(links)
+            method_args = {**link["kwargs"], link.get("framedata_field", "frames"): {}}
+            await recorder.measure("trigger_transition", bus.call(ROUTER_NAME, link["method"], method_args, token))
+        elif events:
+            roll = rng.random()
+            # mostly data that passes the generated conditions
+            data = {"result": roll} if roll < 0.8 else {"other": roll}
+            method_args = {"event": rng.choice(events), "data": data, "frames": {}}
+            await recorder.measure("handle_event", bus.call(ROUTER_NAME, "handle_event", method_args, token))
+
+
+async def monitor_lag(interval: float, samples: List[float], recorder: Recorder):
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        if recorder.measuring:
+            samples.append(max(0.0, loop.time() - expected))
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    if len(values) == 1:
+        return {"p50": values[0], "p95": values[0], "p99": values[0], "max": values[0]}
+    quantiles = statistics.quantiles(values, n=100)
+    return {"p50": quantiles[49], "p95": quantiles[94], "p99": quantiles[98], "max": max(values)}
+
+
+async def run(users: int, scenario: dict, args) -> Dict[str, Any]:
+    bus = LoopbackBus(args.bus_ms / 1000)
+    renderer = FakeRenderer(args.render_ms / 1000)
+    controller = LoopbackController(
+        bus,
+        render_window=None if args.render_window_ms < 0 else args.render_window_ms / 1000,
+        max_sessions=args.max_sessions,
+    )
+    bus.register(ROUTER_NAME, controller)
+    bus.register("ATRenderer", renderer)
+    events = list(scenario.get("events", {}))
+    for event in scenario.get("events", {}).values():
+        if event.get("handler_component"):
+            bus.register(event["handler_component"], EchoComponent())
+
+    recorder = Recorder()
+    lag: List[float] = []
+    loop = asyncio.get_running_loop()
+    began = loop.time()
+    measured_from = began + args.ramp
+    deadline = measured_from + args.duration
+    think = ThinkTime(args.think_ms / 1000)
+
+    monitor = asyncio.create_task(monitor_lag(0.01, lag, recorder))
+    learners = [
+        asyncio.create_task(
+            learner(
+                index,
+                bus,
+                renderer,
+                recorder,
+                scenario,
+                events,
+                think,
+                args.link_share,
+                began + args.ramp * index / users,
+                deadline,
+            )
+        )
+        for index in range(users)
+    ]
+    await asyncio.sleep(max(0.0, measured_from - loop.time()))
+    recorder.measuring = True
+    messages = bus.messages
+    await asyncio.sleep(max(0.0, deadline - loop.time()))
+    recorder.measuring = False
+    elapsed = loop.time() - measured_from
+    messages = bus.messages - messages
+
+    await asyncio.gather(*learners, return_exceptions=True)
+    monitor.cancel()
+    if controller.render_scheduler is not None:
+        await controller.render_scheduler.flush()
+
+    calls = sum(len(latencies) for latencies in recorder.latencies.values())
+    return {
+        "users": users,
+        "calls": calls,
+        "errors": recorder.errors,
+        "throughput": calls / elapsed,
+        "messages_per_second": messages / elapsed,
+        "latency": {operation: percentiles(latencies) for operation, latencies in sorted(recorder.latencies.items())},
+        "all_latency": percentiles([value for values in recorder.latencies.values() for value in values]),
+        "loop_lag": percentiles(lag),
+        "pages_rendered": renderer.rendered,
+        "render": controller.render_cache.stats,
+        "sessions": len(controller.state_machines),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--duration", type=float, default=20.0, help="Measured seconds after the ramp")
+    parser.add_argument("--ramp", type=float, default=5.0, help="Seconds over which learners arrive")
+    parser.add_argument("--think-ms", type=float, default=2000.0, help="Mean pause between a learner's actions")
+    parser.add_argument("--link-share", type=float, default=0.6, help="Share of actions that are link clicks")
+    parser.add_argument("--bus-ms", type=float, default=0.0, help="Delivery delay of every call")
+    parser.add_argument("--render-ms", type=float, default=1.0, help="Time ATRenderer takes per page")
+    parser.add_argument("--render-window-ms", type=float, default=5.0, help="Negative renders inline")
+    parser.add_argument("--max-sessions", type=int, default=None)
+    parser.add_argument("--scenario", help="Scenario YAML, a generated one by default")
+    parser.add_argument("--states", type=int, default=20)
+    parser.add_argument("--transitions", type=int, default=60)
+    parser.add_argument("--events", type=int, default=10)
+    parser.add_argument("--output", help="JSON file for the results")
+    args = parser.parse_args()
+
+    if args.scenario:
+        with open(args.scenario) as f:
+            scenario = yaml.safe_load(f)
+    else:
+        scenario = generate_scenario(
+            states=args.states, transitions=args.transitions, frames=2, events=args.events, condition_depth=2
+        )
+
+    results = []
+    print(f"think time {args.think_ms:g} ms, {args.duration:g} s measured after a {args.ramp:g} s ramp")
+    print(
+        f"{'users':>7} {'calls/s':>9} {'errors':>7} {'p50, ms':>8} {'p95, ms':>8} {'p99, ms':>8}"
+        f" {'lag p99, ms':>12} {'lag max, ms':>12}"
+    )
+    for users in args.users:
+        result = asyncio.run(run(users, scenario, args))
+        results.append(result)
+        latency, lag = result["all_latency"], result["loop_lag"]
+        print(
+            f"{users:>7} {result['throughput']:>9.0f} {result['errors']:>7}"
+            f" {latency['p50'] * 1000:>8.2f} {latency['p95'] * 1000:>8.2f} {latency['p99'] * 1000:>8.2f}"
+            f" {lag['p99'] * 1000:>12.2f} {lag['max'] * 1000:>12.2f}"
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"settings": vars(args), "runs": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
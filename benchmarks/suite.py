@@ -0,0 +1,283 @@
+"""Per-phase timings of the controller over generated scenarios, written as JSON.
+
+Run with ``python -m benchmarks.suite [--output results.json]`` and compare
+two runs, e.g. of two commits, with
+``python -m benchmarks.suite --compare base.json results.json``.
+
+Phases of every scenario:
+
+* ``yaml_load`` - parsing the scenario YAML
+* ``validate`` - building the ``DiagramModel``
+* ``to_internal`` - compiling the model into a ``Diagram``
+* ``state_machine`` - creating a session's StateMachine
+* ``get_page`` - building the page of a session's state
+* ``trigger_transition`` and ``handle_event`` - ATController's own
+  ``_trigger_transition`` and ``_handle_event``, the work done for these
+  calls inside the session's mailbox including the render, on a stub
+  component in place of the message bus
+
+Times are per operation: the best and median of ``--repeat`` runs of a
+phase, and the p95 of single operations of all runs.
+"""
+import argparse
+import asyncio
+import gc
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+
+import yaml
+from at_queue.core.at_component import ATComponent
+from at_queue.core.session import ConnectionParameters
+
+from at_controller.core.controller import ATController
+from at_controller.core.fsm import StateMachine
+from at_controller.diagram.models.diagram import DiagramModel
+from benchmarks.generator import generate_scenario
+from benchmarks.load import CONNECTION
+
+# validating a condition costs ~25x more per nesting level, "deep" keeps an eye on it
+SCENARIOS = {
+    "small": {"states": 10, "transitions": 20, "frames": 2, "events": 5, "condition_depth": 2},
+    "medium": {"states": 50, "transitions": 200, "frames": 4, "events": 20, "condition_depth": 2},
+    "large": {"states": 200, "transitions": 1000, "frames": 8, "events": 40, "condition_depth": 1},
+    "deep": {"states": 10, "transitions": 20, "frames": 2, "events": 1, "condition_depth": 3},
+}
+
+PHASES = ["yaml_load", "validate", "to_internal", "state_machine", "get_page", "trigger_transition", "handle_event"]
+
+
+class StubComponent(ATComponent):
+    """ATComponent answering the controller's calls in process, in place of the message bus.
+
+    Every component is registered; event handlers answer with the event's
+    data, any other call - render_page included - with None.
+    """
+
+    calls = 0
+
+    async def check_external_registered(self, component: str, *args, **kwargs) -> bool:
+        return True
+
+    async def exec_external_method(self, reciever: str, methode_name: str, method_args: dict = None, **kwargs):
+        self.calls += 1
+        if method_args and "event" in method_args:
+            return method_args.get("data")
+        return None
+
+    async def get_user_id_or_token(self, auth_token: str, *args, **kwargs):
+        return auth_token
+
+
+class StubController(ATController, StubComponent):
+    """ATController on the stub component, its own code runs unchanged."""
+
+    def __init__(self, **kwargs):
+        super().__init__(connection_parameters=ConnectionParameters(**CONNECTION), **kwargs)
+
+
+def summarize(runs: List[List[float]]) -> Dict[str, Any]:
+    per_run = [sum(run) / len(run) for run in runs]
+    operations = sorted(duration for run in runs for duration in run)
+    return {
+        "operations": len(runs[0]),
+        "best_us": min(per_run) * 1e6,
+        "median_us": statistics.median(per_run) * 1e6,
+        "p95_us": operations[int(len(operations) * 0.95) - 1 if len(operations) > 1 else 0] * 1e6,
+    }
+
+
+def time_each(items: List[Any], operation: Callable[[Any], Any]) -> List[float]:
+    durations = []
+    clock = time.perf_counter
+    for item in items:
+        started = clock()
+        operation(item)
+        durations.append(clock() - started)
+    return durations
+
+
+async def time_each_async(items: List[Any], operation: Callable[[Any], Any]) -> List[float]:
+    durations = []
+    clock = time.perf_counter
+    for item in items:
+        started = clock()
+        await operation(item)
+        durations.append(clock() - started)
+    return durations
+
+
+def run_scenario(parameters: Dict[str, int], sessions: int, operations: int, repeat: int) -> Dict[str, Any]:
+    scenario = generate_scenario(**parameters)
+    text = yaml.safe_dump(scenario, allow_unicode=True)
+    data = yaml.safe_load(text)
+    model = DiagramModel(**data)
+    diagram = model.to_internal()
+
+    events_by_state: Dict[str, List[str]] = {}
+    for transition in scenario["transitions"].values():
+        if transition.get("type") == "event":
+            events_by_state.setdefault(transition["source"], []).append(transition["event"])
+    event_names = list(scenario.get("events", {})) + ["not_handled"]
+
+    def new_sessions(controller: StubController) -> List[StateMachine]:
+        processes = []
+        for i in range(sessions):
+            process = StateMachine(controller, f"token-{i}", diagram)
+            process.attributes["selected_kb"] = i
+            controller.state_machines[i] = process
+            controller.scenarios[i] = diagram
+            processes.append(process)
+        return processes
+
+    async def triggers(controller: StubController, rng: random.Random) -> List[float]:
+        steps = [rng.randrange(sessions) for _ in range(operations)]
+
+        async def step(user: int):
+            process = controller.state_machines[user]
+            exits = diagram.get_state_exit_transitions(process.state)
+            if exits:
+                trigger = exits[rng.randrange(len(exits))].name
+                await controller._trigger_transition(user, trigger, {}, None, process.auth_token)
+
+        return await time_each_async(steps, step)
+
+    async def events(controller: StubController, rng: random.Random) -> List[float]:
+        steps = [rng.randrange(sessions) for _ in range(operations)]
+
+        async def step(user: int):
+            process = controller.state_machines[user]
+            # mostly events the current state reacts to, some that fail the condition or nobody handles
+            handled = events_by_state.get(process.state)
+            roll = rng.random()
+            event = rng.choice(handled) if handled and roll < 0.6 else rng.choice(event_names)
+            data = {"result": roll} if roll < 0.8 else {"other": roll}
+            await controller._handle_event(user, event, data, {}, process.auth_token)
+
+        return await time_each_async(steps, step)
+
+    phases = {name: [] for name in PHASES}
+    component = StubComponent(connection_parameters=ConnectionParameters(**CONNECTION))
+    for run in range(repeat):
+        gc.collect()
+        phases["yaml_load"].append(time_each([text], yaml.safe_load))
+        phases["validate"].append(time_each([data], lambda data: DiagramModel(**data)))
+        phases["to_internal"].append(time_each([model], lambda model: model.to_internal()))
+        phases["state_machine"].append(
+            time_each(range(sessions), lambda i: StateMachine(component, f"token-{i}", diagram))
+        )
+
+        controller = StubController()
+        processes = new_sessions(controller)
+        rng = random.Random(run)
+        pages = [(processes[i % sessions], diagram.states[i % len(diagram.states)].name) for i in range(operations)]
+
+        def get_page(item):
+            process, state = item
+            process.state = state
+            diagram.get_state(state).get_page(process)
+
+        phases["get_page"].append(time_each(pages, get_page))
+
+        for process in processes:
+            process.state = diagram.transition_table.initial
+        phases["trigger_transition"].append(asyncio.run(triggers(controller, rng)))
+        phases["handle_event"].append(asyncio.run(events(controller, rng)))
+
+    return {
+        "parameters": parameters,
+        "phases": {name: summarize(runs) for name, runs in phases.items()},
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(base_path: str, new_path: str, threshold: float):
+    base = json.load(open(base_path))
+    new = json.load(open(new_path))
+    print(f"{base.get('commit')} -> {new.get('commit')}, median us/op")
+    print(f"{'scenario':>10} {'phase':>20} {'base':>12} {'new':>12} {'ratio':>7}")
+    regressions = 0
+    for name, result in new["scenarios"].items():
+        if name not in base["scenarios"]:
+            continue
+        for phase, timing in result["phases"].items():
+            before = base["scenarios"][name]["phases"].get(phase)
+            if before is None:
+                continue
+            ratio = timing["median_us"] / before["median_us"] if before["median_us"] else float("inf")
+            flag = " !" if ratio > 1 + threshold else ""
+            regressions += bool(flag)
+            print(
+                f"{name:>10} {phase:>20} {before['median_us']:>12.2f} {timing['median_us']:>12.2f} {ratio:>6.2f}x{flag}"
+            )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS), help="Default: all of them")
+    parser.add_argument("--states", type=int, help="Adds a custom scenario with this many states")
+    parser.add_argument("--transitions", type=int, default=100)
+    parser.add_argument("--frames", type=int, default=2)
+    parser.add_argument("--events", type=int, default=10)
+    parser.add_argument("--condition-depth", type=int, default=1)
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--operations", type=int, default=2000, help="Operations per phase and run")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="JSON file for the results, printed when omitted")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "NEW"), help="Compare two result files")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Slowdown flagged as a regression")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+
+    results = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.time(),
+        "settings": {"sessions": args.sessions, "operations": args.operations, "repeat": args.repeat},
+        "scenarios": {},
+    }
+    scenarios = {name: SCENARIOS[name] for name in args.scenario or ([] if args.states else SCENARIOS)}
+    if args.states:
+        scenarios["custom"] = {
+            "states": args.states,
+            "transitions": args.transitions,
+            "frames": args.frames,
+            "events": args.events,
+            "condition_depth": args.condition_depth,
+        }
+    for name, parameters in scenarios.items():
+        results["scenarios"][name] = run_scenario(parameters, args.sessions, args.operations, args.repeat)
+        phases = results["scenarios"][name]["phases"]
+        print(
+            f"{name}: " + ", ".join(f"{phase} {phases[phase]['median_us']:.1f} us" for phase in PHASES), file=sys.stderr
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+from at_controller.core.cache import TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_and_counters():
+    clock = Clock()
+    cache = TTLCache(max_size=10, ttl=10, clock=clock)
+    assert cache.lookup("token") == (False, None)
+
+    cache.set("token", 1)
+    cache.set("unresolved", "unresolved", ttl=1)
+    assert cache.lookup("token") == (True, 1)
+
+    clock.now = 5
+    assert cache.get("unresolved") is None
+    assert cache.get("token") == 1
+
+    clock.now = 10
+    assert cache.get("token") is None
+    assert cache.stats == {"size": 0, "hits": 2, "misses": 3, "expired": 2, "evicted": 0, "invalidated": 0}
+
+
+def test_lru_eviction():
+    cache = TTLCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats["evicted"] == 1
+
+
+def test_invalidation():
+    cache = TTLCache()
+    for token, user in [("a", 1), ("b", 1), ("c", 2)]:
+        cache.set(token, user)
+    assert cache.invalidate("c") and not cache.invalidate("c")
+    assert cache.invalidate_where(lambda _, user: user == 1) == 2
+    assert len(cache) == 0 and cache.stats["invalidated"] == 3
@@ -0,0 +1,185 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+import yaml
+
+from at_controller.core.fsm import SafeDict
+from at_controller.diagram.models.functions import FunctionModel
+from at_controller.diagram.models.transitions import Transitions
+from at_controller.diagram.state.compiler import compile_action_value
+from at_controller.diagram.state.compiler import compile_call
+from at_controller.diagram.state.compiler import compile_value
+from at_controller.diagram.state.functions import AndFunction
+from at_controller.diagram.state.functions import BinaryFunction
+from at_controller.diagram.state.functions import EventData
+from at_controller.diagram.state.functions import Function
+from at_controller.diagram.state.functions import GetAttribute
+from at_controller.diagram.state.functions import InitialEventData
+from at_controller.diagram.state.functions import OrFunction
+from at_controller.diagram.state.functions import UnaryFunction
+
+EXPRESSIONS = [
+    "{get_attribute: skills_result}",
+    "$event_data",
+    "{event_data: [result, stage_done]}",
+    "$initial_event_data",
+    "$auth_token",
+    "{frame_url: kb_editor}",
+    "{frame_url: {frame_id: kb_editor, parse: {regexp: '.*/knowledge_bases/(\\d+)/?', group: 0}}}",
+    "{frame_url: {frame_id: docs, parse: {regexp: '.*/knowledge_bases/(\\d+)/?', group: 0}}}",
+    "{not: {get_attribute: attempts}}",
+    "{len: {get_attribute: skills_result}}",
+    "{is_null: {get_attribute: missing}}",
+    "{state_attr: attempts}",
+    "{neg: {frame_url: kb_editor}}",
+    "{add: {left_value: {get_attribute: attempts}, right_value: 1}}",
+    "{div: {left_value: 1, right_value: {get_attribute: attempts}}}",
+    "{has_attr: {left_value: {get_attribute: skills_result}, right_value: stage_done}}",
+    "{get_attr: {left_value: {get_attribute: skills_result}, right_value: stage_done}}",
+    "{get_attr: {left_value: $event_data, right_value: result}}",
+    "{equal: {left_value: {frame_url: kb_editor}, right_value: x}}",
+    "{norm: [3, 4]}",
+    "{and: []}",
+    "{or: []}",
+    "{and: [1, 0, {get_attribute: attempts}]}",
+    "{or: [0, '', {get_attribute: attempts}]}",
+    "{and: [$initial_event_data, {frame_url: kb_editor}]}",
+    """
+or:
+  - not:
+      has_attr:
+        left_value: { get_attribute: skills_result }
+        right_value: stage_done
+  - and:
+      - has_attr:
+          left_value: { get_attribute: skills_result }
+          right_value: stage_done
+      - not:
+          get_attr:
+            left_value: { get_attribute: skills_result }
+            right_value: stage_done
+""",
+    "{config: {kb: {id: {get_attribute: selected_kb}}, token: $auth_token, items: [$event_data, 1]}}",
+]
+
+CONTEXTS = [
+    dict(attributes={}, frames={}, event_data=None, initial_event_data=None),
+    dict(
+        attributes={"attempts": 0, "skills_result": {"stage_done": True}, "selected_kb": 5},
+        frames={"kb_editor": "http://editor/knowledge_bases/12/types", "docs": "/docview"},
+        event_data={"result": {"stage_done": False}},
+        initial_event_data={"result": 1},
+    ),
+    dict(
+        attributes={"attempts": 3, "skills_result": {"stage_done": False}},
+        frames={"kb_editor": "x"},
+        event_data={"result": "done"},
+        initial_event_data=[1, 2],
+    ),
+]
+
+
+def state_machine(attributes):
+    values = SafeDict()
+    values.update(attributes)
+    return SimpleNamespace(attributes=values, auth_token="token")
+
+
+def outcome(evaluate):
+    try:
+        return "ok", evaluate()
+    except Exception as e:
+        return "error", type(e)
+
+
+def assert_same(function, context):
+    machine = state_machine(context["attributes"])
+    frames, event_data, initial = context["frames"], context["event_data"], context["initial_event_data"]
+
+    expected = outcome(lambda: function.call(machine, frames, event_data, initial))
+    assert outcome(lambda: compile_call(function)(machine, frames, event_data, initial)) == expected
+
+    expected = outcome(lambda: function.exec(machine, frames, event_data=event_data, **function.kwargs))
+    assert outcome(lambda: compile_action_value(function)(machine, frames, event_data, initial)) == expected
+
+
+def build(expression):
+    return FunctionModel.build_functions(FunctionModel.find_function_models(yaml.safe_load(expression)))
+
+
+@pytest.mark.parametrize("expression", EXPRESSIONS)
+@pytest.mark.parametrize("context", CONTEXTS)
+def test_expressions(expression, context):
+    value = build(expression)
+    machine = state_machine(context["attributes"])
+    frames, event_data = context["frames"], context["event_data"]
+
+    expected = outcome(lambda: Function.search_and_call_functions(value, machine, frames, event_data=event_data))
+    assert outcome(lambda: compile_value(value)(machine, frames, event_data)) == expected
+
+    if isinstance(value, Function):
+        assert_same(value, context)
+
+
+def random_tree(rng: random.Random, depth: int):
+    if depth == 0 or rng.random() < 0.2:
+        return rng.choice(
+            [
+                GetAttribute(kwargs={"attribute": rng.choice(["attempts", "skills_result", "missing"])}),
+                EventData(name="event_data", kwargs={"key_path": rng.choice([[], ["result"]])}),
+                InitialEventData(name="initial_event_data", kwargs={"key_path": []}),
+                rng.choice([0, 1, True, False, "stage_done", None]),
+            ]
+        )
+    kind = rng.choice(["and", "or", "unary", "binary"])
+    if kind == "and":
+        return AndFunction(
+            name="and", kwargs={"items": [random_tree(rng, depth - 1) for _ in range(rng.randint(0, 3))]}
+        )
+    if kind == "or":
+        return OrFunction(name="or", kwargs={"items": [random_tree(rng, depth - 1) for _ in range(rng.randint(0, 3))]})
+    if kind == "unary":
+        return UnaryFunction(
+            name=rng.choice(["not", "is_null", "len", "state_attr"]), kwargs={"value": random_tree(rng, depth - 1)}
+        )
+    return BinaryFunction(
+        name=rng.choice(["equal", "has_attr", "get_attr", "logical_or", "add"]),
+        kwargs={"left_value": random_tree(rng, depth - 1), "right_value": random_tree(rng, depth - 1)},
+    )
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_random_trees(seed):
+    rng = random.Random(seed)
+    function = random_tree(rng, 4)
+    if not isinstance(function, Function):
+        function = AndFunction(name="and", kwargs={"items": [function]})
+    for context in CONTEXTS:
+        assert_same(function, context)
+
+
+def test_transition_condition():
+    transitions = Transitions(
+        **yaml.safe_load(
+            """
+all_types_updated:
+  type: event
+  event: kbTypes/update
+  source: building_types
+  dest: building_types
+  trigger_condition:
+    and:
+      - has_attr:
+          left_value: { get_attribute: skills_result }
+          right_value: stage_done
+      - get_attr:
+          left_value: { get_attribute: skills_result }
+          right_value: stage_done
+"""
+        )
+    ).to_internal()
+    condition = transitions[0].compiled_condition
+    assert condition(state_machine({"skills_result": {"stage_done": True}}), {}, None, None) is True
+    assert condition(state_machine({"skills_result": {"stage_done": False}}), {}, None, None) is False
+    assert condition(state_machine({"skills_result": {}}), {}, None, None) is False
@@ -0,0 +1,613 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("at_queue")
+pytest.importorskip("at_config")
+
+from at_queue.core.session import ConnectionParameters  # noqa: E402
+
+from at_controller.core.metrics import REGISTRY  # noqa: E402
+from at_controller.core.router import ATControllerRouter  # noqa: E402
+from at_controller.core.sessions import FileSessionStore  # noqa: E402
+from at_controller.core.sessions import SqliteSessionStore  # noqa: E402
+from at_controller.core.sharding import ROUTER_NAME  # noqa: E402
+from at_controller.core.sharding import shard_of  # noqa: E402
+from at_controller.core.sharding import worker_name  # noqa: E402
+from at_controller.core.tokens import UNRESOLVED_TOKEN_TTL  # noqa: E402
+from benchmarks.load import CONNECTION  # noqa: E402
+from benchmarks.load import EchoComponent  # noqa: E402
+from benchmarks.load import FakeRenderer  # noqa: E402
+from benchmarks.load import LOOPBACK_ROUTER_TOKEN  # noqa: E402
+from benchmarks.load import LoopbackBus  # noqa: E402
+from benchmarks.load import LoopbackComponent  # noqa: E402
+from benchmarks.load import LoopbackController  # noqa: E402
+
+
+# auth token of the instructor calling the operator methods
+OPERATOR = "operator"
+
+
+def state(label, initial=False):
+    return {"label": label, "initial": initial, "frame_rows": {"docs": {"src": f"/docview?docs={label}"}}}
+
+
+def link(source, dest):
+    return {"type": "link", "source": source, "dest": dest, "position": "footer", "label": dest}
+
+
+SCENARIO = {
+    "initial_attributes": {"attempts": 0},
+    "states": {"a": state("A", initial=True), "b": state("B"), "c": state("C")},
+    "transitions": {
+        "to_b": link("a", "b"),
+        "to_a": link("b", "a"),
+        "to_c": link("b", "c"),
+        "passed": {
+            "type": "event",
+            "event": "result",
+            "source": "a",
+            "dest": "b",
+            "trigger_condition": {
+                "greater_than": {
+                    "left_value": {"get_attr": {"left_value": "$event_data", "right_value": "score"}},
+                    "right_value": 0.5,
+                }
+            },
+            "actions": [{"set_attribute": {"attribute": "attempts", "value": 1}}],
+        },
+        "retry": {
+            "type": "event",
+            "event": "reset",
+            "source": "b",
+            "dest": "a",
+            "trigger_condition": {"get_attr": {"left_value": "$event_data", "right_value": "again"}},
+        },
+    },
+}
+
+
+class SlowRenderer(FakeRenderer):
+    """Renderer that records the pages it is rendering at the same time."""
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__(latency)
+        self.active = set()
+        self.overlapped = []
+        self.max_active = 0
+
+    async def render_page(self, page: dict, auth_token: str = None):
+        if auth_token in self.active:
+            self.overlapped.append(auth_token)
+        self.active.add(auth_token)
+        self.max_active = max(self.max_active, len(self.active))
+        try:
+            await super().render_page(page, auth_token)
+        finally:
+            self.active.discard(auth_token)
+
+
+class CountingComponent(LoopbackComponent):
+    """Loopback component that counts the tokens it was asked to resolve."""
+
+    resolved = None
+
+    async def get_user_id_or_token(self, auth_token: str, *args, **kwargs):
+        self.resolved = (self.resolved or 0) + 1
+        return await super().get_user_id_or_token(auth_token, *args, **kwargs)
+
+
+class CountingController(LoopbackController, CountingComponent):
+    """ATController's token cache sits in front of the counting component."""
+
+
+class LateReplyRenderer(FakeRenderer):
+    """Renderer that shows a page as soon as it arrives and answers later."""
+
+    async def render_page(self, page: dict, auth_token: str = None):
+        self.pages[auth_token] = page
+        self.rendered += 1
+        await asyncio.sleep(self.latency)
+
+
+class FailingRenderer(FakeRenderer):
+    async def render_page(self, page: dict, auth_token: str = None):
+        raise RuntimeError("renderer is down")
+
+
+class LoopbackRouter(ATControllerRouter, CountingComponent):
+    def __init__(self, bus: LoopbackBus, **kwargs):
+        super().__init__(connection_parameters=ConnectionParameters(**CONNECTION), **kwargs)
+        self.bus = bus
+
+
+def controller_on_bus(renderer=None, controller_class=LoopbackController, **kwargs):
+    bus = LoopbackBus()
+    renderer = renderer or FakeRenderer()
+    kwargs.setdefault("operator_tokens", [OPERATOR])
+    controller = controller_class(bus, **kwargs)
+    bus.register(ROUTER_NAME, controller)
+    bus.register("ATRenderer", renderer)
+    return controller, renderer
+
+
+async def evictions_done(controller):
+    if controller.eviction is not None:
+        await controller.eviction
+
+
+def configuration(scenario):
+    """What ATConfigurator passes to perform_configurate."""
+    return SimpleNamespace(items={"scenario": SimpleNamespace(data=scenario)})
+
+
+def label(page):
+    return page["header"]["label"]
+
+
+def test_calls_of_a_session_run_one_at_a_time():
+    async def scenario():
+        controller, renderer = controller_on_bus(SlowRenderer(0.01))
+        for token in ("learner-1", "learner-2"):
+            await controller.configure_scenario(SCENARIO, LOOPBACK_ROUTER_TOKEN, auth_token=token)
+
+        states = await asyncio.gather(
+            *(
+                controller.trigger_transition(trigger, {}, auth_token=token)
+                for token in ("learner-1", "learner-2")
+                for trigger in ("to_b", "to_a", "to_b")
+            )
+        )
+        return renderer, states
+
+    renderer, states = asyncio.run(scenario())
+    assert states == ["b", "a", "b"] * 2
+    assert renderer.overlapped == []
+    assert label(renderer.pages["learner-1"]) == label(renderer.pages["learner-2"]) == "B"
+    # the two sessions render side by side
+    assert renderer.max_active == 2
+
+
+def test_event_batch_is_applied_in_order_and_rendered_once():
+    async def scenario():
+        controller, renderer = controller_on_bus()
+        await controller.configure_scenario(SCENARIO, LOOPBACK_ROUTER_TOKEN, auth_token="learner-1")
+        rendered = renderer.rendered
+        result = await controller.handle_events(
+            [
+                ["result", {"score": 0.2}],
+                {"event": "result", "data": {"score": 0.9}, "frames": {}},
+                ["reset", {"again": True}],
+                ["result", {"score": 0.7}, {}],
+                ["unknown", 1],
+            ],
+            auth_token="learner-1",
+        )
+        return result, renderer.rendered - rendered, renderer.pages["learner-1"]
+
+    result, rendered, page = asyncio.run(scenario())
+    assert result == {"state": "b", "results": [{"score": 0.2}, "b", "a", "b", 1]}
+    assert rendered == 1 and label(page) == "B"
+
+
+def test_failing_event_keeps_the_items_before_it():
+    async def scenario():
+        controller, renderer = controller_on_bus()
+        await controller.configure_scenario(SCENARIO, LOOPBACK_ROUTER_TOKEN, auth_token="learner-1")
+        rendered = renderer.rendered
+        with pytest.raises(KeyError):
+            # the condition of the second item reads a key that is not there
+            await controller.handle_events(
+                [["result", {"score": 0.9}], ["reset", {}], ["reset", {"again": True}]],
+                auth_token="learner-1",
+            )
+        return controller.state_machines[1], renderer.rendered - rendered, renderer.pages["learner-1"]
+
+    process, rendered, page = asyncio.run(scenario())
+    assert process.state == "b" and process.attributes["attempts"] == 1
+    # the state the batch stopped in is shown
+    assert rendered == 1 and label(page) == "B"
+
+
+def test_metrics_count_calls_after_a_reset():
+    def value(metrics, name, **labels):
+        series = [series["value"] for series in metrics[name]["series"] if series["labels"] == labels]
+        return series[0] if series else None
+
+    async def scenario():
+        controller, _ = controller_on_bus()
+        await controller.configure_scenario(SCENARIO, LOOPBACK_ROUTER_TOKEN, auth_token="learner-1")
+        # handles the controller and the actions looked up at import keep counting after a reset
+        REGISTRY.reset()
+        await controller.handle_event("result", {"score": 0.9}, auth_token="learner-1")
+        await controller.handle_event("result", {"score": 0.9}, auth_token="learner-1")
+
+    asyncio.run(scenario())
+    metrics = REGISTRY.snapshot()
+    assert value(metrics, "at_controller_call_seconds", method="handle_event")["count"] == 2
+    assert value(metrics, "at_controller_transitions_total") == 1
+    assert value(metrics, "at_controller_events_total", outcome="triggered") == 1
+    assert value(metrics, "at_controller_actions_total", type="set_attribute") == 1
+    assert value(metrics, "at_controller_renders_total", result="sent") == 1
+
+
+def test_metrics_are_for_operators():
+    async def scenario():
+        bus = LoopbackBus()
+        router = LoopbackRouter(bus, operator_tokens=["operator"])
+        worker = LoopbackController(bus, name=worker_name(0), operator_tokens=["operator"])
+        bus.register(router.name, router)
+        bus.register(worker.name, worker)
+        for component in (router, worker):
+            with pytest.raises(PermissionError):
+                await component.get_metrics(auth_token="learner-1")
+        return await router.get_metrics(format="prometheus", auth_token="operator")
+
+    metrics = asyncio.run(scenario())
+    assert "# TYPE at_controller_call_seconds histogram" in metrics[worker_name(0)]
+
+
+def test_only_operators_trace_other_users():
+    async def scenario():
+        controller, _ = controller_on_bus(operator_tokens=["operator"])
+        with pytest.raises(PermissionError):
+            await controller.enable_tracing([2], auth_token="learner-1")
+        return await controller.get_tracing_stats(auth_token="operator")
+
+    assert asyncio.run(scenario())["users"] == []
+
+
+def test_expression_profile_is_for_operators():
+    async def scenario():
+        controller, _ = controller_on_bus(operator_tokens=["operator"])
+        with pytest.raises(PermissionError):
+            await controller.enable_expression_profile(auth_token="learner-1")
+        await controller.enable_expression_profile(auth_token="operator")
+        with pytest.raises(ValueError, match="Unknown sort 'time'"):
+            await controller.get_expression_profile(sort="time", auth_token="operator")
+        return await controller.get_expression_profile(auth_token="operator")
+
+    assert asyncio.run(scenario())["hottest"] == []
+
+
+def test_bulk_trigger_transition_of_listed_sessions():
+    async def scenario():
+        controller, renderer = controller_on_bus()
+        for token in ("learner-1", "learner-2"):
+            await controller.configure_scenario(SCENARIO, LOOPBACK_ROUTER_TOKEN, auth_token=token)
+        await controller.trigger_transition("to_b", {}, auth_token="learner-2")
+        result = await controller.bulk_trigger_transition("to_b", user_ids=[1, 2, 3, 1], auth_token=OPERATOR)
+        return result, renderer.pages
+
+    result, pages = asyncio.run(scenario())
+    assert result == {
+        "1": {"ok": True, "state": "b", "triggered": True},
+        "2": {"ok": True, "state": "b", "triggered": False},
+        "3": {"ok": False, "error": "No process found for this user"},
+    }
+    assert label(pages["learner-1"]) == "B"
+
+
+def test_bulk_operations_include_evicted_sessions_of_the_scenario(tmp_path):
+    other = {**SCENARIO, "initial_attributes": {"attempts": 5}}
+
+    async def scenario():
+        controller, _ = controller_on_bus(max_sessions=1, session_store=FileSessionStore(str(tmp_path)))
+        for token in ("learner-1", "learner-2"):
+            await controller.configure_scenario(SCENARIO, LOOPBACK_ROUTER_TOKEN, auth_token=token)
+        await controller.configure_scenario(other, LOOPBACK_ROUTER_TOKEN, auth_token="learner-3")
+        await evictions_done(controller)
+        evicted = set(controller.session_store.scenario_keys()) - set(controller.state_machines)
+        keys = await controller.get_session_scenarios(auth_token=OPERATOR)
+        key = keys["1"]
+
+        triggered = await controller.bulk_trigger_transition("to_b", scenario_hash=key, auth_token=OPERATOR)
+        reloaded = await controller.bulk_reload_process(scenario_hash=key, user_ids=[1, 3], auth_token=OPERATOR)
+        return evicted, keys, triggered, reloaded
+
+    evicted, keys, triggered, reloaded = asyncio.run(scenario())
+    assert evicted == {1, 2}
+    assert set(keys) == {"1", "2", "3"} and keys["1"] == keys["2"] != keys["3"]
+    assert triggered == {
+        "1": {"ok": True, "state": "b", "triggered": True},
+        "2": {"ok": True, "state": "b", "triggered": True},
+    }
+    assert reloaded == {"1": {"ok": True, "state": "a"}}
+
+
+def test_bulk_operations_need_sessions():
+    controller, _ = controller_on_bus()
+    with pytest.raises(ValueError):
+        asyncio.run(controller.bulk_reload_process(auth_token=OPERATOR))
+
+
+def test_bulk_operations_are_for_operators():
+    async def scenario():
+        controller, _ = controller_on_bus()
+        await controller.configure_scenario(SCENARIO, LOOPBACK_ROUTER_TOKEN, auth_token="learner-1")
+        for call in (
+            controller.bulk_trigger_transition("to_b", user_ids=[1], auth_token="learner-1"),
+            controller.bulk_reload_process(user_ids=[1], auth_token="learner-1"),
+            controller.get_session_scenarios(auth_token="learner-1"),
+        ):
+            with pytest.raises(PermissionError):
+                await call
+        return controller.state_machines[1].state
+
+    assert asyncio.run(scenario()) == "a"
+
+
+def test_token_cache_and_stats_are_for_operators():
+    async def scenario():
+        controller, _ = controller_on_bus()
+        await controller.configure_scenario(SCENARIO, LOOPBACK_ROUTER_TOKEN, auth_token="learner-1")
+        for call in (
+            controller.invalidate_token_cache(auth_token="learner-1"),
+            controller.get_token_cache_stats(auth_token="learner-1"),
+            controller.get_registration_stats(auth_token="learner-1"),
+            controller.get_render_stats(auth_token="learner-1"),
+            controller.get_session_store_stats(auth_token="learner-1"),
+        ):
+            with pytest.raises(PermissionError):
+                await call
+        return controller.token_cache.stats, await controller.get_token_cache_stats(auth_token=OPERATOR)
+
+    before, after = asyncio.run(scenario())
+    # the refused invalidation dropped nothing
+    assert after["size"] == before["size"] == 1
+
+
+def test_tokens_are_resolved_once_per_ttl():
+    now = [0.0]
+
+    async def scenario():
+        controller, _ = controller_on_bus(controller_class=CountingController)
+        controller.token_cache.clock = lambda: now[0]
+        await controller.configure_scenario(SCENARIO, LOOPBACK_ROUTER_TOKEN, auth_token="learner-1")
+        for _ in range(3):
+            await controller.trigger_transition("to_b", {}, auth_token="learner-1")
+        cached = controller.resolved
+
+        await controller.invalidate_token_cache(["learner-1"], auth_token=OPERATOR)
+        await controller.trigger_transition("to_a", {}, auth_token="learner-1")
+        invalidated = controller.resolved
+
+        # a token that does not resolve is its own session, asked about again soon
+        assert await controller.get_user_id_or_token("guest") == "guest"
+        now[0] += UNRESOLVED_TOKEN_TTL
+        await controller.get_user_id_or_token("guest")
+        await controller.get_user_id_or_token("learner-1")
+        return cached, invalidated, controller.resolved, controller.state_machines
+
+    cached, invalidated, resolved, sessions = asyncio.run(scenario())
+    assert (cached, invalidated, resolved) == (1, 2, 4)
+    assert sessions[1].state == "a"
+
+
+def test_components_are_checked_once_a_scenario_compiles(tmp_path):
+    handled = {
+        **SCENARIO,
+        "events": {"result": {"handler_component": "ATTutoringSkills", "handler_method": "handle_result"}},
+    }
+
+    async def scenario():
+        checks = []
+        for _ in range(2):
+            # the second controller starts on the sessions the first one left in the store
+            controller, _ = controller_on_bus(session_store=FileSessionStore(str(tmp_path)), snapshot_interval=60)
+            controller.bus.register("ATTutoringSkills", EchoComponent())
+            if not checks:
+                for token in ("learner-1", "learner-2"):
+                    await controller.configure_scenario(handled, LOOPBACK_ROUTER_TOKEN, auth_token=token)
+                state = await controller.handle_event("result", {"score": 0.9}, auth_token="learner-1")
+            else:
+                state = await controller.trigger_transition("to_a", {}, auth_token="learner-1")
+            checks.append((state, controller.registrations.stats["checks"]))
+            await controller.flush_sessions()
+        return checks
+
+    assert asyncio.run(scenario()) == [("b", 1), ("a", 1)]
+
+
+def test_renders_are_inline_by_default():
+    async def scenario():
+        controller, _ = controller_on_bus(FailingRenderer())
+        assert controller.render_scheduler is None
+        with pytest.raises(RuntimeError):
+            await controller.configure_scenario(SCENARIO, LOOPBACK_ROUTER_TOKEN, auth_token="learner-1")
+        # the failure reaches the caller of the transition too
+        with pytest.raises(RuntimeError):
+            await controller.trigger_transition("to_b", {}, auth_token="learner-1")
+        return controller.state_machines[1].state
+
+    assert asyncio.run(scenario()) == "b"
+
+
+def test_superseded_render_does_not_hide_the_next_page():
+    async def scenario():
+        controller, renderer = controller_on_bus(LateReplyRenderer(0.05), render_window=0)
+        await controller.configure_scenario(SCENARIO, LOOPBACK_ROUTER_TOKEN, auth_token="learner-1")
+        await controller.trigger_transition("to_b", {}, auth_token="learner-1")
+        # the page of B reached the renderer, its answer has not
+        await asyncio.sleep(0.01)
+        shown = label(renderer.pages["learner-1"])
+        await controller.trigger_transition("to_a", {}, auth_token="learner-1")
+        await controller.render_scheduler.flush()
+        return shown, label(renderer.pages["learner-1"])
+
+    assert asyncio.run(scenario()) == ("B", "A")
+
+
+class BlockingStore(FileSessionStore):
+    """Store whose writes wait until the test lets them through."""
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.writable = threading.Event()
+
+    def save(self, snapshot):
+        self.writable.wait(5)
+        super().save(snapshot)
+
+
+def test_idle_sessions_over_the_budget_are_evicted_and_rehydrated(tmp_path):
+    async def scenario():
+        store = BlockingStore(str(tmp_path))
+        controller, renderer = controller_on_bus(max_sessions=2, session_store=store)
+        await controller.configure_scenario(SCENARIO, LOOPBACK_ROUTER_TOKEN, auth_token="learner-1")
+        await controller.handle_event("result", {"score": 0.9}, auth_token="learner-1")
+        for token in ("learner-2", "learner-3", "learner-4"):
+            # eviction writes in the background, the calls that went over the budget return before
+            await asyncio.wait_for(controller.configure_scenario(SCENARIO, LOOPBACK_ROUTER_TOKEN, auth_token=token), 1)
+        assert controller.eviction is not None
+        store.writable.set()
+        await evictions_done(controller)
+        in_memory = set(controller.state_machines)
+
+        state = await controller.trigger_transition("to_c", {}, auth_token="learner-1")
+        process = controller.state_machines[1]
+        await evictions_done(controller)
+        stats = await controller.get_session_store_stats(auth_token=OPERATOR)
+        return in_memory, state, process, stats, renderer.pages["learner-1"]
+
+    in_memory, state, process, stats, page = asyncio.run(scenario())
+    assert in_memory == {3, 4}
+    assert state == "c" and process.attributes["attempts"] == 1 and label(page) == "C"
+    assert stats["sessions"] == 2 and stats["evictions"] == 3 and stats["rehydrations"] == 1
+
+
+def test_evicted_session_starts_a_new_process(tmp_path):
+    async def scenario():
+        controller, renderer = controller_on_bus(max_sessions=1, session_store=FileSessionStore(str(tmp_path)))
+        await controller.configure_scenario(SCENARIO, LOOPBACK_ROUTER_TOKEN, auth_token="learner-1")
+        await controller.trigger_transition("to_b", {}, auth_token="learner-1")
+        await controller.configure_scenario(SCENARIO, LOOPBACK_ROUTER_TOKEN, auth_token="learner-2")
+        await evictions_done(controller)
+        evicted = 1 not in controller.state_machines
+        state = await controller.start_process(auth_token="learner-1")
+        return evicted, state, renderer.pages["learner-1"]
+
+    evicted, state, page = asyncio.run(scenario())
+    assert evicted
+    assert state == "a" and label(page) == "A"
+
+
+def test_sessions_are_restored_from_snapshots_after_a_restart(tmp_path):
+    path = str(tmp_path / "sessions.sqlite")
+
+    async def first_run():
+        store = SqliteSessionStore(path)
+        controller, _ = controller_on_bus(session_store=store, snapshot_interval=60)
+        for token in ("learner-1", "learner-2"):
+            await controller.configure_scenario(SCENARIO, LOOPBACK_ROUTER_TOKEN, auth_token=token)
+        await controller.handle_event("result", {"score": 0.9}, auth_token="learner-1")
+        # shutdown writes the sessions changed since the last interval
+        await controller.flush_sessions()
+        store.close()
+        return controller.snapshot_writer.stats["written"]
+
+    async def second_run():
+        store = SqliteSessionStore(path)
+        controller, renderer = controller_on_bus(session_store=store, snapshot_interval=60)
+        restored = dict(controller.state_machines)
+        state = await controller.trigger_transition("to_c", {}, auth_token="learner-1")
+        process = controller.state_machines[1]
+        unknown = await controller.trigger_transition("to_b", {}, auth_token="learner-3")
+        stats = await controller.get_session_store_stats(auth_token=OPERATOR)
+        store.close()
+        return restored, state, process, unknown, stats, renderer.pages
+
+    assert asyncio.run(first_run()) == 2
+    restored, state, process, unknown, stats, pages = asyncio.run(second_run())
+    # sessions come back lazily, on their next call
+    assert restored == {}
+    assert state == "c" and process.attributes["attempts"] == 1 and process.auth_token == "learner-1"
+    assert label(pages["learner-1"]) == "C"
+    assert unknown == "No process found for this auth token"
+    assert stats["rehydrations"] == 1 and stats["misses"] == 1
+
+
+def test_sessions_of_a_previous_run_restart_and_reload(tmp_path):
+    path = str(tmp_path / "sessions.sqlite")
+
+    async def first_run():
+        store = SqliteSessionStore(path)
+        controller, _ = controller_on_bus(session_store=store, snapshot_interval=60)
+        for token in ("learner-1", "learner-2", "learner-3"):
+            await controller.configure_scenario(SCENARIO, LOOPBACK_ROUTER_TOKEN, auth_token=token)
+            await controller.trigger_transition("to_b", {}, auth_token=token)
+        await controller.flush_sessions()
+        store.close()
+
+    async def second_run():
+        store = SqliteSessionStore(path)
+        controller, renderer = controller_on_bus(session_store=store, snapshot_interval=60)
+        started = await controller.start_process(auth_token="learner-1")
+        reloaded = await controller.reload_process(auth_token="learner-2")
+        bulk = await controller.bulk_reload_process(user_ids=[3], auth_token=OPERATOR)
+        with pytest.raises(ValueError):
+            await controller.reload_process(auth_token="learner-4")
+        store.close()
+        return started, reloaded, bulk, renderer.pages
+
+    asyncio.run(first_run())
+    started, reloaded, bulk, pages = asyncio.run(second_run())
+    assert started == reloaded == "a"
+    assert bulk == {"3": {"ok": True, "state": "a"}}
+    assert label(pages["learner-1"]) == label(pages["learner-2"]) == label(pages["learner-3"]) == "A"
+
+
+def test_only_the_router_configures_scenarios():
+    async def scenario():
+        controller, _ = controller_on_bus()
+        standalone, _ = controller_on_bus(router_token=None)
+        for call in (
+            controller.configure_scenario(SCENARIO, auth_token="learner-1"),
+            controller.configure_scenario(SCENARIO, "guessed", auth_token="learner-1"),
+            standalone.configure_scenario(SCENARIO, LOOPBACK_ROUTER_TOKEN, auth_token="learner-1"),
+        ):
+            with pytest.raises(PermissionError):
+                await call
+        return controller.state_machines, standalone.state_machines
+
+    assert asyncio.run(scenario()) == ({}, {})
+
+
+def test_router_forwards_calls_to_the_worker_owning_the_session():
+    async def scenario():
+        bus = LoopbackBus()
+        router = LoopbackRouter(bus, workers=2, operator_tokens=[OPERATOR], router_token=LOOPBACK_ROUTER_TOKEN)
+        bus.register(router.name, router)
+        bus.register("ATRenderer", FakeRenderer())
+        workers = [LoopbackController(bus, name=worker_name(index), operator_tokens=[OPERATOR]) for index in range(2)]
+        for worker in workers:
+            bus.register(worker.name, worker)
+        # a learner of each worker
+        users = [next(user for user in range(1, 20) if shard_of(user, 2) == index) for index in range(2)]
+        for user in users:
+            await router.perform_configurate(configuration(SCENARIO), auth_token=f"learner-{user}")
+
+        states = [
+            await bus.call(ROUTER_NAME, "trigger_transition", {"trigger": "to_b", "frames": {}}, f"learner-{user}")
+            for user in users
+            for _ in range(2)
+        ]
+        with pytest.raises(PermissionError):
+            await router.bulk_trigger_transition("to_c", user_ids=users, auth_token=f"learner-{users[0]}")
+        with pytest.raises(PermissionError):
+            await router.invalidate_token_cache(auth_token=f"learner-{users[0]}")
+        keys = await router.get_session_scenarios(auth_token=OPERATOR)
+        bulk = await router.bulk_trigger_transition("to_c", scenario_hash=keys[str(users[0])], auth_token=OPERATOR)
+        stats = await router.get_token_cache_stats(auth_token=OPERATOR)
+        return router, workers, users, states, bulk, stats
+
+    router, workers, users, states, bulk, stats = asyncio.run(scenario())
+    assert router.name == ROUTER_NAME
+    assert [set(worker.state_machines) for worker in workers] == [{users[0]}, {users[1]}]
+    assert states == ["b", "b", "b", "b"]
+    assert bulk == {str(user): {"ok": True, "state": "c", "triggered": True} for user in users}
+    # the router resolved each token once, the workers on their own
+    assert router.resolved == 2
+    assert set(stats) == {ROUTER_NAME, worker_name(0), worker_name(1)}
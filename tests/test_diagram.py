@@ -0,0 +1,52 @@
+import pytest
+import yaml
+
+from at_controller.diagram.models.diagram import DiagramModel
+from at_controller.diagram.state.transitions import EventTransition
+
+
+@pytest.fixture
+def diagram():
+    return DiagramModel(**yaml.safe_load(open("./tests/fixtures/scenario.yaml"))).to_internal()
+
+
+def test_lookups(diagram):
+    assert diagram.get_state("building_types").name == "building_types"
+    assert diagram.get_state("missing") is None
+    assert diagram.get_transition("build_types").dest == "building_types"
+    assert diagram.get_transition("missing") is None
+    assert diagram.get_event("kbTypes/update").handler_method == "handle_kb_type_updated"
+    assert diagram.get_event("missing") is None
+
+
+def test_adjacency(diagram):
+    state = diagram.get_state("building_types")
+    exits = [t.name for t in diagram.get_state_exit_transitions(state)]
+    assert exits == ["build_basic_objects", "all_types_created", "all_types_updated"]
+    assert exits == [t.name for t in diagram.get_state_exit_transitions("building_types")]
+
+    enters = [t.name for t in diagram.get_state_enter_transitions("building_types")]
+    assert enters == ["build_types", "back_build_types"]
+
+    assert diagram.get_state_exit_transitions("missing") == []
+
+
+def test_event_dispatch_index(diagram):
+    state = diagram.get_state("building_types")
+    candidates = diagram.get_event_transitions(state, "kbTypes/update")
+    assert [t.name for t in candidates] == ["all_types_updated"]
+    assert candidates == diagram.get_event_transitions("building_types", "kbTypes/update")
+
+    # same candidates, in the same order, as filtering the exit transitions
+    for state in diagram.states:
+        for event in ["kbTypes/create", "kbTypes/update"]:
+            expected = [
+                t
+                for t in diagram.get_state_exit_transitions(state)
+                if isinstance(t, EventTransition) and t.event == event
+            ]
+            assert list(diagram.get_event_transitions(state, event)) == expected
+
+    assert diagram.get_event_transitions("building_basic_objects", "kbTypes/update") == ()
+    assert diagram.handles_event("kbTypes/create")
+    assert not diagram.handles_event("kbObjects/create")
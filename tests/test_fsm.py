@@ -0,0 +1,63 @@
+import pytest
+import yaml
+
+from at_controller.core.fsm import AttributeStore
+from at_controller.core.fsm import MachineError
+from at_controller.core.fsm import StateMachine
+from at_controller.diagram.models.diagram import DiagramModel
+
+
+@pytest.fixture
+def diagram():
+    return DiagramModel(**yaml.safe_load(open("./tests/fixtures/scenario.yaml"))).to_internal()
+
+
+def test_trigger(diagram):
+    machine = StateMachine(None, "token", diagram)
+    assert machine.state == "kb_start"
+    assert machine.attributes["auth_token"] == "token"
+
+    assert machine.may_trigger("create_kb")
+    assert machine.trigger("create_kb")
+    assert machine.state == "kb_creation"
+
+    machine.trigger("build_types")
+    assert machine.state == "building_types"
+
+
+def test_invalid_trigger(diagram):
+    machine = StateMachine(None, None, diagram)
+    assert not machine.may_trigger("build_types")
+    with pytest.raises(MachineError):
+        machine.trigger("build_types")
+    with pytest.raises(AttributeError):
+        machine.trigger("missing")
+    assert machine.state == "kb_start"
+
+
+def test_sessions_share_table(diagram):
+    first = StateMachine(None, "first", diagram)
+    second = StateMachine(None, "second", diagram)
+    first.trigger("create_kb")
+    assert first.state == "kb_creation"
+    assert second.state == "kb_start"
+
+
+def test_attribute_versions():
+    attributes = AttributeStore(a=1)
+    first = attributes.version("a")
+    assert first > 0 and attributes.version("b") == 0
+    assert attributes["b"] == "{b}"
+
+    attributes["a"] = 1
+    assert attributes.version("a") > first
+    before = attributes.versions_of(["a", "b"])
+    attributes.update(b=2)
+    attributes.setdefault("a", 5)
+    assert attributes.versions_of(["a", "b"])[0] == before[0]
+    assert attributes.versions_of(["a", "b"])[1] > before[1]
+
+    version = attributes.version("b")
+    assert attributes.pop("b") == 2
+    assert attributes.version("b") > version
+    assert attributes.pop("b", None) is None
@@ -0,0 +1,39 @@
+import shutil
+
+import pytest
+import yaml
+
+from at_controller.core.graph import HIGHLIGHT_COLOR
+from at_controller.core.graph import ScenarioGraph
+from at_controller.diagram.models.diagram import DiagramModel
+
+
+@pytest.fixture
+def graph():
+    diagram = DiagramModel(**yaml.safe_load(open("./tests/fixtures/scenario.yaml"))).to_internal()
+    return ScenarioGraph(diagram)
+
+
+def test_dot(graph):
+    base = graph.render(format="dot")
+    assert "kb_start -> kb_creation [label=create_kb]" in base
+    assert HIGHLIGHT_COLOR not in base
+
+    highlighted = graph.render("building_types", format="dot")
+    assert highlighted.startswith(base[: base.rindex("}")])
+    assert f'building_types [style="rounded,filled" fillcolor="{HIGHLIGHT_COLOR}"]' in highlighted
+    assert graph.dot is graph.dot
+
+
+def test_unsupported_format(graph):
+    with pytest.raises(ValueError):
+        graph.render("kb_start", format="png")
+
+
+@pytest.mark.skipif(shutil.which("dot") is None, reason="graphviz binary is not installed")
+def test_svg(graph):
+    base = graph.render(format="svg")
+    highlighted = graph.render("building_types", format="svg")
+    assert HIGHLIGHT_COLOR not in base
+    assert highlighted.count(HIGHLIGHT_COLOR) == 1
+    assert len(highlighted) == len(base) + len(HIGHLIGHT_COLOR) - len("none")
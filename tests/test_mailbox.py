@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+
+from at_controller.core.mailbox import Mailboxes
+from at_controller.core.mailbox import SessionMailbox
+
+
+def test_jobs_run_in_order():
+    async def scenario():
+        mailbox = SessionMailbox("user")
+        log = []
+
+        def job(name, delay):
+            async def run():
+                log.append(("start", name))
+                await asyncio.sleep(delay)
+                log.append(("end", name))
+                return name
+
+            return run
+
+        results = await asyncio.gather(*(mailbox.run(job(i, 0.01 * (3 - i))) for i in range(3)))
+        return mailbox, log, results
+
+    mailbox, log, results = asyncio.run(scenario())
+    assert results == [0, 1, 2]
+    assert log == [(kind, i) for i in range(3) for kind in ("start", "end")]
+    assert mailbox.idle and mailbox.worker is None
+    assert mailbox.metrics["processed"] == 3 and mailbox.metrics["max_depth"] == 3
+    assert mailbox.metrics["max_wait"] > 0
+
+
+def test_sessions_run_in_parallel():
+    async def scenario():
+        mailboxes = Mailboxes()
+        started = asyncio.Event()
+
+        async def first():
+            await asyncio.wait_for(started.wait(), 1)
+            return "first"
+
+        async def second():
+            started.set()
+            return "second"
+
+        return await asyncio.gather(mailboxes.run("a", first), mailboxes.run("b", second))
+
+    assert asyncio.run(scenario()) == ["first", "second"]
+
+
+def test_failed_job_does_not_stop_the_mailbox():
+    async def scenario():
+        mailbox = SessionMailbox("user")
+
+        async def fail():
+            raise ValueError("boom")
+
+        async def succeed():
+            return "ok"
+
+        failed = mailbox.submit(fail)
+        result = await mailbox.run(succeed)
+        with pytest.raises(ValueError):
+            await failed
+        return mailbox, result
+
+    mailbox, result = asyncio.run(scenario())
+    assert result == "ok"
+    assert mailbox.metrics["failed"] == 1 and mailbox.metrics["processed"] == 2
+
+
+class Interrupted(BaseException):
+    pass
+
+
+def test_cancelled_job_resolves_its_caller():
+    async def scenario():
+        mailbox = SessionMailbox("user")
+
+        async def cancelled():
+            raise asyncio.CancelledError()
+
+        async def interrupted():
+            raise Interrupted()
+
+        async def succeed():
+            return "ok"
+
+        first = mailbox.submit(cancelled)
+        result = await mailbox.run(succeed)
+        assert first.cancelled()
+
+        second = mailbox.submit(interrupted)
+        waiting = mailbox.submit(succeed)
+        with pytest.raises(Interrupted):
+            await mailbox.worker
+        assert second.cancelled() and waiting.cancelled()
+        # the next job starts a new worker
+        return mailbox, result, await mailbox.run(succeed)
+
+    mailbox, result, after = asyncio.run(scenario())
+    assert result == after == "ok"
+    assert mailbox.idle and mailbox.metrics["failed"] == 2
+
+
+def test_cancelled_worker_cancels_the_running_job():
+    async def scenario():
+        mailbox = SessionMailbox("user")
+        running = mailbox.submit(lambda: asyncio.sleep(10))
+        queued = mailbox.submit(lambda: asyncio.sleep(0))
+        await asyncio.sleep(0)
+        mailbox.worker.cancel()
+        await asyncio.sleep(0.01)
+        return mailbox, running, queued
+
+    mailbox, running, queued = asyncio.run(scenario())
+    assert running.cancelled() and queued.cancelled()
+    assert mailbox.worker is None and mailbox.idle
@@ -0,0 +1,45 @@
+import asyncio
+import os
+import signal
+
+import pytest
+
+pytest.importorskip("at_queue")
+pytest.importorskip("at_config")
+
+from at_controller.__main__ import serve  # noqa: E402
+from at_controller.core.sessions import SqliteSessionStore  # noqa: E402
+from benchmarks.load import LOOPBACK_ROUTER_TOKEN  # noqa: E402
+from benchmarks.load import LoopbackController  # noqa: E402
+from tests.test_controller import controller_on_bus  # noqa: E402
+from tests.test_controller import SCENARIO  # noqa: E402
+
+
+class ServedController(LoopbackController):
+    """Controller served until it is stopped by the signal, without a broker."""
+
+    signum = signal.SIGTERM
+
+    async def initialize(self):
+        pass
+
+    async def register(self):
+        pass
+
+    async def start(self):
+        await self.configure_scenario(SCENARIO, LOOPBACK_ROUTER_TOKEN, auth_token="learner-1")
+        await self.trigger_transition("to_b", {}, auth_token="learner-1")
+        asyncio.get_running_loop().call_soon(os.kill, os.getpid(), self.signum)
+        await asyncio.Event().wait()
+
+
+@pytest.mark.parametrize("signum", [signal.SIGTERM, signal.SIGINT])
+def test_sessions_are_written_when_the_process_is_stopped(tmp_path, signum):
+    path = str(tmp_path / "sessions.sqlite")
+    store = SqliteSessionStore(path)
+    controller, _ = controller_on_bus(controller_class=ServedController, session_store=store, snapshot_interval=60)
+    controller.signum = signum
+    asyncio.run(serve(controller, store))
+
+    snapshot = SqliteSessionStore(path).load(1)
+    assert snapshot is not None and snapshot.state == "b"
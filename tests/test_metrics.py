@@ -0,0 +1,71 @@
+import pytest
+
+from at_controller.core.metrics import Histogram
+from at_controller.core.metrics import MetricsRegistry
+
+
+def test_histogram_buckets():
+    histogram = Histogram(buckets=(0.001, 0.01))
+    for value in [0.0005, 0.001, 0.005, 1.0]:
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.cumulative() == [(0.001, 2), (0.01, 3), (float("inf"), 4)]
+    assert histogram.snapshot() == {"count": 4, "sum": 1.0065, "buckets": {"0.001": 2, "0.01": 3, "+Inf": 4}}
+
+
+def test_registry_series_and_labels():
+    registry = MetricsRegistry()
+    calls = registry.histogram("calls_seconds", "Calls", labels=("method",), buckets=(0.1,))
+    errors = registry.counter("errors_total", "Errors")
+    calls.labels("handle_event").observe(0.05)
+    calls.labels("handle_event").observe(0.5)
+    errors.inc()
+
+    assert registry.counter("errors_total") is errors
+    with pytest.raises(ValueError):
+        registry.histogram("errors_total")
+    with pytest.raises(ValueError):
+        calls.labels("handle_event", "extra")
+
+    snapshot = registry.snapshot()
+    assert snapshot["errors_total"]["series"] == [{"labels": {}, "value": 1}]
+    assert snapshot["calls_seconds"]["series"][0]["labels"] == {"method": "handle_event"}
+
+    registry.reset()
+    assert registry.snapshot()["errors_total"]["series"] == [{"labels": {}, "value": 0}]
+
+
+def test_prometheus_text(tmp_path):
+    registry = MetricsRegistry()
+    registry.histogram("calls_seconds", "Calls", labels=("method",), buckets=(0.1,)).labels('say "hi"').observe(0.05)
+    registry.counter("errors_total", "Errors").inc(2)
+
+    path = tmp_path / "metrics" / "controller.prom"
+    registry.write_prometheus(str(path))
+    assert path.read_text().splitlines() == [
+        "# HELP calls_seconds Calls",
+        "# TYPE calls_seconds histogram",
+        'calls_seconds_bucket{method="say \\"hi\\"",le="0.1"} 1',
+        'calls_seconds_bucket{method="say \\"hi\\"",le="+Inf"} 1',
+        'calls_seconds_sum{method="say \\"hi\\""} 0.05',
+        'calls_seconds_count{method="say \\"hi\\""} 1',
+        "# HELP errors_total Errors",
+        "# TYPE errors_total counter",
+        "errors_total 2",
+    ]
+
+
+def test_reset_keeps_handles():
+    registry = MetricsRegistry()
+    calls = registry.histogram("calls_seconds", "Calls", labels=("method",), buckets=(0.1,)).labels("handle_event")
+    errors = registry.counter("errors_total", "Errors")
+    calls.observe(0.05)
+    assert errors.inc() == 1
+
+    registry.reset()
+    assert calls.count == 0 and calls.sum == 0.0
+    assert errors.inc(2) == 2
+    calls.observe(0.5)
+    snapshot = registry.snapshot()
+    assert snapshot["errors_total"]["series"] == [{"labels": {}, "value": 2}]
+    assert snapshot["calls_seconds"]["series"][0]["value"]["buckets"] == {"0.1": 0, "+Inf": 1}
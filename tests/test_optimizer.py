@@ -0,0 +1,94 @@
+import random
+
+import pytest
+import yaml
+
+from at_controller.diagram.models.diagram import DiagramModel
+from at_controller.diagram.models.transitions import Transitions
+from at_controller.diagram.state.compiler import compile_action_value
+from at_controller.diagram.state.compiler import compile_condition
+from at_controller.diagram.state.functions import Function
+from at_controller.diagram.state.optimizer import optimize
+from tests.test_compiler import build
+from tests.test_compiler import CONTEXTS
+from tests.test_compiler import outcome
+from tests.test_compiler import random_tree
+from tests.test_compiler import state_machine
+
+
+@pytest.mark.parametrize(
+    "expression, expected, eliminated",
+    [
+        ("{add: {left_value: 1, right_value: 2}}", 3, 1),
+        ("{not: {equal: {left_value: 1, right_value: 2}}}", True, 2),
+        ("{and: [true, false, {get_attribute: attempts}]}", False, 2),
+        ("{or: [false, 1, {get_attribute: attempts}]}", 1, 2),
+        ("{and: []}", True, 1),
+        ("{div: {left_value: 1, right_value: 0}}", None, 0),
+        ("{state_attr: attempts}", None, 0),
+    ],
+)
+def test_folding(expression, expected, eliminated):
+    function = build(expression)
+    folded, count = optimize(function)
+    assert count == eliminated
+    if eliminated:
+        assert folded == expected
+    else:
+        assert folded is function
+
+
+def test_neutral_items():
+    function = build("{and: [true, {get_attribute: attempts}, true, {get_attribute: skills_result}, true]}")
+    folded, count = optimize(function)
+    assert count == 0
+    assert len(folded.kwargs["items"]) == 3
+    assert folded.kwargs["items"][-1] is True
+
+    folded, count = optimize(build("{or: [false, {get_attribute: attempts}, false]}"))
+    assert [type(item) for item in folded.kwargs["items"]] == [type(build("{get_attribute: a}")), bool]
+
+    folded, count = optimize(build("{or: [false, {get_attribute: attempts}]}"))
+    assert folded.name == "get_attribute"
+    assert count == 1
+
+
+@pytest.mark.parametrize("seed", range(300))
+def test_random_trees(seed):
+    rng = random.Random(seed)
+    function = random_tree(rng, 4)
+    if not isinstance(function, Function):
+        return
+    folded, count = optimize(function)
+    assert count >= 0
+    for context in CONTEXTS:
+        machine = state_machine(context["attributes"])
+        args = (machine, context["frames"], context["event_data"], context["initial_event_data"])
+        assert outcome(lambda: compile_condition(folded)(*args)) == outcome(lambda: function.call(*args))
+        assert outcome(lambda: compile_action_value(folded)(*args)) == outcome(
+            lambda: function.exec(*args[:2], event_data=args[2], **function.kwargs)
+        )
+
+
+def test_transition_report():
+    transitions = Transitions(
+        **yaml.safe_load(
+            """
+always:
+  type: event
+  source: a
+  dest: b
+  trigger_condition:
+    or:
+      - false
+      - greater_than: { left_value: 2, right_value: 1 }
+"""
+        )
+    ).to_internal()
+    assert transitions[0].trigger_condition is True
+    assert transitions[0].folded_nodes == 2
+
+
+def test_diagram_report():
+    diagram = DiagramModel(**yaml.safe_load(open("./tests/fixtures/scenario.yaml"))).to_internal()
+    assert diagram.folded_nodes == 0
@@ -0,0 +1,74 @@
+import pytest
+import yaml
+
+from at_controller.core.fsm import StateMachine
+from at_controller.diagram.models.diagram import DiagramModel
+
+
+@pytest.fixture
+def diagram():
+    return DiagramModel(**yaml.safe_load(open("./tests/fixtures/scenario.yaml"))).to_internal()
+
+
+def test_page(diagram):
+    machine = StateMachine(None, "token", diagram)
+    machine.attributes["selected_kb"] = 7
+    page = diagram.get_state("building_types").get_page(machine)
+
+    assert page["header"] == {"label": diagram.get_state("building_types").label, "links": []}
+    assert page["handlers"] == []
+    assert "footer" not in page
+    assert page["control"]["subtitle"] == "Построение типов"
+    assert [link["kwargs"]["trigger"] for link in page["control"]["links"]] == ["build_basic_objects"]
+
+    editor, docs = page["grid"]["rows"][0]["cols"]
+    assert editor["frame_id"] == "kb_editor"
+    assert editor["src"] == (
+        "http://185.17.141.230:8787/token?token=token&frame_id=kb_editor&to=%2Fknowledge_bases%2F7%2Ftypes"
+    )
+    assert editor["props"] == {"flex": 20, "style": {"height": "100%"}}
+    assert docs["src"].startswith("/docview?asFrame=true&viewing=true&docs=")
+
+
+def test_handlers(diagram):
+    machine = StateMachine(None, "token", diagram)
+    page = diagram.get_state("kb_creation").get_page(machine)
+    assert page["handlers"] == [
+        {
+            "type": "component_method",
+            "component": "ATController",
+            "method": "trigger_transition",
+            "test": "/knowledge_bases/\\d+",
+            "frame_id": "kb_editor",
+            "kwargs": {"trigger": "build_types"},
+            "framedata_field": "frames",
+        }
+    ]
+
+
+def test_skeleton_is_shared(diagram):
+    state = diagram.get_state("building_types")
+    first = state.get_page(StateMachine(None, "first", diagram))
+    second = state.get_page(StateMachine(None, "second", diagram))
+    assert first["control"] is second["control"] is state.page_skeleton.control
+    assert first["grid"] != second["grid"]
+
+
+def test_columns_are_reused_until_attributes_change(diagram):
+    machine = StateMachine(None, "token", diagram)
+    machine.attributes["selected_kb"] = 7
+    state = diagram.get_state("building_types")
+
+    editor, docs = state.get_page(machine)["grid"]["rows"][0]["cols"]
+    again = state.get_page(machine)["grid"]["rows"][0]["cols"]
+    assert again[0] is editor and again[1] is docs
+
+    machine.attributes["selected_kb"] = 8
+    changed = state.get_page(machine)["grid"]["rows"][0]["cols"]
+    assert changed[0] is not editor and changed[0]["src"].endswith("%2Fknowledge_bases%2F8%2Ftypes")
+    assert changed[1] is docs
+
+    # mutable values may change without a write, such columns are always formatted again
+    machine.attributes["selected_kb"] = {"id": 8}
+    first, second = (state.get_page(machine)["grid"]["rows"][0]["cols"][0] for _ in range(2))
+    assert first == second and first is not second
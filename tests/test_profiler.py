@@ -0,0 +1,92 @@
+from types import SimpleNamespace
+
+import pytest
+import yaml
+
+from at_controller.core.scenarios import ScenarioCache
+from at_controller.diagram.models.functions import FunctionModel
+from at_controller.diagram.state.compiler import compile_condition
+from at_controller.diagram.state.profiler import compile_profiled
+from at_controller.diagram.state.profiler import describe
+from at_controller.diagram.state.profiler import ExpressionProfile
+from at_controller.diagram.state.transitions import EventTransition
+
+CONDITION = """
+and:
+  - not: { is_null: { get_attribute: attempts } }
+  - greater_than:
+      left_value: { norm: { get_attribute: vector } }
+      right_value: { get_attr: { left_value: $event_data, right_value: limit } }
+"""
+
+
+def build(expression):
+    return FunctionModel.build_functions(FunctionModel.find_function_models(yaml.safe_load(expression)))
+
+
+def test_nodes_are_counted_by_path():
+    condition = build(CONDITION)
+    profile = ExpressionProfile()
+    profiled = compile_profiled(condition, profile, "scenario", "check")
+    machine = SimpleNamespace(attributes={"attempts": 1, "vector": [3, 4]}, auth_token="token")
+
+    for limit in [1, 10, 2]:
+        event_data = {"limit": limit}
+        expected = compile_condition(condition)(machine, {}, event_data, None)
+        assert profiled(machine, {}, event_data, None) == expected
+
+    entries = {entry["path"]: entry for entry in profile.hottest(limit=None)}
+    assert set(entries) == {
+        "and",
+        "and/0:not",
+        "and/0:not/0:is_null",
+        "and/0:not/0:is_null/0:get_attribute",
+        "and/1:greater_than",
+        "and/1:greater_than/0:norm",
+        "and/1:greater_than/0:norm/0:get_attribute",
+        "and/1:greater_than/1:get_attr",
+        "and/1:greater_than/1:get_attr/0:event_data",
+    }
+    assert {entry["calls"] for entry in entries.values()} == {3}
+    assert entries["and/1:greater_than/0:norm"]["expression"] == "norm(get_attribute('vector'))"
+    assert entries["and"]["transition"] == "check" and entries["and"]["scenario"] == "scenario"
+    assert all(0 <= entry["self_seconds"] <= entry["seconds"] for entry in entries.values())
+
+    profile.reset()
+    assert profile.snapshot()["hottest"][0]["calls"] == 0
+
+    with pytest.raises(ValueError, match="expected one of self_seconds, seconds, calls, mean_us"):
+        profile.snapshot(sort="time")
+
+
+def test_errors_are_counted():
+    profile = ExpressionProfile()
+    profiled = compile_profiled(build("{get_attr: {left_value: $event_data, right_value: x}}"), profile, "", "t")
+    with pytest.raises(KeyError):
+        profiled(SimpleNamespace(attributes={}), {}, {}, None)
+    assert sorted((entry["path"], entry["errors"]) for entry in profile.hottest()) == [
+        ("get_attr", 1),
+        ("get_attr/0:event_data", 0),
+    ]
+
+
+def test_scenario_cache_instruments_conditions():
+    with open("./tests/fixtures/scenario.yaml") as f:
+        scenario = f.read()
+    cache = ScenarioCache()
+    profile = ExpressionProfile()
+    cache.set_profile(profile)
+    key, diagram, _ = cache.acquire(scenario)
+    transitions = [transition for transition in diagram.transitions if isinstance(transition, EventTransition)]
+    assert {entry_key[:2] for entry_key in profile.nodes} == {
+        (key, transition.name) for transition in transitions if transition.trigger_condition is not None
+    }
+
+    cache.set_profile(None)
+    plain = [transition.compiled_condition for transition in transitions]
+    assert all(condition.__name__ != "profiled" for condition in plain)
+
+
+def test_describe_truncates():
+    assert describe(build("{and: [1, {get_attribute: a}]}")) == "and(1, get_attribute('a'))"
+    assert len(describe(build("{and: [" + ", ".join(["1"] * 100) + "]}"), limit=20)) == 20
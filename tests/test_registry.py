@@ -0,0 +1,34 @@
+import asyncio
+
+import yaml
+
+from at_controller.core.registry import RegistrationCache
+from at_controller.diagram.models.diagram import DiagramModel
+
+
+def test_referenced_components():
+    diagram = DiagramModel(**yaml.safe_load(open("./tests/fixtures/scenario.yaml"))).to_internal()
+    assert diagram.referenced_components == {"ATConfigurator", "ATTutoringSkills"}
+
+
+def test_registration_cache():
+    asked = []
+
+    async def ask(component):
+        asked.append(component)
+        return component != "Missing"
+
+    async def scenario():
+        cache = RegistrationCache()
+        assert await cache.warm(["A", "Missing", "A"], ask) == {"A": True, "Missing": False}
+        assert await cache.check("A", ask) and not await cache.check("Missing", ask)
+        assert asked == ["A", "Missing"]
+
+        assert not cache.call_failed("A", ValueError("timeout"))
+        assert await cache.check("A", ask) and asked == ["A", "Missing"]
+        assert cache.call_failed("A", ValueError('Component "A" is not registered'))
+        assert await cache.check("A", ask) and asked == ["A", "Missing", "A"]
+        return cache
+
+    cache = asyncio.run(scenario())
+    assert cache.stats["checks"] == 3 and cache.stats["invalidated"] == 1
@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+import yaml
+
+from at_controller.core.fsm import StateMachine
+from at_controller.core.render import RenderCache
+from at_controller.core.render import RenderScheduler
+from at_controller.diagram.models.diagram import DiagramModel
+
+
+@pytest.fixture
+def diagram():
+    return DiagramModel(**yaml.safe_load(open("./tests/fixtures/scenario.yaml"))).to_internal()
+
+
+def test_self_loop_render_is_skipped(diagram):
+    cache = RenderCache()
+    machine = StateMachine(None, "token", diagram)
+    machine.attributes["selected_kb"] = 7
+    state = diagram.get_state("building_types")
+
+    page = state.get_page(machine)
+    assert not cache.is_unchanged("user", page)
+    cache.mark_sent("user", page)
+
+    assert cache.is_unchanged("user", state.get_page(machine))
+    assert not cache.is_unchanged("other", state.get_page(machine))
+
+    machine.attributes["selected_kb"] = 8
+    assert not cache.is_unchanged("user", state.get_page(machine))
+    assert cache.stats == {"sessions": 1, "sent": 1, "skipped": 1}
+
+
+def test_forget(diagram):
+    cache = RenderCache()
+    page = diagram.get_state("building_types").get_page(StateMachine(None, "token", diagram))
+    cache.mark_sent("user", page)
+    cache.forget("user")
+    assert not cache.is_unchanged("user", page)
+    assert cache.stats["sessions"] == 0
+
+
+def test_scheduler_renders_latest_state_once():
+    rendered = []
+    state = {"version": 0}
+
+    async def render(session, token):
+        await asyncio.sleep(0.001)
+        rendered.append((session, token, state["version"]))
+
+    async def scenario():
+        scheduler = RenderScheduler(render, window=0.005)
+        for version in range(1, 6):
+            state["version"] = version
+            scheduler.schedule("user", "token")
+            await asyncio.sleep(0.001)
+        scheduler.schedule("other", "other-token")
+        await scheduler.flush()
+        return scheduler
+
+    scheduler = asyncio.run(scenario())
+    assert sorted(rendered) == [("other", "other-token", 5), ("user", "token", 5)]
+    assert scheduler.stats == {"pending": 0, "scheduled": 6, "superseded": 4, "rendered": 2, "failed": 0}
+
+
+def test_scheduler_cancels_in_flight_render():
+    started, finished = [], []
+
+    async def render(session, version):
+        started.append(version)
+        await asyncio.sleep(0.01)
+        finished.append(version)
+
+    async def scenario():
+        scheduler = RenderScheduler(render, window=0)
+        scheduler.schedule("user", 1)
+        await asyncio.sleep(0.002)
+        scheduler.schedule("user", 2)
+        assert not scheduler.cancel("other")
+        await scheduler.flush()
+
+    asyncio.run(scenario())
+    assert started == [1, 2] and finished == [2]
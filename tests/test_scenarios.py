@@ -0,0 +1,40 @@
+import pytest
+import yaml
+
+from at_controller.core.scenarios import ScenarioCache
+
+
+@pytest.fixture
+def scenario():
+    with open("./tests/fixtures/scenario.yaml") as f:
+        return f.read()
+
+
+def test_shared_diagram(scenario):
+    cache = ScenarioCache()
+    key, diagram, compiled = cache.acquire(scenario)
+    same_key, same_diagram, compiled_again = cache.acquire(yaml.safe_load(scenario))
+    assert key == same_key
+    assert diagram is same_diagram
+    assert compiled and not compiled_again
+    assert cache.stats == {"scenarios": 1, "references": 2, "hits": 1, "misses": 1}
+
+
+def test_eviction(scenario):
+    cache = ScenarioCache()
+    key, _, _ = cache.acquire(scenario)
+    cache.acquire(scenario)
+    cache.release(key)
+    assert cache.get(key) is not None
+    cache.release(key)
+    assert cache.get(key) is None
+    assert cache.acquire(scenario)[2]
+    assert cache.misses == 2
+
+
+def test_failed_compilation_leaves_no_raw_key():
+    cache = ScenarioCache()
+    with pytest.raises(Exception):
+        cache.acquire("states: {}\ntransitions: 1\n")
+    assert cache._raw_keys == {}
+    assert cache.entries == {}
@@ -0,0 +1,108 @@
+import asyncio
+import os
+import shutil
+
+import yaml
+
+from at_controller.core.scenarios import ScenarioCache
+from at_controller.core.sessions import FileSessionStore
+from at_controller.core.sessions import SESSIONS_PREFIX
+from at_controller.core.sessions import SessionLRU
+from at_controller.core.sessions import SessionSnapshot
+from at_controller.core.sessions import SqliteSessionStore
+from at_controller.core.snapshots import SnapshotWriter
+
+
+def test_file_store(tmp_path):
+    store = FileSessionStore(str(tmp_path))
+    snapshot = SessionSnapshot(
+        session=1, auth_token="token", state="building_types", attributes={"selected_kb": 7}, scenario_key="key"
+    )
+    store.save(snapshot)
+
+    assert store.load(1) == snapshot
+    assert store.load("1") is None
+    assert store.scenario_keys() == {1: "key"}
+
+    store.delete(1)
+    assert store.load(1) is None
+
+    assert not store.has_scenario("key")
+    store.save_scenario("key", {"states": {}})
+    assert store.has_scenario("key") and store.load_scenario("key") == {"states": {}}
+
+
+def test_lru_order():
+    lru = SessionLRU()
+    for session in ["a", "b", "c"]:
+        lru.touch(session)
+    lru.touch("a")
+    lru.discard("b")
+    assert list(lru) == ["c", "a"]
+
+
+def test_acquire_key():
+    data = yaml.safe_load(open("./tests/fixtures/scenario.yaml"))
+    cache = ScenarioCache()
+    key, diagram, _ = cache.acquire(data)
+    assert cache.acquire_key(key) is diagram
+    assert cache.entries[key].references == 2
+
+    cache.release(key)
+    cache.release(key)
+    assert cache.acquire_key(key) is None
+
+
+def test_sqlite_store(tmp_path):
+    store = SqliteSessionStore(str(tmp_path / "sessions.sqlite"))
+    newer = SessionSnapshot(session=1, auth_token="t", state="b", attributes={}, scenario_key="k", saved_at=2.0)
+    older = SessionSnapshot(session=1, auth_token="t", state="a", attributes={}, scenario_key="k", saved_at=1.0)
+    store.save_many([newer])
+    store.save(older)
+    assert store.load(1) == newer and store.load("1") is None and store.count() == 1
+    assert store.scenario_keys() == {1: "k"}
+
+    store.save_scenario("k", "states: {}")
+    assert store.has_scenario("k") and store.load_scenario("k") == "states: {}"
+    store.close()
+
+    reopened = SqliteSessionStore(str(tmp_path / "sessions.sqlite"))
+    assert reopened.load(1) == newer
+    reopened.delete(1)
+    assert reopened.load(1) is None
+
+
+def test_snapshot_writer(tmp_path):
+    store = SqliteSessionStore(str(tmp_path / "sessions.sqlite"))
+    states = {"idle": "a", "busy": "b"}
+
+    def snapshot(session):
+        return SessionSnapshot(session=session, auth_token="t", state=states[session], attributes={}, scenario_key="k")
+
+    async def scenario():
+        writer = SnapshotWriter(store, snapshot, lambda session: session != "busy", interval=60)
+        writer.mark("idle")
+        writer.mark("busy")
+        assert await writer.flush() == 1
+        assert list(writer.dirty) == ["busy"]
+        await writer.close()
+        return writer
+
+    writer = asyncio.run(scenario())
+    assert store.load("idle").state == "a" and store.load("busy").state == "b"
+    assert writer.stats["written"] == 2 and writer.stats["dirty"] == 0
+
+
+def test_file_store_is_private():
+    store = FileSessionStore.private()
+    try:
+        assert os.path.basename(store.path).startswith(SESSIONS_PREFIX)
+        for directory in (store.path, os.path.join(store.path, "sessions")):
+            assert os.stat(directory).st_mode & 0o777 == 0o700
+        snapshot = SessionSnapshot(session=1, auth_token="t", state="a", attributes={}, scenario_key="k")
+        store.save(snapshot)
+        store.save(snapshot)
+        # every write renamed its own temporary file into place
+        assert len(os.listdir(os.path.join(store.path, "sessions"))) == 1
+    finally:
+        shutil.rmtree(store.path)
@@ -0,0 +1,41 @@
+import subprocess
+import sys
+from collections import Counter
+
+from at_controller.core.sharding import partition
+from at_controller.core.sharding import shard_of
+from at_controller.core.sharding import shard_path
+from at_controller.core.sharding import worker_name
+
+
+def test_shards_are_stable_across_processes():
+    sessions = [1, "1", "token-abc", 42]
+    here = [shard_of(session, 4) for session in sessions]
+    code = f"from at_controller.core.sharding import shard_of; print([shard_of(s, 4) for s in {sessions!r}])"
+    # str hashes are salted per process, shard_of must not depend on them
+    there = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert there.strip() == repr(here)
+
+
+def test_shards_are_balanced():
+    counts = Counter(shard_of(user, 8) for user in range(8000))
+    assert set(counts) == set(range(8))
+    assert min(counts.values()) > 800
+    assert all(shard_of(user, 1) == 0 for user in range(100))
+
+
+def test_partition_keeps_order():
+    users = list(range(50))
+    shards = partition(users, 3)
+    assert sorted(user for users in shards.values() for user in users) == users
+    for index, members in shards.items():
+        assert members == sorted(members)
+        assert all(shard_of(user, 3) == index for user in members)
+
+
+def test_names_and_paths():
+    assert worker_name(2) == "ATController_2"
+    assert shard_path("/data/sessions.sqlite", 2, 4) == "/data/sessions.2.sqlite"
+    assert shard_path("/data/sessions", 0, 4) == "/data/sessions.0"
+    assert shard_path("/data/sessions.sqlite", 0, 1) == "/data/sessions.sqlite"
+    assert shard_path(None, 1, 4) is None
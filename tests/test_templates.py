@@ -0,0 +1,56 @@
+from urllib.parse import quote_plus
+
+import pytest
+
+from at_controller.core.fsm import SafeDict
+from at_controller.diagram.state.states import Frame
+from at_controller.diagram.state.templates import Template
+from tests.test_compiler import state_machine
+
+
+def values(**kwargs):
+    result = SafeDict()
+    result.update(kwargs)
+    return result
+
+
+@pytest.mark.parametrize(
+    "template", ["plain", "{a}/{b}", "{{a}}{a}", "{a!r}", "{a:>4}", "{a[0]}", "{0}", "{}", "broken {", ""]
+)
+@pytest.mark.parametrize("attributes", [{}, {"a": "x y"}, {"a": [1], "b": 2}])
+def test_template_matches_str_format(template, attributes):
+    def outcome(evaluate):
+        try:
+            return evaluate()
+        except Exception as e:
+            return type(e)
+
+    compiled = Template(template)
+    assert outcome(lambda: compiled.format(values(**attributes))) == outcome(
+        lambda: template.format(**values(**attributes))
+    )
+    assert outcome(lambda: compiled.format_map(values(**attributes))) == outcome(
+        lambda: template.format_map(values(**attributes))
+    )
+
+
+def test_template_attributes():
+    assert Template("{a}/{b}/{a}").attributes == {"a", "b"}
+    assert Template("{{a}}").is_constant
+    assert Template("{a.b}").attributes is None
+    assert Template("/docs/{name} x", escape=quote_plus).format(values(name="a/b")) == quote_plus("/docs/a/b x")
+
+
+def test_constant_frame_column_is_cached():
+    frame = Frame(frame_id="editor", src="http://host/path?a=1", redirect="/kb", type="format_attributes")
+    assert frame.attribute_names == frozenset()
+    column = frame.get_column(state_machine({}))
+    assert column is frame.get_column(state_machine({"a": 2}))
+    assert column["src"] == "http://host/path?a=1&to=%2Fkb&frame_id=editor"
+
+
+def test_redirect_frame():
+    frame = Frame(frame_id="editor", src="http://host/path?to=x#top", redirect="/kb/{kb}", type="format_attributes")
+    assert frame.attribute_names == {"kb"}
+    assert frame.get_column(state_machine({"kb": 3}))["src"] == "http://host/path?to=%2Fkb%2F3&frame_id=editor#top"
+    assert frame.get_column(state_machine({}))["src"] == "http://host/path?to=%2Fkb%2F%7Bkb%7D&frame_id=editor#top"
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+
+from at_controller.core.tokens import OperatorTokensMixin
+from at_controller.core.tokens import TokenCacheMixin
+from at_controller.core.tokens import UNRESOLVED_TOKEN_TTL
+
+
+class AuthComponent:
+    """Stands in for ATComponent: tokens ``user-<i>`` resolve to ``i``, others to themselves."""
+
+    def __init__(self):
+        self.asked = []
+
+    async def get_user_id_or_token(self, auth_token: str, *args, **kwargs):
+        self.asked.append(auth_token)
+        prefix, _, user_id = auth_token.partition("-")
+        return int(user_id) if prefix == "user" else auth_token
+
+
+class CachedComponent(TokenCacheMixin, AuthComponent):
+    def __init__(self, clock):
+        super().__init__()
+        self.token_cache = self.token_cache_for(size=10, ttl=60)
+        self.token_cache.clock = clock
+
+
+def test_tokens_are_resolved_once_per_ttl():
+    now = [0.0]
+    component = CachedComponent(lambda: now[0])
+
+    async def resolve(*tokens):
+        return [await component.get_user_id_or_token(token, raize_on_failed=False) for token in tokens]
+
+    assert asyncio.run(resolve("user-1", "user-1", "guest", "guest")) == [1, 1, "guest", "guest"]
+    assert component.asked == ["user-1", "guest"]
+
+    now[0] += UNRESOLVED_TOKEN_TTL
+    asyncio.run(resolve("user-1", "guest"))
+    assert component.asked == ["user-1", "guest", "guest"]
+
+
+def test_tokens_are_invalidated_by_token_or_user():
+    component = CachedComponent(lambda: 0.0)
+
+    async def resolve(*tokens):
+        for token in tokens:
+            await component.get_user_id_or_token(token)
+
+    asyncio.run(resolve("user-1", "user-01", "user-2", "guest"))
+    assert component.invalidate_auth_token("guest") == 1
+    assert component.invalidate_auth_token(user_id=1) == 2
+    assert component.invalidate_auth_token("missing") == 0
+    assert component.invalidate_auth_token() == 1
+    assert len(component.token_cache) == 0
+
+
+def test_operator_methods_need_an_operator_token():
+    component = OperatorTokensMixin()
+    with pytest.raises(PermissionError):
+        component.check_operator("operator")
+
+    component.set_operator_tokens(["operator"])
+    component.check_operator("operator")
+    for token in ("user-1", None):
+        with pytest.raises(PermissionError):
+            component.check_operator(token)
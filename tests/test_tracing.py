@@ -0,0 +1,89 @@
+import asyncio
+import json
+
+import pytest
+
+from at_controller.core.mailbox import Mailboxes
+from at_controller.core.tracing import bind
+from at_controller.core.tracing import NO_SPAN
+from at_controller.core.tracing import span
+from at_controller.core.tracing import Tracer
+from at_controller.core.tracing import TraceWriter
+from at_controller.diagram.state.actions import SetAttributeAction
+
+
+class Machine:
+    def __init__(self):
+        self.attributes = {}
+
+
+def read_spans(path):
+    return [json.loads(line) for line in path.read_text().splitlines()]
+
+
+def test_only_traced_users_and_samples_are_traced(tmp_path):
+    tracer = Tracer()
+    assert tracer.trace("handle_event", 1) is NO_SPAN
+    with pytest.raises(ValueError):
+        tracer.enable([1])
+
+    tracer.configure(TraceWriter(str(tmp_path / "traces.jsonl")))
+    tracer.enable([1])
+    assert tracer.trace("handle_event", 2) is NO_SPAN
+    assert tracer.trace("handle_event", 1) is not NO_SPAN
+
+    tracer.configure(tracer.writer, sample_rate=1.0)
+    assert tracer.trace("handle_event", 2) is not NO_SPAN
+    tracer.disable()
+    assert tracer.stats["users"] == []
+    assert span("action") is NO_SPAN
+
+
+def test_spans_nest_across_gather_and_mailboxes(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(TraceWriter(str(path)))
+    tracer.enable(["user"])
+    mailboxes = Mailboxes()
+    action = SetAttributeAction(attribute="a", value=1, next=[SetAttributeAction(attribute="b", value=2)])
+
+    async def job():
+        await asyncio.gather(action.perform(Machine(), {}), action.perform(Machine(), {}))
+        with span("exec_external_method", component="ATRenderer"):
+            raise RuntimeError("gone")
+
+    async def scenario():
+        with pytest.raises(RuntimeError):
+            with tracer.trace("trigger_transition", "user", trigger="next"):
+                await mailboxes.run("user", bind(job))
+
+    asyncio.run(scenario())
+    spans = read_spans(path)
+    by_id = {span["span_id"]: span for span in spans}
+    root = spans[0]
+    assert root["name"] == "trigger_transition" and root["parent_id"] is None
+    assert root["attributes"] == {"trigger": "next"} and root["error"] == "RuntimeError: gone"
+    assert {span["trace_id"] for span in spans} == {root["trace_id"]}
+    assert {span["user"] for span in spans} == {"user"}
+
+    actions = [span for span in spans if span["name"] == "action"]
+    assert len(actions) == 4
+    # two top level actions, each the parent of its next action
+    top = [span for span in actions if span["parent_id"] == root["span_id"]]
+    assert len(top) == 2
+    assert all(by_id[span["parent_id"]]["name"] == "action" for span in actions if span not in top)
+    assert sum(span["name"] == "evaluate" for span in spans) == 4
+    assert tracer.stats["traces"] == 1
+
+
+def test_trace_file_rotates(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    tracer = Tracer(TraceWriter(str(path), max_bytes=600, backups=2), sample_rate=1.0)
+    for index in range(10):
+        with tracer.trace("handle_event", index):
+            with span("action"):
+                pass
+
+    rotated = sorted(file.name for file in tmp_path.iterdir())
+    assert rotated == ["traces.jsonl", "traces.jsonl.1", "traces.jsonl.2"]
+    assert all(len(file.read_bytes()) <= 600 for file in tmp_path.iterdir())
+    assert read_spans(path)[-2]["user"] == 9